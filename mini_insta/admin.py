@@ -2,11 +2,41 @@ from django.contrib import admin
 
 # Register your models here.
 from .models import Profile, Post, Photo, Follower, Comment, Like
+from . import reaper
 
 
-admin.site.register(Profile)
-admin.site.register(Post)
+# deleting posts and profiles from the admin hides them at once and leaves the
+# cascade to the reaper, like the delete views do
+class SoftDeleteAdmin(admin.ModelAdmin):
+    '''ModelAdmin whose deletes go through reaper.py'''
+
+    # the reaper function that deletes one object
+    soft_delete = None
+
+    def delete_model(self, request, obj):
+        self.soft_delete(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.soft_delete(obj)
+
+    # collecting every related row for the confirmation page is what we're avoiding
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        return [str(obj) for obj in objs], {self.model._meta.verbose_name_plural: len(objs)}, set(), []
+
+
+class PostAdmin(SoftDeleteAdmin):
+    soft_delete = staticmethod(reaper.delete_post)
+
+
+class ProfileAdmin(SoftDeleteAdmin):
+    soft_delete = staticmethod(reaper.delete_profile)
+
+
+admin.site.register(Profile, ProfileAdmin)
+admin.site.register(Post, PostAdmin)
 admin.site.register(Photo)
 admin.site.register(Follower)
 admin.site.register(Comment)
-admin.site.register(Like)
\ No newline at end of file
+admin.site.register(Like)
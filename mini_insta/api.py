@@ -0,0 +1,317 @@
+# File: api.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/22/2025
+# Description: read-only JSON API for the mini_insta app
+
+from django.core.exceptions import BadRequest, PermissionDenied
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views import View
+
+from . import fragments, graph, likebuffer, timeline
+from .models import Post, Profile
+from .viewer import get_viewer
+
+
+# every representation is built from fields that are already loaded (columns,
+# select_related rows, prefetched lists and annotations), never from model methods
+# that query. clients ask for just the fields they need with ?fields=a,b,c, and
+# a post whose comments or photos aren't asked for doesn't prefetch them.
+
+# most ids one batch request can ask for
+MAX_BATCH = 100
+
+
+# the few profile fields shown wherever a profile is mentioned
+def profile_summary(profile):
+    '''Return the compact representation of a Profile'''
+    return {
+        'id': profile.pk,
+        'username': profile.username,
+        'display_name': profile.display_name,
+        'profile_image_url': profile.profile_image_url,
+    }
+
+
+def photo_representation(photo):
+    '''Return the representation of a Photo, with the URL of every generated variant'''
+    return {
+        'id': photo.pk,
+        'url': photo.get_image_url(),
+        'width': photo.width,
+        'height': photo.height,
+        'variants': {size: photo.get_image_url(size) for size in photo.variants},
+    }
+
+
+def comment_representation(comment):
+    '''Return the representation of a Comment (its profile must be select_related)'''
+    return {
+        'id': comment.pk,
+        'profile': profile_summary(comment.profile),
+        'text': comment.text,
+        'timestamp': comment.timestamp,
+    }
+
+
+# field name -> how to read it off a Post loaded with Post.objects.for_feed()
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'profile': lambda post: profile_summary(post.profile),
+    'caption': lambda post: post.caption,
+    'timestamp': lambda post: post.timestamp,
+    'like_count': lambda post: post.like_count,
+    'comment_count': lambda post: post.comment_count,
+    'latest_liker': lambda post: post.latest_liker,
+    'photos': lambda post: [photo_representation(photo) for photo in post.feed_photos],
+    'comments': lambda post: [comment_representation(comment) for comment in post.feed_comments],
+}
+
+# fields that depend on who is asking, so they're never cached
+POST_VIEWER_FIELDS = {
+    'liked_by_viewer': lambda post, viewer: post.liked_by_viewer,
+}
+
+PROFILE_FIELDS = {
+    'id': lambda profile: profile.pk,
+    'username': lambda profile: profile.username,
+    'display_name': lambda profile: profile.display_name,
+    'profile_image_url': lambda profile: profile.profile_image_url,
+    'bio_text': lambda profile: profile.bio_text,
+    'join_date': lambda profile: profile.join_date,
+    'follower_count': lambda profile: profile.follower_count,
+    'following_count': lambda profile: profile.following_count,
+}
+
+PROFILE_VIEWER_FIELDS = {
+    'is_following': lambda profile, viewer: viewer.is_following(profile),
+}
+
+# the same for profiles from get_followers()/get_following(), which come with them annotated
+LISTED_PROFILE_FIELDS = {
+    'is_following': lambda profile, viewer: profile.viewer_follows,
+    'mutual': lambda profile, viewer: profile.mutual,
+}
+
+
+# the post representation is the same for everyone, so it's kept in the fragment cache
+def post_representation(post, fields, viewer):
+    '''Return the representation of post with just fields'''
+    shared = [name for name in fields if name in POST_FIELDS]
+    key = fragments.fragment_key(post, 'api:' + ','.join(shared))
+
+    backend = fragments.get_backend()
+    cached = backend.get(key)
+    if cached is None:
+        cached = {name: POST_FIELDS[name](post) for name in shared}
+        backend.set(key, cached)
+
+    # a copy, so adding the viewer's fields doesn't change the cached one
+    representation = dict(cached)
+    for name in fields:
+        if name in POST_VIEWER_FIELDS:
+            representation[name] = POST_VIEWER_FIELDS[name](post, viewer)
+    return representation
+
+
+def profile_representation(profile, fields, viewer, viewer_fields=PROFILE_VIEWER_FIELDS):
+    '''Return the representation of profile with just fields'''
+    representation = {}
+    for name in fields:
+        if name in PROFILE_FIELDS:
+            representation[name] = PROFILE_FIELDS[name](profile)
+        else:
+            representation[name] = viewer_fields[name](profile, viewer)
+    return representation
+
+
+# base class for the API views
+class ApiView(View):
+    '''A read-only JSON view. Errors come back as {"error": message} with the right status.'''
+
+    # every field this endpoint can return, all of them by default
+    available_fields = ()
+
+    # guests get a 401 instead of being redirected to the login page
+    login_required = False
+
+    # only GET (and HEAD) are allowed
+    http_method_names = ['get', 'head', 'options']
+
+    def dispatch(self, request, *args, **kwargs):
+        '''Run the view, turning exceptions into JSON error responses'''
+        if self.login_required and not request.user.is_authenticated:
+            return JsonResponse({'error': "Authentication required."}, status=401)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except BadRequest as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        except PermissionDenied:
+            return JsonResponse({'error': "Permission denied."}, status=403)
+        except Http404 as error:
+            return JsonResponse({'error': str(error) or "Not found."}, status=404)
+
+    # parse ?fields=a,b,c
+    def get_fields(self):
+        '''Return the list of fields the client asked for, raising BadRequest for unknown ones'''
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return list(self.available_fields)
+
+        fields = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in self.available_fields]
+        if unknown:
+            raise BadRequest(
+                f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(self.available_fields)}."
+            )
+        return fields
+
+
+# base class for the endpoints that return posts
+class PostApiView(ApiView):
+    '''An API view whose results are Posts'''
+
+    available_fields = tuple(POST_FIELDS) + tuple(POST_VIEWER_FIELDS)
+
+    def get_posts_queryset(self, fields):
+        '''Return Posts with what fields need loaded in bulk, and nothing else'''
+        return Post.objects.for_feed(
+            get_viewer(self.request).profile,
+            photos='photos' in fields,
+            comments='comments' in fields,
+        )
+
+    def represent(self, posts, fields):
+        '''Return the representations of a list of posts'''
+        viewer = get_viewer(self.request)
+        likebuffer.overlay(posts, viewer.profile)
+        return [post_representation(post, fields, viewer) for post in posts]
+
+
+# ApiFeedView - one page of the logged-in profile's feed
+class ApiFeedView(PostApiView):
+    '''GET api/feed?cursor=...&fields=...'''
+
+    login_required = True
+    query_budget = 8
+    per_page = 20
+
+    def get(self, request):
+        fields = self.get_fields()
+        profile = get_viewer(request).require_profile()
+        posts, next_cursor = timeline.get_feed_page(
+            profile, cursor=request.GET.get('cursor'), per_page=self.per_page,
+        )
+        return JsonResponse({'posts': self.represent(posts, fields), 'next_cursor': next_cursor})
+
+
+# ApiPostView - one post
+class ApiPostView(PostApiView):
+    '''GET api/posts/<pk>?fields=...'''
+
+    query_budget = 6
+
+    def get(self, request, pk):
+        fields = self.get_fields()
+        post = get_object_or_404(self.get_posts_queryset(fields), pk=pk)
+        return JsonResponse(self.represent([post], fields)[0])
+
+
+# ApiPostBatchView - many posts in one request, in a constant number of queries
+class ApiPostBatchView(PostApiView):
+    '''GET api/posts?ids=1,2,3&fields=...'''
+
+    query_budget = 6
+
+    def get(self, request):
+        fields = self.get_fields()
+        try:
+            ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()]
+        except ValueError:
+            raise BadRequest("ids must be a comma-separated list of integers.")
+        if len(ids) > MAX_BATCH:
+            raise BadRequest(f"At most {MAX_BATCH} ids per request.")
+
+        posts_by_id = self.get_posts_queryset(fields).in_bulk(ids)
+
+        # in the order they were asked for, with the ones that don't exist listed separately
+        posts = [posts_by_id[pk] for pk in ids if pk in posts_by_id]
+        missing = [pk for pk in ids if pk not in posts_by_id]
+        return JsonResponse({'posts': self.represent(posts, fields), 'missing': missing})
+
+
+# ApiProfileView - one profile
+class ApiProfileView(ApiView):
+    '''GET api/profiles/<pk>?fields=...'''
+
+    available_fields = tuple(PROFILE_FIELDS) + tuple(PROFILE_VIEWER_FIELDS)
+    query_budget = 5
+
+    def get(self, request, pk):
+        fields = self.get_fields()
+        profile = get_object_or_404(Profile, pk=pk)
+        return JsonResponse(profile_representation(profile, fields, get_viewer(request)))
+
+
+# ApiFollowersView - a page of the profiles following a profile
+class ApiFollowersView(ApiView):
+    '''GET api/profiles/<pk>/followers?cursor=...&fields=...'''
+
+    available_fields = tuple(PROFILE_FIELDS) + tuple(LISTED_PROFILE_FIELDS)
+    query_budget = 6
+    per_page = 50
+
+    # the Profile method that returns one page of the list
+    page_method = 'get_followers_page'
+
+    def get(self, request, pk):
+        fields = self.get_fields()
+        profile = get_object_or_404(Profile, pk=pk)
+        viewer = get_viewer(request)
+
+        # the follow state and mutual flags come annotated on the page's one query
+        profiles, next_cursor = getattr(profile, self.page_method)(
+            viewer.profile, request.GET.get('cursor'), self.per_page,
+        )
+        return JsonResponse({
+            'profiles': [
+                profile_representation(listed, fields, viewer, LISTED_PROFILE_FIELDS) for listed in profiles
+            ],
+            'next_cursor': next_cursor,
+        })
+
+
+# ApiFollowingView - a page of the profiles a profile follows
+class ApiFollowingView(ApiFollowersView):
+    '''GET api/profiles/<pk>/following?cursor=...&fields=...'''
+
+    page_method = 'get_following_page'
+
+
+# ApiSuggestionsView - profiles the logged-in profile might want to follow
+class ApiSuggestionsView(ApiView):
+    '''GET api/suggestions?limit=...'''
+
+    login_required = True
+    query_budget = 6  # two of them load the graph, the first time this process needs it
+    max_limit = 50
+
+    def get(self, request):
+        if not graph.graph_enabled():
+            raise Http404("Suggestions need MINI_INSTA_FOLLOW_GRAPH turned on.")
+        profile = get_viewer(request).require_profile()
+        try:
+            limit = int(request.GET.get('limit', 10))
+        except ValueError:
+            raise BadRequest("limit must be an integer.")
+        # a negative limit would slice from the end, and return nearly every suggestion
+        if limit < 1:
+            raise BadRequest("limit must be at least 1.")
+        limit = min(limit, self.max_limit)
+
+        # friends of friends come from the in-memory graph, then one query loads them
+        suggested = graph.get_graph().suggestions(profile.pk, limit)
+        profiles = Profile.objects.in_bulk([pk for pk, count in suggested])
+        return JsonResponse({'profiles': [
+            dict(profile_summary(profiles[pk]), followed_by_your_follows=count)
+            for pk, count in suggested if pk in profiles
+        ]})
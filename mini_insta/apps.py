@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class MiniInstaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mini_insta'
+
+    def ready(self):
+        # keep the search index in step with saves and deletes
+        from . import search
+        search.connect_signals()
+
+        # and the cached profile directory pages
+        from . import directory
+        directory.connect_signals()
@@ -0,0 +1,174 @@
+# File: benchmark.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/21/2025
+# Description: replays scripted user sessions against the mini_insta views and reports latency percentiles
+
+import math
+import random
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import perf_counter
+
+from django.db import connections
+from django.test import Client
+from django.urls import resolve, reverse
+
+from .models import Post, Profile
+
+
+# a session is what one person does in a sitting: log in, read the feed, open a
+# post, react to it, look someone up. every session is scripted from its own
+# random.Random, so a run with the same seed makes the same requests (though with
+# several workers they interleave differently). sessions really like, comment and
+# follow, so run this against a scratch database, e.g. one from seed_mini_insta.
+
+# the password seed_mini_insta gives every user
+PASSWORD = 'password'
+
+
+# one step of a session
+class Step:
+    '''A request a session makes'''
+
+    def __init__(self, method, url, data=None):
+        self.method = method
+        self.url = url
+        self.data = data
+
+
+# the script for one session
+def session_steps(rng, username, profile_pks, post_pks):
+    '''Return the list of Steps one session makes'''
+    post_pk = rng.choice(post_pks)
+    other_pk = rng.choice(profile_pks)
+    return [
+        Step('post', reverse('login'), {'username': username, 'password': PASSWORD}),
+        Step('get', reverse('show_feed')),
+        Step('get', reverse('show_feed_page')),
+        Step('get', reverse('show_post', kwargs={'pk': post_pk})),
+        Step('post', reverse('like', kwargs={'pk': post_pk}), {}),
+        Step('post', reverse('create_comment', kwargs={'pk': post_pk}), {'text': 'benchmark comment'}),
+        Step('get', reverse('show_profile', kwargs={'pk': other_pk})),
+        Step('post', reverse('follow', kwargs={'pk': other_pk}), {}),
+        Step('get', reverse('search'), {'query': rng.choice(['emo', 'sad', 'rain', 'moon', 'guitar'])}),
+        Step('get', reverse('show_followers', kwargs={'pk': other_pk})),
+    ]
+
+
+# nearest-rank percentile of already sorted samples
+def percentile(samples, fraction):
+    '''Return the fraction (0-1) percentile of a sorted list'''
+    if not samples:
+        return 0
+    rank = max(math.ceil(fraction * len(samples)), 1)
+    return samples[rank - 1]
+
+
+class Results:
+    '''Latencies and errors per url name, collected from every worker'''
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, url_name, milliseconds, status_code):
+        with self.lock:
+            self.latencies[url_name].append(milliseconds)
+            if status_code >= 400:
+                self.errors[url_name] += 1
+
+    def as_dict(self, seconds):
+        '''Return a JSON-friendly report for a run that took seconds'''
+        endpoints = {}
+        for url_name, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            endpoints[url_name] = {
+                'requests': len(latencies),
+                'errors': self.errors[url_name],
+                'throughput': round(len(latencies) / seconds, 2),
+                'mean_ms': round(sum(latencies) / len(latencies), 3),
+                'p50_ms': round(percentile(latencies, 0.50), 3),
+                'p95_ms': round(percentile(latencies, 0.95), 3),
+                'p99_ms': round(percentile(latencies, 0.99), 3),
+                'max_ms': round(latencies[-1], 3),
+            }
+
+        requests = sum(endpoint['requests'] for endpoint in endpoints.values())
+        return {
+            'requests': requests,
+            'errors': sum(self.errors.values()),
+            'seconds': round(seconds, 3),
+            'throughput': round(requests / seconds, 2) if seconds else 0,
+            'endpoints': endpoints,
+        }
+
+
+# what each worker thread runs
+def run_session(steps, results, host):
+    '''Make every request in steps with a fresh client, recording each one's latency'''
+    # a view that raises counts as a 500, it doesn't stop the run
+    client = Client(raise_request_exception=False, HTTP_HOST=host)
+    try:
+        for step in steps:
+            url_name = resolve(step.url).url_name
+            start = perf_counter()
+            response = getattr(client, step.method)(step.url, step.data)
+            results.record(url_name, (perf_counter() - start) * 1000, response.status_code)
+    finally:
+        # worker threads open their own connections, don't leak them
+        connections.close_all()
+
+
+def run(sessions=100, workers=4, seed=0, prefix='seed', host='testserver', label=''):
+    '''Replay sessions scripted sessions on workers threads and return the report'''
+    rng = random.Random(seed)
+
+    # sessions log in as seeded users and visit a sample of the posts and profiles
+    usernames = list(
+        Profile.objects.filter(username__startswith=prefix).order_by('pk').values_list('username', flat=True)[:10000]
+    )
+    profile_pks = list(Profile.objects.order_by('pk').values_list('pk', flat=True)[:10000])
+    post_pks = list(Post.objects.order_by('-pk').values_list('pk', flat=True)[:10000])
+    if not usernames or not post_pks:
+        raise ValueError(f"no {prefix}* users or no posts to benchmark, run seed_mini_insta first")
+
+    scripts = [
+        session_steps(rng, rng.choice(usernames), profile_pks, post_pks) for _ in range(sessions)
+    ]
+
+    results = Results()
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mini_insta_benchmark') as executor:
+        for future in [executor.submit(run_session, steps, results, host) for steps in scripts]:
+            future.result()
+    seconds = perf_counter() - start
+
+    report = results.as_dict(seconds)
+    report['run'] = {
+        'label': label,
+        'started': datetime.now(timezone.utc).isoformat(),
+        'sessions': sessions,
+        'workers': workers,
+        'seed': seed,
+        'profiles': Profile.objects.count(),
+        'posts': Post.objects.count(),
+    }
+    return report
+
+
+# for comparing a run against an earlier one, e.g. from the previous commit
+def compare(baseline, report, threshold=0.10):
+    '''Return a list of (url name, statistic, before, after, change) for every
+    p50/p95/p99 that got more than threshold (a fraction) slower'''
+    regressions = []
+    for url_name, after in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(url_name)
+        if before is None:
+            continue
+        for statistic in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if before[statistic] and after[statistic] > before[statistic] * (1 + threshold):
+                change = after[statistic] / before[statistic] - 1
+                regressions.append((url_name, statistic, before[statistic], after[statistic], change))
+    return regressions
@@ -0,0 +1,143 @@
+# File: conditional.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/23/2025
+# Description: conditional GET (ETag/Last-Modified) support for the mini_insta pages
+
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, Exists, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+
+from . import directory, likebuffer
+from .models import Follower, Post, Profile
+
+
+# each page's validators come from one small query over the columns that change
+# whenever the page would: versions, auto_now timestamps and counts. the ETag also
+# covers who is looking (pages show per-user buttons) and their CSRF cookie (pages
+# embed the token), so one user's cached copy never answers for another.
+#
+# only the post page sends Last-Modified: its modified column only moves forward,
+# but on the other pages a delete can move the newest timestamp backwards, so
+# they rely on the ETag alone.
+
+
+# a Subquery aggregating the rows of queryset that point at the outer row through fk
+def _aggregate_of(queryset, fk, expression):
+    '''Return a Subquery expression for expression over queryset rows whose fk is the outer row'''
+    aggregated = (
+        queryset.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(value=expression)
+        .values('value')
+    )
+    return Subquery(aggregated)
+
+
+def post_validators(pk):
+    '''Return (ETag parts, last modified) for the post page, or None if there's no such post'''
+    row = Post.objects.filter(pk=pk).values_list(
+        'version', 'timestamp', 'modified', 'profile__join_date',
+    ).first()
+    if row is None:
+        return None
+
+    # every change to what the page shows bumps version, which also sets modified,
+    # except likes still in the write-behind buffer, which the liker already sees
+    version, timestamp, modified, join_date = row
+    if likebuffer.buffer_enabled():
+        row += (likebuffer.pending_for_post(int(pk)),)
+    return row, max(stamp for stamp in (timestamp, modified, join_date) if stamp is not None)
+
+
+def profile_validators(pk, user):
+    '''Return (ETag parts, None) for the profile page, or None if there's no such profile'''
+    posts = Post.objects.all()
+    row = Profile.objects.filter(pk=pk).annotate(
+        post_count=_aggregate_of(posts, 'profile', Count('pk')),
+        latest_post=_aggregate_of(posts, 'profile', Max(Coalesce('modified', 'timestamp'))),
+        viewer_follows=Exists(Follower.objects.filter(profile=OuterRef('pk'), follower_profile__user_id=user.pk)),
+    ).values_list(
+        'join_date', 'follower_count', 'following_count', 'post_count', 'latest_post', 'viewer_follows',
+    ).first()
+    return None if row is None else (row, None)
+
+
+def follow_list_validators(pk, fk, user, cursor=None):
+    '''Return (ETag parts, None) for a page of the followers (fk='profile') or
+    following (fk='follower_profile') list, or None if there's no such profile'''
+    listed = 'follower_profile' if fk == 'profile' else 'profile'
+    follows = Follower.objects.all()
+
+    # the mutual badges depend on the other direction, and the viewer's badges on their own follows
+    other = 'profile' if fk == 'follower_profile' else 'follower_profile'
+    viewer_follows = Follower.objects.filter(follower_profile__user_id=user.pk).order_by()
+
+    row = Profile.objects.filter(pk=pk).annotate(
+        follow_count=_aggregate_of(follows, fk, Count('pk')),
+        latest_follow=_aggregate_of(follows, fk, Max('timestamp')),
+        latest_edit=_aggregate_of(follows, fk, Max(f'{listed}__join_date')),
+        other_count=_aggregate_of(follows, other, Count('pk')),
+        other_latest=_aggregate_of(follows, other, Max('timestamp')),
+        viewer_count=Subquery(viewer_follows.values('follower_profile').annotate(value=Count('pk')).values('value')),
+        viewer_latest=Subquery(viewer_follows.values('follower_profile').annotate(value=Max('timestamp')).values('value')),
+    ).values_list(
+        'join_date', 'follow_count', 'latest_follow', 'latest_edit',
+        'other_count', 'other_latest', 'viewer_count', 'viewer_latest',
+    ).first()
+    return None if row is None else ((row, cursor), None)
+
+
+def directory_validators(params):
+    '''Return (ETag parts, None) for a page of the profile directory, params being its
+    (sort, cursor, letter). Comes from the cache, not the database.'''
+    return (directory.version(), params), None
+
+
+# the ETag for one page, for one viewer
+def make_etag(request, view_name, parts):
+    '''Return a quoted ETag for parts as seen by request's user'''
+    # the pages embed a token made from this secret; get_token() makes one if it's a first visit
+    get_token(request)
+    csrf_secret = request.META.get('CSRF_COOKIE', '')
+    raw = repr((view_name, parts, request.user.pk, csrf_secret))
+    return quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+class ConditionalGetMixin:
+    '''Answer If-None-Match/If-Modified-Since with a 304 before doing any of the view's work.
+
+    Views define get_validators(), returning (ETag parts, last modified datetime or None)
+    from one cheap query, or None to let the view handle a missing object itself.'''
+
+    def get_validators(self):
+        raise NotImplementedError
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+
+        validators = self.get_validators()
+        if validators is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        parts, last_modified = validators
+        etag = make_etag(request, type(self).__name__, parts)
+        last_modified_seconds = timegm(last_modified.utctimetuple()) if last_modified else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified_seconds)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response.headers.setdefault('ETag', etag)
+            if last_modified_seconds is not None:
+                response.headers.setdefault('Last-Modified', http_date(last_modified_seconds))
+
+        # browsers keep the page but check back every time, and shared caches don't keep it at all
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
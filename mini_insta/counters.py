@@ -0,0 +1,89 @@
+# File: counters.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/02/2025
+# Description: keeps the denormalized follower/following/like/comment counts in step
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follower, Like, Post, Profile
+
+
+# how many rows to repair per UPDATE in reconcile()
+BATCH_SIZE = 1000
+
+
+# change a counter column in the database without reading it first
+def adjust(instance, field, amount):
+    '''Add amount to instance.field as one UPDATE using F(), then reload the new value'''
+    type(instance).objects.filter(pk=instance.pk).update(**{field: F(field) + amount})
+    instance.refresh_from_db(fields=[field])
+
+
+# the follow/like/comment views call these after their writes, inside the same transaction
+def followed(follower_profile, profile, amount=1):
+    '''Update both sides' counts after follower_profile follows (or, with -1, unfollows) profile'''
+    adjust(profile, 'follower_count', amount)
+    adjust(follower_profile, 'following_count', amount)
+
+
+def liked(post, amount=1):
+    '''Update a Post's like count after it's liked (or, with -1, unliked)'''
+    adjust(post, 'like_count', amount)
+
+
+def commented(post, amount=1):
+    '''Update a Post's comment count after it's commented on (or, with -1, a comment is deleted)'''
+    adjust(post, 'comment_count', amount)
+
+
+# a subquery that counts the rows of model pointing at the outer row through fk
+def _count_of(model, fk):
+    '''Return a Subquery expression counting model rows whose fk is the outer row'''
+    counted = (
+        model.objects.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted), Value(0))
+
+
+# every counter column and how to compute its true value
+COUNTERS = [
+    (Profile, 'follower_count', Follower, 'profile'),
+    (Profile, 'following_count', Follower, 'follower_profile'),
+    (Post, 'like_count', Like, 'post'),
+    (Post, 'comment_count', Comment, 'post'),
+]
+
+
+# recount just some rows, after rows they count were deleted in bulk
+def recount(model, pks):
+    '''Recompute every counter column of the model rows with these pks'''
+    counted = {field: _count_of(counted_model, fk) for counter_model, field, counted_model, fk in COUNTERS
+               if counter_model is model}
+    model._base_manager.filter(pk__in=pks).update(**counted)
+
+
+# fix any counters that have drifted from the real counts
+def reconcile():
+    '''Recompute every counter column in bulk, returning {"Model.field": rows repaired}'''
+    repaired = {}
+
+    for model, field, counted_model, fk in COUNTERS:
+        actual = _count_of(counted_model, fk)
+
+        # find the drifted rows in one query, then fix them in batched UPDATEs
+        drifted = list(
+            model.objects.annotate(actual=actual)
+            .exclude(**{field: F('actual')})
+            .values_list('pk', flat=True)
+        )
+        for start in range(0, len(drifted), BATCH_SIZE):
+            batch = drifted[start:start + BATCH_SIZE]
+            model.objects.filter(pk__in=batch).update(**{field: _count_of(counted_model, fk)})
+
+        repaired[f'{model.__name__}.{field}'] = len(drifted)
+
+    return repaired
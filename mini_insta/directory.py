@@ -0,0 +1,119 @@
+# File: directory.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/30/2025
+# Description: the paginated profile directory on the home page, with its rendered pages kept in a shared cache
+
+import hashlib
+import string
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete, post_save
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import routers
+from .models import Profile
+from .pagination import keyset_page
+
+
+# the home page lists every profile, a page at a time, either alphabetically
+# (case-insensitive, with A-Z links that jump straight to a letter) or newest
+# first. newest means newest profile, by pk: join_date moves on every edit, so it
+# can't give a stable order to page through.
+#
+# the rendered list for each page is kept in a shared cache under a key that
+# includes the directory's version, which every profile save or delete bumps, so
+# a page is rendered once per change rather than once per visit, and the view
+# can tell whether a visitor's copy is current without touching the database.
+
+# profiles per page
+PAGE_SIZE = 60
+
+# ?sort= -> keyset ordering
+SORTS = {
+    'name': 'username_key',
+    'newest': '-pk',
+}
+DEFAULT_SORT = 'name'
+
+# the jump index
+LETTERS = string.ascii_lowercase
+
+VERSION_KEY = 'mini_insta:directory:version'
+
+
+def _cache():
+    return caches[getattr(settings, 'MINI_INSTA_DIRECTORY_CACHE', 'default')]
+
+
+def cache_timeout():
+    '''Return how many seconds a rendered page is kept'''
+    return getattr(settings, 'MINI_INSTA_DIRECTORY_CACHE_TIMEOUT', 300)
+
+
+def version():
+    '''Return the directory's current version, which changes whenever a profile does'''
+    cache = _cache()
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        # a new (or evicted) version starts from the clock, past any number the old one reached
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        current = cache.get(VERSION_KEY)
+    return current
+
+
+def invalidate():
+    '''Make every cached page stale, so they're rendered again on their next visit'''
+    try:
+        _cache().incr(VERSION_KEY)
+    except ValueError:
+        version()
+
+
+def invalidate_on_commit():
+    '''Invalidate once the current transaction commits, so no page is rendered from the old rows and cached as new'''
+    transaction.on_commit(invalidate)
+
+
+def _saved(sender, instance, **kwargs):
+    invalidate_on_commit()
+
+
+def connect_signals():
+    '''Connect the invalidation handlers, called from MiniInstaConfig.ready()'''
+    post_save.connect(_saved, sender=Profile, dispatch_uid='mini_insta_directory_save')
+    post_delete.connect(_saved, sender=Profile, dispatch_uid='mini_insta_directory_delete')
+
+
+def get_page(sort=DEFAULT_SORT, cursor=None, letter=None, per_page=PAGE_SIZE):
+    '''Return (profiles, next_cursor) for a page of the directory. Alphabetical pages
+    without a cursor start at letter, if one is given.'''
+    profiles = Profile.objects.annotate(username_key=Lower('username')).only(
+        'username', 'display_name', 'profile_image_url',
+    )
+    if sort == 'name' and letter and not cursor:
+        profiles = profiles.filter(username_key__gte=letter)
+    return keyset_page(profiles, cursor=cursor, per_page=per_page, order=SORTS[sort])
+
+
+def render_page(sort=DEFAULT_SORT, cursor=None, letter=None):
+    '''Return the rendered HTML of a page of the directory, from the cache if it's current'''
+    cache = _cache()
+    params = hashlib.md5(repr((sort, cursor, letter)).encode(), usedforsecurity=False).hexdigest()
+    key = f'mini_insta:directory:{version()}:{params}'
+
+    html = cache.get(key)
+    if html is None:
+        # the page is cached until the next change, so a lagging replica mustn't render it
+        with routers.use_primary():
+            profiles, next_cursor = get_page(sort, cursor, letter)
+        html = render_to_string('mini_insta/directory_page.html', {
+            'profiles': profiles,
+            'next_cursor': next_cursor,
+            'sort': sort,
+        })
+        cache.set(key, str(html), cache_timeout())
+    return mark_safe(html)
@@ -0,0 +1,107 @@
+# File: fragments.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/13/2025
+# Description: versioned cache for rendered post card fragments
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Post
+
+
+# cache keys include the post's version, so changing a post never has to delete
+# anything: bumping the version makes every old fragment unreachable, and the
+# backends evict them on their own.
+
+
+# in-process backend, the default
+class LRUBackend:
+    '''Least-recently-used cache of rendered fragments, local to this process'''
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        '''Return the fragment stored under key, or None'''
+        with self.lock:
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+            return html
+
+    def set(self, key, html):
+        '''Store a fragment, evicting the least recently used ones if we're full'''
+        with self.lock:
+            self.entries[key] = html
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# shared backend, for when several processes should share one cache
+class DjangoCacheBackend:
+    '''Fragment cache stored in one of the project's CACHES (memcached, redis, ...)'''
+
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+
+    def get(self, key):
+        return caches[self.alias].get(key)
+
+    def set(self, key, html):
+        caches[self.alias].set(key, html, self.timeout)
+
+    def clear(self):
+        caches[self.alias].clear()
+
+
+# the backend this process uses, picked from settings the first time it's needed
+_backend = None
+
+
+def get_backend():
+    '''Return the fragment cache backend.
+
+    MINI_INSTA_FRAGMENT_CACHE is 'lru' (the default) for an in-process cache of
+    MINI_INSTA_FRAGMENT_CACHE_SIZE entries, or the alias of one of the project's CACHES.'''
+    global _backend
+    if _backend is None:
+        choice = getattr(settings, 'MINI_INSTA_FRAGMENT_CACHE', 'lru')
+        if choice == 'lru':
+            _backend = LRUBackend(getattr(settings, 'MINI_INSTA_FRAGMENT_CACHE_SIZE', 5000))
+        else:
+            _backend = DjangoCacheBackend(choice, getattr(settings, 'MINI_INSTA_FRAGMENT_CACHE_TIMEOUT', 3600))
+    return _backend
+
+
+# the key for one named fragment of one post
+def fragment_key(post, name):
+    '''Return the cache key for fragment name of post at its current version'''
+    # the timestamps are auto_now, so they also change when the post or its author's profile is edited
+    post_stamp = int(post.timestamp.timestamp() * 1000000)
+    profile_stamp = int(post.profile.join_date.timestamp() * 1000000)
+    zone = timezone.get_current_timezone_name()
+    return f'mini_insta:post:{post.pk}:v{post.version}:{post_stamp}:{profile_stamp}:{name}:{zone}'
+
+
+# called whenever something shown on a post's card changes
+def bump_version(post):
+    '''Increment the version of post (a Post or its pk) so its cached fragments are no longer used'''
+    post_id = post.pk if isinstance(post, Post) else post
+    Post.all_objects.filter(pk=post_id).update(version=F('version') + 1, modified=timezone.now())
+
+
+def bump_versions(post_ids):
+    '''Increment the version of every post with these pks, in one UPDATE'''
+    Post.all_objects.filter(pk__in=post_ids).update(version=F('version') + 1, modified=timezone.now())
@@ -0,0 +1,343 @@
+# File: graph.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/25/2025
+# Description: in-memory follow graph for follow checks, mutual follows and follow suggestions
+
+import mmap
+import os
+import random
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Follower, Profile
+
+
+# the graph is stored CSR style, as three flat arrays of 64-bit ints:
+#   ids      every profile pk, sorted
+#   offsets  row i's follows are targets[offsets[i]:offsets[i + 1]]
+#   targets  the pks each profile follows, sorted within each row
+# that's 8 bytes per profile and per follow, and a follow check is two binary
+# searches. follows made since the arrays were built live in small added/removed
+# overlays until the next rebuild.
+#
+# every process has its own copy. follow views publish each change to a short log
+# in the shared cache, and other processes replay it at most every
+# MINI_INSTA_FOLLOW_GRAPH_REFRESH seconds, so they lag by about that much. if the
+# log is lost (the cache is cleared, or evicts it), it starts again under a new id,
+# and graphs built from the old one reload from the database.
+
+SNAPSHOT_MAGIC = b'MIGRAPH2'
+SNAPSHOT_HEADER = struct.Struct('=8sqqqq')  # magic, profiles, follows, log id, event sequence number
+
+# how many overlay entries to allow before rebuilding the arrays from the database
+MAX_OVERLAY = 10000
+
+# keys of the change log in the shared cache
+LOG_KEY = 'mini_insta:graph:log'
+SEQUENCE_KEY = 'mini_insta:graph:sequence'
+EVENT_KEY = 'mini_insta:graph:event:{}'
+EVENT_TIMEOUT = 24 * 60 * 60
+
+
+# settings are read on every call so they can be changed in tests
+def graph_enabled():
+    '''Return True if follow checks are answered from the in-memory graph'''
+    return getattr(settings, 'MINI_INSTA_FOLLOW_GRAPH', False)
+
+
+def snapshot_path():
+    '''Return the path of the graph snapshot file, or None'''
+    return getattr(settings, 'MINI_INSTA_FOLLOW_GRAPH_SNAPSHOT', None)
+
+
+def refresh_interval():
+    '''Return how many seconds a process waits between checks for other processes' changes'''
+    return getattr(settings, 'MINI_INSTA_FOLLOW_GRAPH_REFRESH', 1.0)
+
+
+def _cache():
+    return caches[getattr(settings, 'MINI_INSTA_FOLLOW_GRAPH_CACHE', 'default')]
+
+
+def log_position():
+    '''Return (id of the shared log, number of its latest change), starting a new log
+    if there isn't one'''
+    cache = _cache()
+    if cache.add(SEQUENCE_KEY, 0, None):
+        # a new log: anything numbered in the old one means nothing in it
+        cache.set(LOG_KEY, random.getrandbits(62) + 1, None)
+    else:
+        cache.add(LOG_KEY, random.getrandbits(62) + 1, None)
+    position = cache.get_many([LOG_KEY, SEQUENCE_KEY])
+    return position.get(LOG_KEY, 0), position.get(SEQUENCE_KEY, 0)
+
+
+class FollowGraph:
+    '''Who follows whom, as compact sorted arrays plus recent changes'''
+
+    def __init__(self, ids, offsets, targets, log=0, sequence=0, snapshot=None):
+        self.ids = ids
+        self.offsets = offsets
+        self.targets = targets
+        self.log = log                # the id of the shared log sequence is numbered in
+        self.sequence = sequence      # the last logged change already in this graph
+        self.snapshot = snapshot      # the mmap the arrays point into, if any
+        self.added = defaultdict(set)    # follower pk -> pks followed since the arrays were built
+        self.removed = defaultdict(set)  # follower pk -> pks unfollowed since then
+        self.overlay_size = 0
+
+    # build from the database in two streaming passes, one row at a time
+    @classmethod
+    def from_database(cls):
+        '''Return a FollowGraph of every Profile and Follower'''
+        log, sequence = log_position()
+
+        ids = array('q', Profile.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=10000))
+        counts = array('q', bytes(8 * (len(ids) + 1)))
+        targets = array('q')
+
+        # follows of soft-deleted profiles stay in the table until the reaper gets to them
+        follows = Follower.objects.filter(
+            follower_profile__deleted_at__isnull=True, profile__deleted_at__isnull=True,
+        ).order_by('follower_profile_id', 'profile_id').values_list('follower_profile_id', 'profile_id')
+        for follower_pk, profile_pk in follows.iterator(chunk_size=10000):
+            row = bisect_left(ids, follower_pk)
+            # a profile deleted between the two passes isn't in ids; don't credit its follows to a neighbour
+            if row == len(ids) or ids[row] != follower_pk:
+                continue
+            counts[row + 1] += 1
+            targets.append(profile_pk)
+
+        # running totals turn the per-row counts into offsets
+        for row in range(1, len(counts)):
+            counts[row] += counts[row - 1]
+
+        return cls(ids, counts, targets, log, sequence)
+
+    # a snapshot file is the header followed by the three arrays, exactly as they sit in memory
+    def save(self, path):
+        '''Write the graph (including recent changes) to a snapshot file at path'''
+        graph = self.compacted()
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as snapshot:
+            snapshot.write(SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, len(graph.ids), len(graph.targets), graph.log, graph.sequence,
+            ))
+            for values in (graph.ids, graph.offsets, graph.targets):
+                snapshot.write(memoryview(values).cast('B'))
+
+        # readers never see a half-written file
+        os.replace(temporary, path)
+
+    @classmethod
+    def from_snapshot(cls, path):
+        '''Return the FollowGraph saved at path, memory-mapped rather than read'''
+        with open(path, 'rb') as snapshot:
+            mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, profiles, follows, log, sequence = SNAPSHOT_HEADER.unpack_from(mapped)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a follow graph snapshot")
+
+        values = memoryview(mapped)[SNAPSHOT_HEADER.size:].cast('q')
+        ids = values[:profiles]
+        offsets = values[profiles:2 * profiles + 1]
+        targets = values[2 * profiles + 1:2 * profiles + 1 + follows]
+        return cls(ids, offsets, targets, log, sequence, snapshot=mapped)
+
+    # the pks row follower_pk follows in the arrays, not counting recent changes
+    def _row(self, follower_pk):
+        '''Return (start, end) of follower_pk's follows in targets'''
+        row = bisect_left(self.ids, follower_pk)
+        if row == len(self.ids) or self.ids[row] != follower_pk:
+            return 0, 0
+        return self.offsets[row], self.offsets[row + 1]
+
+    def is_following(self, follower_pk, profile_pk):
+        '''Return True if follower_pk follows profile_pk'''
+        if profile_pk in self.added.get(follower_pk, ()):
+            return True
+        if profile_pk in self.removed.get(follower_pk, ()):
+            return False
+        start, end = self._row(follower_pk)
+        position = bisect_left(self.targets, profile_pk, start, end)
+        return position < end and self.targets[position] == profile_pk
+
+    def is_mutual(self, first_pk, second_pk):
+        '''Return True if the two profiles follow each other'''
+        return self.is_following(first_pk, second_pk) and self.is_following(second_pk, first_pk)
+
+    def following(self, follower_pk):
+        '''Return the set of pks follower_pk follows'''
+        start, end = self._row(follower_pk)
+        followed = set(self.targets[start:end])
+        followed -= self.removed.get(follower_pk, set())
+        followed |= self.added.get(follower_pk, set())
+        return followed
+
+    # people you may know: profiles followed by the profiles you follow
+    def suggestions(self, profile_pk, limit=10):
+        '''Return up to limit (pk, count) pairs of profiles that profile_pk doesn't follow,
+        ranked by how many of the profiles it follows follow them'''
+        following = self.following(profile_pk)
+        counts = Counter()
+        for followed_pk in following:
+            counts.update(self.following(followed_pk))
+
+        for pk in following | {profile_pk}:
+            counts.pop(pk, None)
+
+        # most shared follows first, lowest pk (the longest-standing profile) breaks ties
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    # recent changes go in the overlays
+    def add(self, follower_pk, profile_pk):
+        '''Record that follower_pk now follows profile_pk'''
+        self.removed[follower_pk].discard(profile_pk)
+        self.added[follower_pk].add(profile_pk)
+        self.overlay_size += 1
+
+    def remove(self, follower_pk, profile_pk):
+        '''Record that follower_pk no longer follows profile_pk'''
+        self.added[follower_pk].discard(profile_pk)
+        self.removed[follower_pk].add(profile_pk)
+        self.overlay_size += 1
+
+    def compacted(self):
+        '''Return a new FollowGraph with the overlays merged into the arrays'''
+        if not self.overlay_size:
+            return self
+
+        changed = set(self.added) | set(self.removed)
+        ids = array('q', sorted(set(self.ids) | changed))
+        offsets = array('q', [0])
+        targets = array('q')
+        for pk in ids:
+            if pk in changed:
+                targets.extend(sorted(self.following(pk)))
+            else:
+                start, end = self._row(pk)
+                targets.extend(self.targets[start:end])
+            offsets.append(len(targets))
+        return FollowGraph(ids, offsets, targets, self.log, self.sequence)
+
+    # pick up the changes other processes logged since this graph was built
+    def catch_up(self):
+        '''Replay the shared change log up to its latest entry.
+        Returns False if some of it has expired, or the log was lost and started again,
+        in which case the graph needs rebuilding.'''
+        log, latest = log_position()
+        if log != self.log or latest < self.sequence:
+            return False
+        if latest == self.sequence:
+            return True
+
+        keys = [EVENT_KEY.format(number) for number in range(self.sequence + 1, latest + 1)]
+        events = _cache().get_many(keys)
+        if len(events) < len(keys):
+            return False
+
+        for key in keys:
+            action, follower_pk, profile_pk = events[key]
+            if action == 'follow':
+                self.add(follower_pk, profile_pk)
+            else:
+                self.remove(follower_pk, profile_pk)
+        self.sequence = latest
+        return True
+
+
+# the graph this process uses, loaded the first time it's needed
+_graph = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+# held by the one thread rebuilding the graph, which it does outside _lock
+_build_lock = threading.Lock()
+
+
+def _load():
+    '''Return a freshly loaded graph, from the snapshot file if there is one'''
+    path = snapshot_path()
+    if path and os.path.exists(path):
+        try:
+            graph = FollowGraph.from_snapshot(path)
+        except (ValueError, struct.error):
+            graph = None  # an older snapshot format; the next snapshot_follow_graph replaces it
+        if graph is not None and graph.catch_up():
+            return graph
+    return FollowGraph.from_database()
+
+
+def get_graph():
+    '''Return this process's FollowGraph, up to date with other processes to within
+    MINI_INSTA_FOLLOW_GRAPH_REFRESH seconds'''
+    global _graph, _checked_at
+    with _lock:
+        graph = _graph
+        if graph is not None and monotonic() - _checked_at < refresh_interval():
+            return graph
+        if graph is not None and graph.catch_up() and graph.overlay_size <= MAX_OVERLAY:
+            _checked_at = monotonic()
+            return graph
+
+    # a rebuild is two full table scans, so it runs outside _lock, one thread at a
+    # time, and the old graph keeps serving everyone else until it's done
+    if not _build_lock.acquire(blocking=graph is None):
+        return graph
+    try:
+        with _lock:
+            # another thread may have swapped in a new graph while this one waited
+            if _graph is not graph:
+                return _graph
+        fresh = _load() if graph is None else FollowGraph.from_database()
+        with _lock:
+            # pick up the follows published while it was being built
+            fresh.catch_up()
+            _graph, _checked_at = fresh, monotonic()
+            return fresh
+    finally:
+        _build_lock.release()
+
+
+def reset():
+    '''Forget this process's graph, so the next get_graph() loads it again'''
+    global _graph
+    with _lock:
+        _graph = None
+
+
+# called by the follow views, once the follow is committed
+def _publish(action, follower_pk, profile_pk):
+    '''Apply a change to this process's graph and log it for the others'''
+    cache = _cache()
+    log_position()  # so there's a sequence to increment
+    number = cache.incr(SEQUENCE_KEY)
+    cache.set(EVENT_KEY.format(number), (action, follower_pk, profile_pk), EVENT_TIMEOUT)
+
+    global _checked_at
+    with _lock:
+        # replay the log up to and including ours, so changes apply in order. if it
+        # can't be replayed, the viewer still sees their own change until the rebuild
+        if _graph is not None and not _graph.catch_up():
+            (_graph.add if action == 'follow' else _graph.remove)(follower_pk, profile_pk)
+            _checked_at = 0.0
+
+
+def followed(follower, profile):
+    '''Record that follower (a Profile) followed profile, after the transaction commits'''
+    if graph_enabled():
+        transaction.on_commit(lambda: _publish('follow', follower.pk, profile.pk))
+
+
+def unfollowed(follower, profile):
+    '''Record that follower (a Profile) unfollowed profile, after the transaction commits'''
+    if graph_enabled():
+        transaction.on_commit(lambda: _publish('unfollow', follower.pk, profile.pk))
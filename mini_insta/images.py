@@ -0,0 +1,140 @@
+# File: images.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/09/2025
+# Description: generates downscaled variants of uploaded photos in a background worker pool
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+from . import routers
+from .fragments import bump_version
+from .models import Photo
+
+logger = logging.getLogger('mini_insta.images')
+
+
+# variant name -> longest side in pixels. the templates ask for these by name.
+VARIANT_SIZES = {
+    'small': 320,   # profile grid, search results
+    'medium': 640,  # feed cards
+    'large': 1080,  # post detail page
+}
+
+# WebP is much smaller, but only if this Pillow was built with it
+if features.check('webp'):
+    VARIANT_FORMAT, VARIANT_EXTENSION = 'WEBP', 'webp'
+else:
+    VARIANT_FORMAT, VARIANT_EXTENSION = 'JPEG', 'jpg'
+
+# shared by every request in this process, created the first time a photo is uploaded
+_executor = None
+
+
+def _get_executor():
+    '''Return the process-wide worker pool, creating it if needed'''
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'MINI_INSTA_IMAGE_WORKERS', 2)
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mini_insta_images')
+    return _executor
+
+
+# the path a variant of an uploaded file gets stored at
+def variant_name(original_name, size_name):
+    '''Return the storage path for the size_name variant of original_name'''
+    stem, extension = os.path.splitext(os.path.basename(original_name))
+    return f'variants/{stem}_{size_name}.{VARIANT_EXTENSION}'
+
+
+# do the actual resizing for one photo
+def generate_variants(photo):
+    '''Record photo's dimensions and save a downscaled copy for every variant size
+    smaller than the original. Photos that only have an image_url are skipped.'''
+
+    if not photo.image_file:
+        return
+
+    storage = photo.image_file.storage
+    with photo.image_file.open('rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+
+    width, height = image.size
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    if VARIANT_FORMAT == 'JPEG' and image.mode == 'RGBA':
+        image = image.convert('RGB')
+
+    variants = {}
+    for size_name, longest_side in VARIANT_SIZES.items():
+
+        # no point "downscaling" to something bigger than the original
+        if max(width, height) <= longest_side:
+            continue
+
+        resized = image.copy()
+        resized.thumbnail((longest_side, longest_side), Image.LANCZOS)
+
+        buffer = BytesIO()
+        resized.save(buffer, VARIANT_FORMAT, quality=82)
+        name = variant_name(photo.image_file.name, size_name)
+        variants[size_name] = storage.save(name, ContentFile(buffer.getvalue()))
+
+    # update() so the photo's timestamp and save signals aren't touched
+    Photo.objects.filter(pk=photo.pk).update(width=width, height=height, variants=variants)
+
+    # release any variants from an earlier run, now that nothing points at them
+    for old_name in photo.variants.values():
+        storage.delete(old_name)
+    photo.width, photo.height, photo.variants = width, height, variants
+
+    # cached cards still point at the original image
+    bump_version(photo.post_id)
+
+
+# what each worker thread runs
+def _process(photo_pk):
+    '''Generate the variants for the photo with this pk, in a worker thread'''
+    try:
+        # a replica might not have the photo yet
+        with routers.use_primary():
+            photo = Photo.objects.filter(pk=photo_pk).first()
+            if photo is not None:
+                generate_variants(photo)
+    finally:
+        # worker threads open their own connections, don't leak them
+        connections.close_all()
+
+
+# nothing waits on the futures, so a failed job would otherwise vanish without a trace
+def _log_failure(photo_pk):
+    '''Return a done-callback that logs the exception of photo_pk's job, if it raised'''
+    def callback(future):
+        exception = future.exception()
+        if exception is not None:
+            logger.error("generating variants for photo %s failed", photo_pk, exc_info=exception)
+    return callback
+
+
+def _submit(photo_pk):
+    '''Queue the variants for the photo with this pk on the worker pool'''
+    future = _get_executor().submit(_process, photo_pk)
+    future.add_done_callback(_log_failure(photo_pk))
+    return future
+
+
+# called by CreatePostView for each uploaded photo
+def schedule(photo):
+    '''Queue photo for variant generation once the current transaction commits.
+
+    With MINI_INSTA_IMAGE_SYNC the variants are generated before returning instead.'''
+    if getattr(settings, 'MINI_INSTA_IMAGE_SYNC', False):
+        transaction.on_commit(lambda: generate_variants(photo))
+    else:
+        transaction.on_commit(lambda: _submit(photo.pk))
@@ -0,0 +1,179 @@
+# File: instrumentation.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/18/2025
+# Description: per-request query count and latency instrumentation for the mini_insta app
+
+import bisect
+import logging
+import threading
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.db import connections
+
+logger = logging.getLogger('mini_insta.instrumentation')
+
+
+# histogram bucket upper bounds; anything bigger lands in the last (overflow) bucket
+MS_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+
+
+class Histogram:
+    '''Counts of observations in fixed buckets, plus count/total/max'''
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    # estimated from the buckets, so it's the bucket's upper bound (or the max for the overflow bucket)
+    def percentile(self, fraction):
+        '''Return an upper bound on the given percentile (0-1) of the observations'''
+        if not self.count:
+            return 0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        '''Return a JSON-friendly summary of the histogram'''
+        labels = [f'<={bound}' for bound in self.bounds] + [f'>{self.bounds[-1]}']
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 3) if self.count else 0,
+            'max': round(self.max, 3),
+            'p50': round(self.percentile(0.50), 3),
+            'p95': round(self.percentile(0.95), 3),
+            'p99': round(self.percentile(0.99), 3),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class ViewStats:
+    '''Histograms for one url name'''
+
+    def __init__(self):
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_ms = Histogram(MS_BUCKETS)
+        self.template_ms = Histogram(MS_BUCKETS)
+        self.wall_ms = Histogram(MS_BUCKETS)
+        self.over_budget = 0
+
+    def as_dict(self):
+        return {
+            'queries': self.queries.as_dict(),
+            'db_ms': self.db_ms.as_dict(),
+            'template_ms': self.template_ms.as_dict(),
+            'wall_ms': self.wall_ms.as_dict(),
+            'over_budget': self.over_budget,
+        }
+
+
+# every url name's stats for this process
+_stats = {}
+_lock = threading.Lock()
+
+
+def record(url_name, queries, db_ms, template_ms, wall_ms, over_budget=False):
+    '''Add one request's measurements to the stats for url_name'''
+    with _lock:
+        stats = _stats.setdefault(url_name, ViewStats())
+        stats.queries.add(queries)
+        stats.db_ms.add(db_ms)
+        stats.template_ms.add(template_ms)
+        stats.wall_ms.add(wall_ms)
+        stats.over_budget += over_budget
+
+
+def snapshot():
+    '''Return {url name: summary} for every url name seen so far'''
+    with _lock:
+        return {url_name: stats.as_dict() for url_name, stats in sorted(_stats.items())}
+
+
+def reset():
+    '''Forget everything recorded so far'''
+    with _lock:
+        _stats.clear()
+
+
+# installed with connection.execute_wrapper() for the length of a request
+class QueryRecorder:
+    '''Counts the queries run through it and how long they took'''
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += perf_counter() - start
+
+
+# views declare how many queries they should need with a query_budget attribute
+def get_query_budget(resolver_match):
+    '''Return the query_budget of the view behind resolver_match, or None'''
+    if resolver_match is None:
+        return None
+    view_class = getattr(resolver_match.func, 'view_class', None)
+    return getattr(view_class, 'query_budget', None)
+
+
+class InstrumentationMiddleware:
+    '''Record query count, DB time, template render time and wall time for every request,
+    grouped by url name. Logs a warning when a view goes over its query_budget.
+
+    Goes near the top of MIDDLEWARE so its wall time covers the other middleware.'''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request._mini_insta_template_ms = 0.0
+        start = perf_counter()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        wall_ms = (perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        url_name = match.view_name if match is not None else 'unresolved'
+
+        budget = get_query_budget(match)
+        over_budget = budget is not None and recorder.count > budget
+        if over_budget:
+            logger.warning("%s ran %d queries, over its budget of %d", url_name, recorder.count, budget)
+
+        record(url_name, recorder.count, recorder.seconds * 1000,
+               request._mini_insta_template_ms, wall_ms, over_budget)
+        return response
+
+    # TemplateResponses render after the view returns; time from here to the post-render callback
+    def process_template_response(self, request, response):
+        render_start = perf_counter()
+
+        def rendered(response):
+            request._mini_insta_template_ms += (perf_counter() - render_start) * 1000
+
+        response.add_post_render_callback(rendered)
+        return response
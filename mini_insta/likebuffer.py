@@ -0,0 +1,301 @@
+# File: likebuffer.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/26/2025
+# Description: optional write-behind buffer that batches likes and unlikes into a few bulk writes
+
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+from time import perf_counter
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+
+from . import fragments, trending
+from .instrumentation import MS_BUCKETS, Histogram
+from .models import Like, Post, Profile
+
+logger = logging.getLogger('mini_insta.likebuffer')
+
+
+# with MINI_INSTA_LIKE_BUFFER on, the like views don't write. they record what the
+# viewer wants (liked or not) for each (post, profile), later intents replacing
+# earlier ones, so a like and an unlike in between flushes cancel out. a
+# background thread writes everything in one transaction every
+# MINI_INSTA_LIKE_BUFFER_INTERVAL seconds, or as soon as
+# MINI_INSTA_LIKE_BUFFER_SIZE intents are waiting, with a bulk_create, a bulk
+# delete and one counter UPDATE per post. until then the viewer's own pages
+# show their pending likes, and other viewers see them after the flush.
+#
+# intents live in this process's memory, so a process that dies without exiting
+# cleanly loses up to one interval of likes.
+
+# the buckets flush sizes are counted in
+BATCH_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+# settings are read on every call so they can be changed in tests
+def buffer_enabled():
+    '''Return True if likes go through the write-behind buffer'''
+    return getattr(settings, 'MINI_INSTA_LIKE_BUFFER', False)
+
+
+def flush_interval():
+    '''Return the seconds between flushes, or 0 to only flush when the buffer fills (or flush() is called)'''
+    return getattr(settings, 'MINI_INSTA_LIKE_BUFFER_INTERVAL', 0.5)
+
+
+def flush_size():
+    '''Return how many pending intents trigger a flush straight away'''
+    return getattr(settings, 'MINI_INSTA_LIKE_BUFFER_SIZE', 500)
+
+
+# (post pk, profile pk) -> True to like, False to unlike
+_pending = {}
+_lock = threading.Lock()
+
+# one flush at a time, so an older batch never lands after a newer one
+_flush_lock = threading.Lock()
+
+
+class Metrics:
+    '''How the buffer has been doing in this process'''
+
+    def __init__(self):
+        self.flush_ms = Histogram(MS_BUCKETS)
+        self.batch_size = Histogram(BATCH_BUCKETS)
+        self.intents = 0     # like/unlike requests buffered
+        self.coalesced = 0   # of those, how many replaced a pending intent
+        self.created = 0     # Like rows written
+        self.deleted = 0     # Like rows deleted
+        self.failures = 0    # flushes that raised, and were retried later
+        self.dropped = 0     # intents that could never be written, and were given up on
+
+    def as_dict(self):
+        return {
+            'pending': len(_pending),
+            'intents': self.intents,
+            'coalesced': self.coalesced,
+            'created': self.created,
+            'deleted': self.deleted,
+            'failures': self.failures,
+            'dropped': self.dropped,
+            'flush_ms': self.flush_ms.as_dict(),
+            'batch_size': self.batch_size.as_dict(),
+        }
+
+
+_metrics = Metrics()
+
+
+def metrics():
+    '''Return a JSON-friendly summary of the buffer's activity'''
+    with _lock:
+        return _metrics.as_dict()
+
+
+# the like views call this instead of writing
+def add(post_pk, profile_pk, liked):
+    '''Buffer profile_pk's intent to like (liked=True) or unlike post_pk'''
+    with _lock:
+        key = (post_pk, profile_pk)
+        _metrics.intents += 1
+        _metrics.coalesced += key in _pending
+        _pending[key] = liked
+        full = len(_pending) >= flush_size()
+
+    # the flusher writes on its interval from the first like on; without one, write when full
+    running = _start_flusher()
+    if full and not running:
+        flush()
+    elif full:
+        _wake.set()
+
+
+# what the viewer's pages show before the flush
+def pending_state(post_pk, profile_pk):
+    '''Return True/False for profile_pk's buffered intent on post_pk, or None if there isn't one'''
+    with _lock:
+        return _pending.get((post_pk, profile_pk))
+
+
+def pending_likes(profile_pk, post_pks):
+    '''Return {post pk: liked} for profile_pk's buffered intents on post_pks'''
+    with _lock:
+        return {pk: _pending[(pk, profile_pk)] for pk in post_pks if (pk, profile_pk) in _pending}
+
+
+def overlay(posts, profile):
+    '''Set liked_by_viewer on posts (from Post.objects.for_feed()) to profile's buffered intents.
+    Returns posts, which must be a list.'''
+    if profile is None or not buffer_enabled():
+        return posts
+    pending = pending_likes(profile.pk, [post.pk for post in posts])
+    for post in posts:
+        if post.pk in pending:
+            post.liked_by_viewer = pending[post.pk]
+    return posts
+
+
+def pending_for_post(post_pk):
+    '''Return the sorted (profile pk, liked) intents buffered for post_pk, so page ETags change with them'''
+    with _lock:
+        return tuple(sorted((key[1], liked) for key, liked in _pending.items() if key[0] == post_pk))
+
+
+# turn the batch's intents into row changes, reading which likes already exist
+def _write(batch):
+    '''Write a batch of {(post pk, profile pk): liked}, returning (created, deleted)'''
+    with transaction.atomic():
+        # posts and profiles deleted since the like was buffered don't get it
+        live = set(Post.objects.filter(pk__in={post_pk for post_pk, _ in batch}).values_list('pk', flat=True))
+        live_profiles = set(
+            Profile.objects.filter(pk__in={profile_pk for _, profile_pk in batch}).values_list('pk', flat=True)
+        )
+        batch = {key: liked for key, liked in batch.items() if key[0] in live and key[1] in live_profiles}
+        post_pks = {post_pk for post_pk, _ in batch}
+        profile_pks = {profile_pk for _, profile_pk in batch}
+
+        # every existing like the batch could touch, from the unique (post, profile) index
+        existing = {
+            (post_pk, profile_pk): (pk, timestamp)
+            for pk, post_pk, profile_pk, timestamp in Like.objects.filter(
+                post_id__in=post_pks, profile_id__in=profile_pks,
+            ).values_list('pk', 'post_id', 'profile_id', 'timestamp')
+        }
+
+        to_create = [key for key, liked in batch.items() if liked and key not in existing]
+        to_delete = [key for key, liked in batch.items() if not liked and key in existing]
+
+        Like.objects.bulk_create([Like(post_id=post_pk, profile_id=profile_pk) for post_pk, profile_pk in to_create])
+        Like.objects.filter(pk__in=[existing[key][0] for key in to_delete]).delete()
+
+        # one UPDATE per post, however many likes it got
+        created = Counter(post_pk for post_pk, _ in to_create)
+        changes = created.copy()
+        changes.subtract(post_pk for post_pk, _ in to_delete)
+        for post_pk, amount in changes.items():
+            if amount:
+                Post.objects.filter(pk=post_pk).update(like_count=F('like_count') + amount)
+
+        # trending gets the new likes at today's value and loses the old ones at theirs
+        removed = defaultdict(list)
+        for key in to_delete:
+            removed[key[0]].append(existing[key][1])
+        for post_pk, amount in created.items():
+            trending.liked(post_pk, amount)
+        for post_pk, liked_at in removed.items():
+            trending.unliked(post_pk, *liked_at)
+
+        # a like and an unlike by different people can net to 0, but the latest liker still changed
+        for post_pk in {post_pk for post_pk, _ in to_create + to_delete}:
+            fragments.bump_version(post_pk)
+
+    return len(to_create), len(to_delete)
+
+
+# a row deleted between the liveness check and the commit fails the whole batch,
+# and would again on every retry, so narrow it down and give up on just that part
+def _write_in_parts(batch):
+    '''Write batch a post at a time, then a single intent at a time for any post that
+    still fails, dropping the intents that can't be written. Returns (created, deleted).'''
+    by_post = defaultdict(dict)
+    for key, liked in batch.items():
+        by_post[key[0]][key] = liked
+
+    created = deleted = 0
+    for post_pk, intents in by_post.items():
+        parts = [intents]
+        while parts:
+            part = parts.pop()
+            try:
+                part_created, part_deleted = _write(part)
+            except IntegrityError:
+                if len(part) > 1:
+                    parts.extend({key: liked} for key, liked in part.items())
+                    continue
+                logger.exception("dropping the buffered like %s, which can't be written", next(iter(part)))
+                with _lock:
+                    _metrics.dropped += 1
+                continue
+            created += part_created
+            deleted += part_deleted
+    return created, deleted
+
+
+def flush():
+    '''Write every buffered intent to the database now. Returns (created, deleted).'''
+    with _flush_lock:
+        with _lock:
+            batch = dict(_pending)
+        if not batch:
+            return 0, 0
+
+        start = perf_counter()
+        try:
+            try:
+                created, deleted = _write(batch)
+            except IntegrityError:
+                created, deleted = _write_in_parts(batch)
+        except Exception:
+            logger.exception("flushing %d buffered likes failed, keeping them for the next flush", len(batch))
+            with _lock:
+                _metrics.failures += 1
+            raise
+
+        # only forget the intents that weren't replaced while we were writing
+        with _lock:
+            for key, liked in batch.items():
+                if _pending.get(key) == liked:
+                    del _pending[key]
+            _metrics.flush_ms.add((perf_counter() - start) * 1000)
+            _metrics.batch_size.add(len(batch))
+            _metrics.created += created
+            _metrics.deleted += deleted
+        return created, deleted
+
+
+# the background flusher, started by the first buffered like
+_wake = threading.Event()
+_flusher = None
+
+
+def _run_flusher():
+    while True:
+        _wake.wait(flush_interval())
+        _wake.clear()
+        close_old_connections()
+        try:
+            flush()
+        except Exception:
+            pass  # already logged, and the intents are still pending
+
+
+def _start_flusher():
+    '''Start the flusher thread if the interval allows one, returning True if it's running'''
+    global _flusher
+    if not flush_interval():
+        return False
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run_flusher, name='mini_insta_likebuffer', daemon=True)
+            _flusher.start()
+    return True
+
+
+def reset():
+    '''Forget every buffered intent and the metrics, without writing them'''
+    global _metrics
+    with _lock:
+        _pending.clear()
+        _metrics = Metrics()
+
+
+# don't lose the last interval's likes on a clean shutdown
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
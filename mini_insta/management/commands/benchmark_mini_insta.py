@@ -0,0 +1,67 @@
+# File: benchmark_mini_insta.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/21/2025
+# Description: management command that replays user sessions and reports per-view latency percentiles
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mini_insta import benchmark
+
+
+class Command(BaseCommand):
+    '''Replay scripted sessions with concurrent workers and write a JSON report'''
+
+    help = ("Replay scripted mini_insta sessions (log in, feed, post, like, comment, follow, search) "
+            "and report throughput and p50/p95/p99 latency per view as JSON. "
+            "Sessions write likes, comments and follows, so use a scratch database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=100, help="number of sessions to replay")
+        parser.add_argument('--workers', type=int, default=4, help="sessions run at the same time")
+        parser.add_argument('--seed', type=int, default=0, help="random seed for the session scripts")
+        parser.add_argument('--prefix', default='seed', help="username prefix of the users to log in as")
+        parser.add_argument('--host', default='testserver', help="Host header to send, must be in ALLOWED_HOSTS")
+        parser.add_argument('--label', default='', help="name for this run in the report, e.g. a commit hash")
+        parser.add_argument('--output', help="write the report to this file instead of stdout")
+        parser.add_argument('--compare', help="an earlier report to compare this run against")
+        parser.add_argument('--threshold', type=float, default=0.10,
+                            help="with --compare, how much slower (as a fraction) counts as a regression")
+        parser.add_argument('--strict', action='store_true', help="with --compare, fail on any regression")
+
+    def handle(self, *args, **options):
+        '''run the benchmark, write the report, and compare it to a baseline'''
+        try:
+            report = benchmark.run(
+                sessions=options['sessions'],
+                workers=options['workers'],
+                seed=options['seed'],
+                prefix=options['prefix'],
+                host=options['host'],
+                label=options['label'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(text + '\n')
+            self.stderr.write(f"Wrote {report['requests']} requests' results to {options['output']}")
+        else:
+            self.stdout.write(text)
+
+        if not options['compare']:
+            return
+
+        with open(options['compare']) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = benchmark.compare(baseline, report, options['threshold'])
+        for url_name, statistic, before, after, change in regressions:
+            self.stderr.write(f"{url_name} {statistic}: {before:.1f} -> {after:.1f} ms (+{change:.0%})")
+
+        if regressions and options['strict']:
+            raise CommandError(f"{len(regressions)} latency regressions against {options['compare']}")
+        if not regressions:
+            self.stderr.write(self.style.SUCCESS(f"No regressions against {options['compare']}."))
@@ -0,0 +1,70 @@
+# File: explain_hot_queries.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/04/2025
+# Description: management command that prints the query plan of every hot mini_insta query
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mini_insta.models import FeedEntry, Follower, Like, Post, Profile
+
+
+# the queries the busiest pages run, built for a sample profile and post
+def hot_queries(profile, post):
+    '''Return a list of (name, QuerySet) pairs for the hot lookups'''
+    return [
+        ('is following (show_profile, follow)',
+            Follower.objects.filter(profile=profile, follower_profile=profile)),
+        ('has liked (show_post, like)',
+            Like.objects.filter(post=post, profile=profile)),
+        ('profile posts (show_profile)',
+            Post.objects.filter(profile=profile).order_by('-timestamp')),
+        ('followers list (show_followers)',
+            Follower.objects.filter(profile=profile).order_by('-timestamp')),
+        ('following list (show_following)',
+            Follower.objects.filter(follower_profile=profile).order_by('-timestamp')),
+        ('post feed (show_feed)',
+            profile.get_post_feed()),
+        ('materialized feed (show_feed)',
+            FeedEntry.objects.filter(owner=profile).order_by('-timestamp', '-post')),
+    ]
+
+
+class Command(BaseCommand):
+    '''Print EXPLAIN QUERY PLAN and timing for each hot query'''
+
+    help = "Print the query plan and run time of each hot mini_insta query, to catch missing indexes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="how many times to run each query when timing it")
+        parser.add_argument('--strict', action='store_true',
+                            help="fail if any plan does a full table scan")
+
+    def handle(self, *args, **options):
+        '''explain and time every hot query'''
+
+        # the plan doesn't depend on which rows we ask for, so any ids will do
+        profile = Profile.objects.first() or Profile(pk=0)
+        post = Post.objects.first() or Post(pk=0)
+
+        full_scans = []
+        for name, queryset in hot_queries(profile, post):
+            plan = queryset[:20].explain()
+
+            start = perf_counter()
+            for i in range(options['repeat']):
+                list(queryset[:20])
+            elapsed = (perf_counter() - start) / options['repeat'] * 1000
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{name}  ({elapsed:.3f} ms)"))
+            self.stdout.write(plan)
+            self.stdout.write('')
+
+            # "SCAN table" without an index means every row is read
+            for line in plan.splitlines():
+                if 'SCAN' in line and 'USING' not in line:
+                    full_scans.append(name)
+
+        if options['strict'] and full_scans:
+            raise CommandError(f"Full table scans in: {', '.join(sorted(set(full_scans)))}")
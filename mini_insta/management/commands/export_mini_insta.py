@@ -0,0 +1,46 @@
+# File: export_mini_insta.py
+# Author: Anna LaPrade (alaprade@bu.edu), 12/01/2025
+# Description: management command that streams every mini_insta table out to chunked NDJSON files
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mini_insta import transfer
+
+
+class Command(BaseCommand):
+    '''Export users, profiles, posts, photos, follows, comments and likes to a directory'''
+
+    help = ("Export all mini_insta data to chunked NDJSON files in a directory, a batch at a time, for "
+            "backups or moving to another database. Load it with import_mini_insta. An interrupted "
+            "export can be finished with --resume.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="where to write the export")
+        parser.add_argument('--batch-size', type=int, default=2000, help="rows fetched from the database at a time")
+        parser.add_argument('--chunk-rows', type=int, default=100000, help="rows per file")
+        parser.add_argument('--workers', type=int, default=1, help="tables exported at once, each on its own connection")
+        parser.add_argument('--resume', action='store_true', help="carry on with an unfinished export in directory")
+
+    def handle(self, *args, **options):
+        '''export every table, reporting progress as we go'''
+        start = perf_counter()
+
+        def log(message):
+            self.stdout.write(f"[{perf_counter() - start:7.1f}s] {message}")
+
+        try:
+            exported = transfer.export_data(
+                options['directory'],
+                batch_size=options['batch_size'],
+                chunk_rows=options['chunk_rows'],
+                workers=options['workers'],
+                resume=options['resume'],
+                log=log,
+            )
+        except FileExistsError as e:
+            raise CommandError(str(e))
+
+        summary = ', '.join(f"{rows} {label}" for label, rows in exported.items())
+        self.stdout.write(self.style.SUCCESS(f"Exported {summary} in {perf_counter() - start:.1f}s."))
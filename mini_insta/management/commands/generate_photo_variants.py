@@ -0,0 +1,31 @@
+# File: generate_photo_variants.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/09/2025
+# Description: management command to generate size variants for photos that don't have them yet
+
+from django.core.management.base import BaseCommand
+
+from mini_insta import images
+from mini_insta.models import Photo
+
+
+class Command(BaseCommand):
+    '''Generate downscaled variants for uploaded photos'''
+
+    help = "Generate the small/medium/large variants of uploaded mini_insta photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="regenerate every photo, not just ones without dimensions")
+
+    def handle(self, *args, **options):
+        '''generate variants one photo at a time'''
+        photos = Photo.objects.exclude(image_file='')
+        if not options['all']:
+            photos = photos.filter(width__isnull=True)
+
+        done = 0
+        for photo in photos.iterator():
+            images.generate_variants(photo)
+            done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {done} photos."))
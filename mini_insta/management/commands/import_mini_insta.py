@@ -0,0 +1,47 @@
+# File: import_mini_insta.py
+# Author: Anna LaPrade (alaprade@bu.edu), 12/01/2025
+# Description: management command that loads an export_mini_insta directory into an empty database
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mini_insta import transfer
+
+
+class Command(BaseCommand):
+    '''Import the users, profiles, posts, photos, follows, comments and likes of an export'''
+
+    help = ("Load a directory written by export_mini_insta into an empty database, a batch at a time, "
+            "then rebuild the counters, trending scores, search index and timelines. An interrupted "
+            "import can be finished with --resume. Media files aren't included; copy MEDIA_ROOT separately.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help="the export to load")
+        parser.add_argument('--batch-size', type=int, default=2000, help="rows per bulk insert")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="tables imported at once, each on its own connection (keep 1 on SQLite)")
+        parser.add_argument('--resume', action='store_true', help="carry on from the checkpoint of an unfinished import")
+        parser.add_argument('--checkpoint', help="file to save progress to (default: one in the export directory)")
+
+    def handle(self, *args, **options):
+        '''import every table, reporting progress as we go'''
+        start = perf_counter()
+
+        def log(message):
+            self.stdout.write(f"[{perf_counter() - start:7.1f}s] {message}")
+
+        try:
+            imported = transfer.import_data(
+                options['directory'],
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                resume=options['resume'],
+                checkpoint=options['checkpoint'],
+                log=log,
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        summary = ', '.join(f"{rows} {label}" for label, rows in imported.items())
+        self.stdout.write(self.style.SUCCESS(f"Imported {summary} in {perf_counter() - start:.1f}s."))
@@ -0,0 +1,29 @@
+# File: reap_deleted.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/28/2025
+# Description: management command that removes deleted posts and profiles in small batches
+
+from django.core.management.base import BaseCommand
+
+from mini_insta import reaper
+
+
+class Command(BaseCommand):
+    '''Remove soft-deleted posts and profiles, with everything pointing at them'''
+
+    help = ("Remove deleted mini_insta posts and profiles a batch at a time, with their likes, comments, "
+            "follows, feed entries and media files. Safe to interrupt and run again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="reap at most this many posts and this many profiles")
+        parser.add_argument('--pending', action='store_true', help="only report what's waiting to be reaped")
+
+    def handle(self, *args, **options):
+        '''reap, reporting progress as we go'''
+        waiting = reaper.pending()
+        self.stdout.write(f"{waiting['posts']} deleted posts and {waiting['profiles']} deleted profiles waiting.")
+        if options['pending']:
+            return
+
+        removed = reaper.reap(limit=options['limit'], log=self.stdout.write)
+        summary = ', '.join(f"{count} {name}" for name, count in sorted(removed.items())) or "nothing"
+        self.stdout.write(self.style.SUCCESS(f"Removed {summary}."))
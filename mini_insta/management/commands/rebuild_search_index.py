@@ -0,0 +1,26 @@
+# File: rebuild_search_index.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/06/2025
+# Description: management command to rebuild the full-text search index from scratch
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from mini_insta import search
+
+
+class Command(BaseCommand):
+    '''Repopulate the FTS5 search tables from the Post and Profile tables'''
+
+    help = "Rebuild the mini_insta full-text search index (SQLite FTS5)."
+
+    def handle(self, *args, **options):
+        '''rebuild each index table in one transaction'''
+        if not search.fts_available():
+            raise CommandError("The FTS5 search tables don't exist; run migrate on a SQLite database first.")
+
+        with transaction.atomic():
+            indexed = search.rebuild()
+
+        for model, rows in indexed.items():
+            self.stdout.write(f"{model}: indexed {rows} rows")
+        self.stdout.write(self.style.SUCCESS("Rebuilt the search index."))
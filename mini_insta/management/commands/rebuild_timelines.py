@@ -0,0 +1,21 @@
+# File: rebuild_timelines.py
+# Author: Anna LaPrade (alaprade@bu.edu), 10/30/2025
+# Description: management command to rebuild every materialized home timeline from scratch
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mini_insta import timeline
+
+
+class Command(BaseCommand):
+    '''Rebuild the FeedEntry table from the Post and Follower tables'''
+
+    help = "Delete and regenerate every mini_insta home timeline (FeedEntry rows)."
+
+    def handle(self, *args, **options):
+        '''rebuild the timelines in one transaction, so feeds are never half-built'''
+        with transaction.atomic():
+            written = timeline.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt timelines with {written} feed entries."))
@@ -0,0 +1,22 @@
+# File: reconcile_counters.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/02/2025
+# Description: management command to repair drift in the denormalized count columns
+
+from django.core.management.base import BaseCommand
+
+from mini_insta import counters
+
+
+class Command(BaseCommand):
+    '''Recompute the follower, following, like and comment counts'''
+
+    help = "Repair the denormalized follower/following/like/comment counts on mini_insta profiles and posts."
+
+    def handle(self, *args, **options):
+        '''reconcile every counter and report how many rows were off'''
+        repaired = counters.reconcile()
+
+        for counter, rows in repaired.items():
+            self.stdout.write(f"{counter}: repaired {rows} rows")
+
+        self.stdout.write(self.style.SUCCESS(f"Repaired {sum(repaired.values())} counts."))
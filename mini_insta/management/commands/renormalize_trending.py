@@ -0,0 +1,29 @@
+# File: renormalize_trending.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/27/2025
+# Description: management command that rescales the trending scores and drops posts that have gone quiet
+
+from django.core.management.base import BaseCommand
+
+from mini_insta import trending
+
+
+class Command(BaseCommand):
+    '''Move the trending epoch to now, or rebuild the scores from scratch'''
+
+    help = ("Rescale the mini_insta trending scores to the current time and drop the ones that have "
+            "decayed away. Run it periodically, e.g. daily from cron. --rebuild recomputes them "
+            "from recent likes and comments instead.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="recompute every score from the likes and comments of the last few days")
+
+    def handle(self, *args, **options):
+        '''renormalize (or rebuild) the trending scores'''
+        if options['rebuild']:
+            scored = trending.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt trending scores for {scored} posts."))
+            return
+
+        kept, dropped = trending.renormalize()
+        self.stdout.write(self.style.SUCCESS(f"Renormalized {kept} trending scores, dropped {dropped}."))
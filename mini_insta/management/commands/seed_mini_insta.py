@@ -0,0 +1,54 @@
+# File: seed_mini_insta.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/20/2025
+# Description: management command to fill the database with a synthetic social graph
+
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from mini_insta import seed
+
+
+class Command(BaseCommand):
+    '''Generate profiles, follows, posts, likes and comments in bulk'''
+
+    help = ("Fill the database with a deterministic synthetic mini_insta social graph for load testing. "
+            "Every generated user's password is \"password\".")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1000, help="number of profiles (and users) to create")
+        parser.add_argument('--posts', type=int, default=5, help="average posts per profile")
+        parser.add_argument('--follows', type=int, default=20, help="average profiles each profile follows")
+        parser.add_argument('--likes', type=int, default=20, help="average likes per post")
+        parser.add_argument('--comments', type=int, default=2, help="average comments per post")
+        parser.add_argument('--alpha', type=float, default=1.0, help="power-law exponent for popularity")
+        parser.add_argument('--seed', type=int, default=0, help="random seed, the same seed gives the same graph")
+        parser.add_argument('--prefix', default='seed', help="username prefix for the generated users")
+        parser.add_argument('--batch-size', type=int, default=5000, help="rows per bulk insert")
+
+    def handle(self, *args, **options):
+        '''generate the graph and report how long each step took'''
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"There are already users named {options['prefix']}*, pick another --prefix.")
+
+        start = perf_counter()
+
+        def log(message):
+            self.stdout.write(f"[{perf_counter() - start:7.1f}s] {message}")
+
+        created = seed.generate(
+            profiles=options['profiles'],
+            posts_per_profile=options['posts'],
+            follows_per_profile=options['follows'],
+            likes_per_post=options['likes'],
+            comments_per_post=options['comments'],
+            seed=options['seed'],
+            alpha=options['alpha'],
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+            log=log,
+        )
+
+        summary = ', '.join(f"{rows} {model}" for model, rows in created.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {summary} in {perf_counter() - start:.1f}s."))
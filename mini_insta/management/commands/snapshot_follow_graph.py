@@ -0,0 +1,34 @@
+# File: snapshot_follow_graph.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/25/2025
+# Description: management command that writes the follow graph snapshot workers memory-map at startup
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mini_insta import graph
+
+
+class Command(BaseCommand):
+    '''Build the follow graph from the database and save it as a snapshot file'''
+
+    help = ("Build the mini_insta follow graph from the Follower table and write it to "
+            "MINI_INSTA_FOLLOW_GRAPH_SNAPSHOT (or --path). Run it periodically, e.g. from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help="where to write the snapshot, instead of the setting")
+
+    def handle(self, *args, **options):
+        '''build the graph and write the snapshot'''
+        path = options['path'] or graph.snapshot_path()
+        if not path:
+            raise CommandError("Set MINI_INSTA_FOLLOW_GRAPH_SNAPSHOT or pass --path.")
+
+        start = perf_counter()
+        follows = graph.FollowGraph.from_database()
+        follows.save(path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(follows.ids)} profiles and {len(follows.targets)} follows to {path} "
+            f"in {perf_counter() - start:.2f}s."
+        ))
@@ -0,0 +1,28 @@
+# File: sync_sqlite_replicas.py
+# Author: Anna LaPrade (alaprade@bu.edu), 12/02/2025
+# Description: management command that copies the primary SQLite database over its replicas, for local development
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mini_insta import routers
+
+
+class Command(BaseCommand):
+    '''Stand in for replication by copying the primary SQLite file to each replica'''
+
+    help = ("Copy the primary SQLite database over every database in MINI_INSTA_REPLICA_DATABASES, "
+            "to try out the primary/replica router locally. Run it again (or from a loop) to "
+            "bring the replicas up to date.")
+
+    def handle(self, *args, **options):
+        '''copy the primary to each replica'''
+        aliases = [routers.primary_database(), *routers.replica_databases()]
+        if len(aliases) == 1:
+            raise CommandError("MINI_INSTA_REPLICA_DATABASES is empty.")
+        for alias in aliases:
+            if not settings.DATABASES[alias]['ENGINE'].endswith('sqlite3'):
+                raise CommandError(f"{alias} isn't a SQLite database; use the database's own replication.")
+
+        copied = routers.copy_sqlite_database()
+        self.stdout.write(self.style.SUCCESS(f"Copied {aliases[0]} to {', '.join(copied)}."))
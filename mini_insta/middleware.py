@@ -0,0 +1,22 @@
+# File: middleware.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/16/2025
+# Description: middleware for the mini_insta app
+
+from django.utils.functional import SimpleLazyObject
+
+from .viewer import get_viewer
+
+
+class ViewerMiddleware:
+    '''Set request.viewer (a ViewerContext) and request.profile (the logged-in Profile)
+    on every request. Nothing is queried until a view or template uses them.
+
+    Goes after AuthenticationMiddleware in MIDDLEWARE.'''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        viewer = get_viewer(request)
+        request.profile = SimpleLazyObject(lambda: viewer.profile)
+        return self.get_response(request)
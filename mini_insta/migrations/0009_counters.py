@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, fk):
+    counted = (
+        model.objects.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    Profile = apps.get_model('mini_insta', 'Profile')
+    Post = apps.get_model('mini_insta', 'Post')
+    Follower = apps.get_model('mini_insta', 'Follower')
+    Like = apps.get_model('mini_insta', 'Like')
+    Comment = apps.get_model('mini_insta', 'Comment')
+
+    Profile.objects.update(
+        follower_count=count_of(Follower, 'profile'),
+        following_count=count_of(Follower, 'follower_profile'),
+    )
+    Post.objects.update(
+        like_count=count_of(Like, 'post'),
+        comment_count=count_of(Comment, 'post'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0008_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:39
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, fk):
+    counted = (
+        model.objects.filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted), Value(0))
+
+
+def delete_duplicates(model, fields):
+    '''Keep the oldest row for each combination of fields and delete the rest'''
+    duplicates = (
+        model.objects.values(*fields)
+        .order_by()
+        .annotate(keep=Min('pk'), rows=Count('pk'))
+        .filter(rows__gt=1)
+    )
+    deleted = 0
+    for group in duplicates.iterator():
+        keep = group.pop('keep')
+        group.pop('rows')
+        deleted += model.objects.filter(**group).exclude(pk=keep).delete()[0]
+    return deleted
+
+
+def dedupe(apps, schema_editor):
+    Profile = apps.get_model('mini_insta', 'Profile')
+    Post = apps.get_model('mini_insta', 'Post')
+    Follower = apps.get_model('mini_insta', 'Follower')
+    Like = apps.get_model('mini_insta', 'Like')
+
+    if delete_duplicates(Follower, ['profile', 'follower_profile']):
+        Profile.objects.update(
+            follower_count=count_of(Follower, 'profile'),
+            following_count=count_of(Follower, 'follower_profile'),
+        )
+    if delete_duplicates(Like, ['post', 'profile']):
+        Post.objects.update(like_count=count_of(Like, 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0009_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='follower',
+            index=models.Index(fields=['profile', '-timestamp'], name='follower_profile_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follower',
+            index=models.Index(fields=['follower_profile', '-timestamp'], name='follower_following_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['post', '-timestamp'], name='like_post_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['profile', '-timestamp'], name='post_profile_time_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follower',
+            constraint=models.UniqueConstraint(fields=('profile', 'follower_profile'), name='unique_follower'),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('post', 'profile'), name='unique_like'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+# FTS5 tables for SearchView, only created on SQLite (other databases fall back to icontains)
+TABLES = [
+    ('mini_insta_post_fts', 'mini_insta_post', ['caption']),
+    ('mini_insta_profile_fts', 'mini_insta_profile', ['username', 'display_name', 'bio_text']),
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, source, columns in TABLES:
+        column_list = ', '.join(columns)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+            f"{column_list}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {table} (rowid, {column_list}) SELECT id, {column_list} FROM {source}"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, source, columns in TABLES:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0010_hot_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0017_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-timestamp'], name='comment_post_time_idx'),
+        ),
+    ]
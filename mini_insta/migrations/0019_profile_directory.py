@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:30
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mini_insta', '0018_comment_post_time_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(django.db.models.functions.text.Lower('username'), models.F('id'), name='profile_username_idx'),
+        ),
+    ]
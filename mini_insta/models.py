@@ -3,10 +3,22 @@
 # Description: the models and their attributes for the mini_insta app
 
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User # for authentication1
+from .pagination import keyset_page
+from .storage import photo_storage
 
 # Create your models here.
 
+# default manager for the models that are soft deleted
+class LiveManager(models.Manager):
+    '''Manager that leaves out rows with deleted_at set'''
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 # mini-insta profile model 
 class Profile(models.Model):
     '''Encapsulate the data of a Profile by an user.'''
@@ -19,6 +31,25 @@ class Profile(models.Model):
     join_date = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    # denormalized counts, kept up to date by the follow views (see counters.py)
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+    # set when the profile is deleted; it's hidden at once and removed later (see reaper.py)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    # objects leaves out deleted profiles, all_objects doesn't
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            # the few deleted profiles waiting for the reaper
+            models.Index(fields=['deleted_at'], name='profile_deleted_idx', condition=Q(deleted_at__isnull=False)),
+            # the home page directory, in alphabetical order (see directory.py)
+            models.Index(Lower('username'), 'id', name='profile_username_idx'),
+        ]
+
     # get all Posts associated with a Profile
     def get_all_posts(self):
         '''Return a QuerySet of Posts on this Profile'''
@@ -26,41 +57,63 @@ class Profile(models.Model):
         return posts
     
     # gets all Followers associated with a Profile 
-    def get_followers(self):
-        ''' Returns list of followers associated with this profile '''
-        follower_query = Follower.objects.filter(profile=self)
-        followers = [follower.follower_profile for follower in follower_query]
+    def get_followers(self, viewer=None):
+        ''' Returns a QuerySet of the Profiles following this profile, latest follow first.
 
-        return followers
+        Each is annotated with followed_at, viewer_follows (does viewer, a Profile or
+        None, follow them) and mutual (does this profile follow them back).'''
+        return Profile.objects.filter(follower_profile__profile=self).annotate(
+            followed_at=F('follower_profile__timestamp'),
+            viewer_follows=_viewer_follows(viewer),
+            mutual=Exists(Follower.objects.filter(profile=OuterRef('pk'), follower_profile=self)),
+        ).order_by('-followed_at', '-pk')
     
     # gets the number of Followers associated with a Profile 
     def get_num_followers(self):
         '''Returns the number of Followers associated with a profile'''
-        return Follower.objects.filter(profile=self).count()
+        return self.follower_count
     
     # gets all Profiles another Profile follows 
-    def get_following(self):
-        ''' Returns list of followed profies associated with this profile '''
-        following_query = Follower.objects.filter(follower_profile=self)
-        following = [follows.profile for follows in following_query]
+    def get_following(self, viewer=None):
+        ''' Returns a QuerySet of the Profiles this profile follows, latest follow first.
+
+        Each is annotated with followed_at, viewer_follows (does viewer, a Profile or
+        None, follow them) and mutual (do they follow this profile back).'''
+        return Profile.objects.filter(profile__follower_profile=self).annotate(
+            followed_at=F('profile__timestamp'),
+            viewer_follows=_viewer_follows(viewer),
+            mutual=Exists(Follower.objects.filter(profile=self, follower_profile=OuterRef('pk'))),
+        ).order_by('-followed_at', '-pk')
 
-        return following
+    # one page of either list, for the followers/following pages
+    def get_followers_page(self, viewer=None, cursor=None, per_page=50):
+        '''Returns (profiles, next_cursor) for the page of get_followers() after cursor'''
+        return keyset_page(self.get_followers(viewer), cursor, per_page, order='-followed_at')
+
+    def get_following_page(self, viewer=None, cursor=None, per_page=50):
+        '''Returns (profiles, next_cursor) for the page of get_following() after cursor'''
+        return keyset_page(self.get_following(viewer), cursor, per_page, order='-followed_at')
     
     # gets the number all Profiles another Profile follows 
     def get_num_following(self):
         '''Returns the number of followed profiles associated with a profile'''
-        return Follower.objects.filter(follower_profile=self).count()
+        return self.following_count
 
     # gets the feed for a particular Profile
     def get_post_feed(self):
-        following_profiles = self.get_following() + [self]
+        '''Returns a QuerySet of Posts by this profile and everyone it follows'''
+
+        # subquery instead of a python list, so this stays one query
+        following_ids = Follower.objects.filter(follower_profile=self).values('profile')
 
-        # if they're aren't any, return none
-        if not following_profiles:
-            return Post.objects.none()
-        
         # newest first
-        return Post.objects.filter(profile__in=following_profiles).order_by('-timestamp')
+        return Post.objects.filter(Q(profile__in=following_ids) | Q(profile=self)).order_by('-timestamp')
+
+    # one page of the feed, for the feed page and infinite scroll
+    def get_post_feed_page(self, cursor=None, per_page=20):
+        '''Returns (posts, next_cursor) for the page of the feed after cursor,
+        keyed on (timestamp, id) so every page costs the same'''
+        return keyset_page(self.get_post_feed().for_feed(self), cursor, per_page)
 
     
     # string formatting
@@ -69,6 +122,64 @@ class Profile(models.Model):
         return f'{self.display_name}, username: {self.username}'
     
 
+# whether the viewer follows each profile in a list, for the follow buttons and badges
+def _viewer_follows(viewer):
+    '''Return an expression that's True for profiles viewer (a Profile or None) follows'''
+    if viewer is None:
+        return Value(False)
+    return Exists(Follower.objects.filter(profile=OuterRef('pk'), follower_profile=viewer))
+
+
+# how many of its newest comments a post card shows; the post page pages through the rest
+FEED_COMMENTS = 3
+
+
+# custom QuerySet for Posts, so pages that list posts don't run queries per post
+class PostQuerySet(models.QuerySet):
+    '''QuerySet with helpers for loading Posts in bulk'''
+
+    # everything a post card needs, in a fixed number of queries
+    def for_feed(self, viewer=None, photos=True, comments=True):
+        '''Return these Posts with their profile joined, photos and newest
+        FEED_COMMENTS comments prefetched, and the latest liker and viewer's like state annotated.
+        Pass photos=False or comments=False to skip a prefetch nobody will read.'''
+
+        prefetches = []
+        if photos:
+            prefetches.append(Prefetch(
+                'photo_set',
+                queryset=Photo.objects.order_by('-timestamp'),
+                to_attr='feed_photos',
+            ))
+        if comments:
+            # just the newest few per post, picked for the whole page by one windowed query
+            prefetches.append(Prefetch(
+                'comment_set',
+                queryset=Comment.objects.select_related('profile').filter(
+                    profile__deleted_at__isnull=True,
+                ).order_by('-timestamp', '-pk')[:FEED_COMMENTS],
+                to_attr='feed_comments',
+            ))
+
+        # username of the most recent liker, for the "Liked by" summary
+        latest_like = Like.objects.filter(post=OuterRef('pk'), profile__deleted_at__isnull=True).order_by('-timestamp')
+
+        # guests (or users without a profile) haven't liked anything
+        if viewer is not None:
+            liked = Exists(Like.objects.filter(post=OuterRef('pk'), profile=viewer))
+        else:
+            liked = Value(False)
+
+        return self.select_related('profile').prefetch_related(*prefetches).annotate(
+            latest_liker=Subquery(latest_like.values('profile__username')[:1]),
+            liked_by_viewer=liked,
+        )
+
+
+class LivePostManager(LiveManager.from_queryset(PostQuerySet)):
+    '''LiveManager with the PostQuerySet helpers'''
+
+
 # mini-insta post model, one profile to many posts
 class Post(models.Model):
     '''Encapsulate the idea of a Post on a Profile'''
@@ -78,6 +189,29 @@ class Post(models.Model):
     timestamp = models.DateTimeField(auto_now=True)
     caption = models.TextField(blank=False)
 
+    # denormalized counts, kept up to date by the like/comment views (see counters.py)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    # bumped whenever anything shown on the post's card changes (see fragments.py)
+    version = models.PositiveIntegerField(default=1)
+    modified = models.DateTimeField(null=True, blank=True) # when version was last bumped
+
+    # set when the post is deleted; it's hidden at once and removed later (see reaper.py)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    # objects leaves out deleted posts, all_objects doesn't
+    objects = LivePostManager()
+    all_objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # a profile's posts, newest first
+            models.Index(fields=['profile', '-timestamp'], name='post_profile_time_idx'),
+            # the few deleted posts waiting for the reaper
+            models.Index(fields=['deleted_at'], name='post_deleted_idx', condition=Q(deleted_at__isnull=False)),
+        ]
+
     # get all photos associated with a Post
     def get_all_photos(self):
         '''Return a QuerySet of Posts on this Profile'''
@@ -89,6 +223,12 @@ class Post(models.Model):
         '''Return a QuerySet of comments on this Profile'''
         comments = Comment.objects.filter(post=self).order_by('-timestamp')
         return comments
+
+    # one page of the comments, newest first, for the post page and its "older comments" link
+    def get_comments_page(self, cursor=None, per_page=20):
+        '''Return (comments, next_cursor) for the page of this Post's comments after cursor'''
+        comments = Comment.objects.filter(post=self, profile__deleted_at__isnull=True).select_related('profile')
+        return keyset_page(comments, cursor, per_page)
     
     # get all likes associated with a Post
     def get_all_likes(self):
@@ -99,7 +239,14 @@ class Post(models.Model):
     # get the number of likes associated with a Post
     def get_like_count(self):
         """Return the number of likes for this post."""
-        return Like.objects.filter(post=self).count()
+        return self.like_count
+
+    # first photo, using the prefetched photos when for_feed() loaded them
+    def get_first_photo(self):
+        '''Return the newest Photo of this Post, or None'''
+        if hasattr(self, 'feed_photos'):
+            return self.feed_photos[0] if self.feed_photos else None
+        return self.get_all_photos().first()
     
 
     # string representation of a Post
@@ -116,7 +263,12 @@ class Photo(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     image_url = models.URLField(blank=True)
     timestamp = models.DateTimeField(auto_now=True)
-    image_file = models.ImageField(blank=True)
+    image_file = models.ImageField(blank=True, storage=photo_storage)
+
+    # filled in by the image pipeline (see images.py) once the upload is processed
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True) # size name -> storage path
     
     # string representation of a Photo
     def __str__(self):
@@ -129,12 +281,14 @@ class Photo(models.Model):
 
         return f'Photo for "{self.post.caption}" - {image_source}'
 
-    # get the image URL
-    def get_image_url(self):
-        '''Returns the URL of the image. '''
+    # get the image URL, optionally a downscaled variant like 'small'
+    def get_image_url(self, size=None):
+        '''Returns the URL of the image, or of its size variant once it's been generated. '''
 
         if self.image_url:
             return self.image_url
+        elif size and size in self.variants:
+            return self.image_file.storage.url(self.variants[size])
         elif self.image_file:
             return self.image_file.url
         else:
@@ -151,6 +305,17 @@ class Follower(models.Model):
     follower_profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="follower_profile")
     timestamp = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # one follow per pair, also the index for "does A follow B"
+            models.UniqueConstraint(fields=['profile', 'follower_profile'], name='unique_follower'),
+        ]
+        indexes = [
+            # followers/following lists in follow order
+            models.Index(fields=['profile', '-timestamp'], name='follower_profile_time_idx'),
+            models.Index(fields=['follower_profile', '-timestamp'], name='follower_following_time_idx'),
+        ]
+
     # string representation of a Follower
     def __str__(self):
         ''' return a string representation of this Follower instance '''
@@ -166,6 +331,12 @@ class Comment(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now=True)
     text = models.TextField(blank=False)
+
+    class Meta:
+        indexes = [
+            # a post's comments, newest first
+            models.Index(fields=['post', '-timestamp'], name='comment_post_time_idx'),
+        ]
     
     # string representation of a Comment
     def __str__(self):
@@ -181,10 +352,93 @@ class Like(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # one like per profile per post, also the index for "did A like this"
+            models.UniqueConstraint(fields=['post', 'profile'], name='unique_like'),
+        ]
+        indexes = [
+            # a post's likes, newest first
+            models.Index(fields=['post', '-timestamp'], name='like_post_time_idx'),
+        ]
+
     # string representation of a Like
     def __str__(self):
         ''' return a string representation of this Comment instance '''
         return f'{self.profile.username} liked {self.post.caption} on {self.timestamp}'
 
 
-    
\ No newline at end of file
+    
+
+# materialized home timeline, one row per post in a profile's feed
+class FeedEntry(models.Model):
+    '''Encapsulate the idea of a Post appearing in a Profile's feed'''
+
+    # data attributes for the FeedEntry, timestamp is copied from the Post so
+    # reading a feed page never has to look at the Post table to order it
+    owner = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="feed_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    timestamp = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-timestamp', '-post'], name='feed_entry_owner_time_idx'),
+        ]
+
+    # string representation of a FeedEntry
+    def __str__(self):
+        ''' return a string representation of this FeedEntry instance '''
+        return f'{self.post_id} in the feed of {self.owner_id}'
+
+
+# one stored media file, shared by every upload with the same contents
+class MediaBlob(models.Model):
+    '''Encapsulate the idea of a stored file, named by the hash of its contents'''
+
+    # data attributes for the MediaBlob, ref_count is the number of files pointing at it
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    # string representation of a MediaBlob
+    def __str__(self):
+        ''' return a string representation of this MediaBlob instance '''
+        return f'{self.name} ({self.ref_count} references)'
+
+
+# a post's trending score, kept up to date as it's liked and commented on (see trending.py)
+class TrendingScore(models.Model):
+    '''Encapsulate the idea of how much engagement a Post has had lately'''
+
+    # data attributes for the TrendingScore, score is relative to TrendingEpoch.start
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            # the trending page, highest score first
+            models.Index(fields=['-score', '-post'], name='trending_score_idx'),
+        ]
+
+    # string representation of a TrendingScore
+    def __str__(self):
+        ''' return a string representation of this TrendingScore instance '''
+        return f'{self.post_id} scores {self.score:.3f}'
+
+
+# the moment every TrendingScore is measured from, moved forward by trending.renormalize()
+class TrendingEpoch(models.Model):
+    '''Encapsulate the idea of the reference time of the trending scores (there's only one row)'''
+
+    # data attributes for the TrendingEpoch
+    start = models.DateTimeField()
+
+    # string representation of a TrendingEpoch
+    def __str__(self):
+        ''' return a string representation of this TrendingEpoch instance '''
+        return f'trending scores measured from {self.start}'
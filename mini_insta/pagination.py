@@ -0,0 +1,94 @@
+# File: pagination.py
+# Author: Anna LaPrade (alaprade@bu.edu), 10/28/2025
+# Description: keyset (cursor) pagination helpers for the mini_insta app
+
+import base64
+
+from django.core.exceptions import BadRequest, FieldDoesNotExist
+from django.db.models import Q
+
+
+# keyset pagination: each page filters on "strictly after the last row we showed"
+# instead of using OFFSET, so page N costs the same as page 1.
+
+
+# turn the ordering values of the last row on a page into an opaque string
+def encode_cursor(value, pk):
+    '''Return a url-safe cursor string for a (value, pk) pair'''
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = f'{value}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# turn a cursor string back into raw (value, pk) strings
+def decode_cursor(cursor):
+    '''Return the (value, pk) pair stored in a cursor, raising BadRequest if it is garbage'''
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return value, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequest('Invalid cursor.')
+
+
+# find the model field behind an ordering like '-timestamp' or 'profile__username'
+def _resolve_field(model, path):
+    '''Return the model field at the end of a (possibly related) field path, or None'''
+    field = None
+    for name in path.split('__'):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        model = field.related_model or model
+    return field
+
+
+# read the ordering value off a row, following related fields if needed
+def _row_value(row, path):
+    '''Return the value of a (possibly related or annotated) field path on row'''
+    value = row
+    for name in path.split('__'):
+        value = getattr(value, name)
+    return value
+
+
+# one page of a queryset, ordered by a single field with a unique tie breaker
+def keyset_page(queryset, cursor=None, per_page=20, order='-timestamp', tiebreak='pk'):
+    '''Return (rows, next_cursor) for the page of queryset after cursor.
+
+    order is a single field name, with a leading '-' for descending.
+    tiebreak is a unique integer field used to order rows with equal values.
+    next_cursor is None on the last page.'''
+
+    descending = order.startswith('-')
+    path = order.lstrip('-')
+    tiebreak_order = f'-{tiebreak}' if descending else tiebreak
+    queryset = queryset.order_by(order, tiebreak_order)
+
+    if cursor:
+        raw_value, pk = decode_cursor(cursor)
+
+        # convert the cursor text back into the field's python type
+        field = _resolve_field(queryset.model, path)
+        try:
+            value = field.to_python(raw_value) if field is not None else raw_value
+        except Exception:
+            raise BadRequest('Invalid cursor.')
+
+        # rows strictly after (value, pk) in the page order
+        after = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{path}__{after}': value}) |
+            Q(**{path: value, f'{tiebreak}__{after}': pk})
+        )
+
+    # fetch one extra row to learn whether there's another page
+    rows = list(queryset[:per_page + 1])
+    if len(rows) <= per_page:
+        return rows, None
+
+    rows = rows[:per_page]
+    last = rows[-1]
+    return rows, encode_cursor(_row_value(last, path), _row_value(last, tiebreak))
@@ -0,0 +1,210 @@
+# File: reaper.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/28/2025
+# Description: soft deletes for posts and profiles, and the reaper that removes them in small batches
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import counters, directory, fragments, routers, timeline
+from .models import Comment, FeedEntry, Follower, Like, Photo, Post, Profile
+
+logger = logging.getLogger('mini_insta.reaper')
+
+
+# deleting a popular post (or a whole profile) in one go means deleting thousands
+# of likes, comments, follows and feed entries in one request. instead a delete
+# just sets deleted_at, which the default managers (Post.objects, Profile.objects)
+# filter out, so the content disappears at once. the reaper then removes what
+# points at it a batch at a time, each batch in its own short transaction, fixes
+# up the counters it affected, deletes the media files, and finally deletes the
+# row itself. a reaper that's interrupted just carries on where it stopped.
+
+# what points at a deleted post: (model, fk to the post)
+POST_DEPENDENTS = [
+    (Like, 'post'),
+    (Comment, 'post'),
+    (FeedEntry, 'post'),
+    (Photo, 'post'),
+]
+
+# what points at a deleted profile, once its posts are gone: (model, fk to the
+# profile, fk to the row whose counters need fixing, or None)
+PROFILE_DEPENDENTS = [
+    (Like, 'profile', 'post'),
+    (Comment, 'profile', 'post'),
+    (Follower, 'follower_profile', 'profile'),
+    (Follower, 'profile', 'follower_profile'),
+    (FeedEntry, 'owner', None),
+]
+
+
+def batch_size():
+    '''Return how many rows the reaper deletes per transaction'''
+    return getattr(settings, 'MINI_INSTA_REAPER_BATCH_SIZE', 500)
+
+
+# the delete views (and admin) call these
+def delete_post(post):
+    '''Hide post now and queue it for the reaper'''
+    with transaction.atomic():
+        Post.all_objects.filter(pk=post.pk).update(deleted_at=timezone.now())
+        fragments.bump_version(post)
+        schedule()
+
+
+def delete_profile(profile):
+    '''Hide profile and all its posts now, stop its user logging in, and queue it all for the reaper'''
+    now = timezone.now()
+    with transaction.atomic():
+        Profile.all_objects.filter(pk=profile.pk).update(deleted_at=now)
+        Post.all_objects.filter(profile=profile, deleted_at__isnull=True).update(deleted_at=now)
+        User.objects.filter(pk=profile.user_id).update(is_active=False)
+        directory.invalidate_on_commit()
+        schedule()
+
+
+# files are only deleted once the rows pointing at them are, so a rollback can't lose one
+def _media_names(photos):
+    '''Return the storage names of the files (originals and variants) of photos'''
+    names = []
+    for image_file, variants in photos.values_list('image_file', 'variants'):
+        if image_file:
+            names.append(image_file)
+        names.extend((variants or {}).values())
+    return names
+
+
+def _delete_media(names):
+    '''Release each stored file (content-addressed storage only removes unshared ones)'''
+    storage = Photo._meta.get_field('image_file').storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception("couldn't delete media file %s", name)
+
+
+def _delete_batch(model, fk, pk, recount=None, progress=None):
+    '''Delete up to batch_size() rows of model whose fk is pk in one transaction,
+    recounting the counters of the rows their recount fk points at. Returns how many.'''
+    with transaction.atomic():
+        rows = model.objects.filter(**{fk: pk}).order_by('pk')[:batch_size()]
+        batch = list(rows.values_list('pk', flat=True))
+        if not batch:
+            return 0
+
+        batch_rows = model.objects.filter(pk__in=batch)
+        affected = set(batch_rows.values_list(f'{recount}_id', flat=True)) if recount else set()
+        media = _media_names(batch_rows) if model is Photo else []
+
+        batch_rows.delete()
+
+        if affected:
+            target = model._meta.get_field(recount).related_model
+            # profiles losing followers may drop under the fan-out threshold
+            pulled = timeline.fanout_on_read_ids(affected) if target is Profile else set()
+            counters.recount(target, affected)
+            if target is Post:
+                fragments.bump_versions(affected)
+            if pulled:
+                timeline.fan_out_recent(pulled - timeline.fanout_on_read_ids(pulled))
+        if media:
+            transaction.on_commit(lambda: _delete_media(media))
+
+    if progress is not None:
+        progress[model.__name__] = progress.get(model.__name__, 0) + len(batch)
+        progress['media files'] = progress.get('media files', 0) + len(media)
+    return len(batch)
+
+
+def _reap_post(pk, progress):
+    '''Remove a deleted post's dependents, a batch at a time, then the post'''
+    for model, fk in POST_DEPENDENTS:
+        while _delete_batch(model, fk, pk, progress=progress):
+            logger.info("reaping post %s: %s", pk, progress)
+
+    # the rest (its trending score, search index entry) is a row or two
+    Post.all_objects.filter(pk=pk).delete()
+    progress['Post'] = progress.get('Post', 0) + 1
+
+
+def _reap_profile(pk, progress):
+    '''Remove a deleted profile's likes, comments, follows and timeline, then the profile'''
+    for post_pk in Post.all_objects.filter(profile_id=pk).values_list('pk', flat=True):
+        _reap_post(post_pk, progress)
+
+    for model, fk, recount in PROFILE_DEPENDENTS:
+        while _delete_batch(model, fk, pk, recount, progress):
+            logger.info("reaping profile %s: %s", pk, progress)
+
+    Profile.all_objects.filter(pk=pk).delete()
+    progress['Profile'] = progress.get('Profile', 0) + 1
+
+
+def pending():
+    '''Return how many deleted posts and profiles are waiting to be reaped'''
+    return {
+        'posts': Post.all_objects.filter(deleted_at__isnull=False).count(),
+        'profiles': Profile.all_objects.filter(deleted_at__isnull=False).count(),
+    }
+
+
+def reap(limit=None, log=None):
+    '''Remove deleted posts and profiles, oldest deletion first, up to limit of each.
+    Returns {"Model": rows deleted, "media files": files released}.
+
+    log, if given, is called with a line of progress after each post or profile.'''
+    progress = {}
+    log = log or (lambda message: None)
+
+    posts = Post.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at', 'pk')
+    for pk in list(posts.values_list('pk', flat=True)[:limit]):
+        _reap_post(pk, progress)
+        log(f"reaped post {pk}")
+
+    profiles = Profile.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at', 'pk')
+    for pk in list(profiles.values_list('pk', flat=True)[:limit]):
+        _reap_profile(pk, progress)
+        log(f"reaped profile {pk}")
+
+    return progress
+
+
+# one background thread, so reaps never run alongside each other in this process
+_executor = None
+
+
+def _get_executor():
+    '''Return the reaper's executor, creating it the first time'''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mini_insta_reaper')
+    return _executor
+
+
+def _run():
+    '''Reap everything pending, in the background thread'''
+    try:
+        # a replica might not have the latest deletes yet
+        with routers.use_primary():
+            progress = reap()
+        if progress:
+            logger.info("reaped %s", progress)
+    except Exception:
+        # whatever's left is picked up by the next delete or by the reap_deleted command
+        logger.exception("reaping deleted posts and profiles failed")
+    finally:
+        # worker threads open their own connections, don't leak them
+        connections.close_all()
+
+
+def schedule():
+    '''Start reaping in the background once the current transaction commits,
+    unless MINI_INSTA_REAP_IN_BACKGROUND is off (then run the reap_deleted command instead)'''
+    if getattr(settings, 'MINI_INSTA_REAP_IN_BACKGROUND', True):
+        transaction.on_commit(lambda: _get_executor().submit(_run))
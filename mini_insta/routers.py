@@ -0,0 +1,164 @@
+# File: routers.py
+# Author: Anna LaPrade (alaprade@bu.edu), 12/02/2025
+# Description: database router that reads from replicas and writes to the primary, with read-your-writes stickiness
+
+import random
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# with MINI_INSTA_REPLICA_DATABASES set, mini_insta's reads go to one of those
+# databases and its writes to the primary. replicas lag behind, so reads go to the
+# primary instead:
+# - for POSTs and inside transactions on the primary, so a view never reads stale
+#   rows and writes based on them,
+# - for the rest of a request once it has written anything,
+# - and, with StickyPrimaryMiddleware, for MINI_INSTA_REPLICA_STICKY_SECONDS after
+#   a request that wrote, so people always see their own likes and follows. the
+#   middleware remembers that in a cookie, so it works across processes.
+#
+# the primary is always the default database, the one transaction.atomic() opens
+# on, so every transaction block covers the writes inside it. tables from other
+# apps (sessions, auth) stay there too. only requests, through the middleware,
+# read from replicas: management commands, background threads and anything else
+# outside a request read from the primary.
+
+STICKY_COOKIE = 'mini_insta_primary'
+
+# this request (or thread)'s state: 'primary' once it must read from the primary,
+# or the replica it picked. StickyPrimaryMiddleware starts each request at None;
+# outside a request it stays 'primary'
+_route = ContextVar('mini_insta_route', default='primary')
+
+# whether this request has written to the primary
+_wrote = ContextVar('mini_insta_wrote', default=False)
+
+
+def primary_database():
+    '''Return the alias of the database all writes go to'''
+    return DEFAULT_DB_ALIAS
+
+
+def replica_databases():
+    '''Return the aliases of the databases reads can go to'''
+    return list(getattr(settings, 'MINI_INSTA_REPLICA_DATABASES', []))
+
+
+def sticky_seconds():
+    '''Return how long after writing a visitor's reads stay on the primary'''
+    return getattr(settings, 'MINI_INSTA_REPLICA_STICKY_SECONDS', 10)
+
+
+def stick_to_primary():
+    '''Send the rest of this request's (or thread's) reads to the primary'''
+    _route.set('primary')
+
+
+def on_primary():
+    '''Return True if this request's (or thread's) reads are going to the primary'''
+    return _route.get() == 'primary'
+
+
+@contextmanager
+def use_primary():
+    '''Read from the primary inside the block, e.g. in a background job that has
+    to see rows a request only just committed'''
+    token = _route.set('primary')
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+
+class PrimaryReplicaRouter:
+    '''Send mini_insta reads to a replica and writes to the primary.
+
+    Add 'mini_insta.routers.PrimaryReplicaRouter' to DATABASE_ROUTERS.'''
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'mini_insta':
+            return None
+        replicas = replica_databases()
+        primary = primary_database()
+        if not replicas or on_primary() or connections[primary].in_atomic_block:
+            return primary
+
+        # one replica per request, so its pages agree with each other
+        route = _route.get()
+        if route not in replicas:
+            route = random.choice(replicas)
+            _route.set(route)
+        return route
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != 'mini_insta':
+            return None
+        stick_to_primary()
+        _wrote.set(True)
+        return primary_database()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        pool = {primary_database(), *replica_databases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their tables from the primary
+        if db in replica_databases():
+            return False
+        return None
+
+
+class StickyPrimaryMiddleware:
+    '''Keep a visitor's reads on the primary for MINI_INSTA_REPLICA_STICKY_SECONDS
+    after any request of theirs that wrote to it.
+
+    Goes near the top of MIDDLEWARE, before anything that reads mini_insta tables.'''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            sticky = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            sticky = False
+
+        # a request that's going to write reads what it changes from the primary
+        writing = request.method not in ('GET', 'HEAD', 'OPTIONS')
+        route_token = _route.set('primary' if sticky or writing else None)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _route.reset(route_token)
+            _wrote.reset(wrote_token)
+
+        if wrote:
+            seconds = sticky_seconds()
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+# a stand-in for replication when developing with SQLite: copy the primary's file over the replica's
+def copy_sqlite_database(source=None, target=None):
+    '''Copy the whole SQLite database source (by default, the primary) into target
+    (by default, every replica). Returns the aliases copied to.'''
+    source = source or primary_database()
+    targets = [target] if target else replica_databases()
+    for alias in targets:
+        with closing(sqlite3.connect(settings.DATABASES[source]['NAME'])) as primary, \
+                closing(sqlite3.connect(settings.DATABASES[alias]['NAME'])) as replica:
+            primary.backup(replica)
+        # the copy replaced the file under any open connection
+        connections[alias].close()
+    return targets
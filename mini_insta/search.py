@@ -0,0 +1,162 @@
+# File: search.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/06/2025
+# Description: full-text search over posts and profiles, using SQLite FTS5 when it's available
+
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+
+from .models import Post, Profile
+
+
+# each searchable model, the FTS5 table that indexes it, and the indexed columns.
+# the FTS5 rowid is the model's pk, so a match maps straight back to a row.
+INDEXES = {
+    Post: ('mini_insta_post_fts', ['caption']),
+    Profile: ('mini_insta_profile_fts', ['username', 'display_name', 'bio_text']),
+}
+
+
+# whether each database has the FTS5 tables, so we only look once per process
+_available = {}
+
+
+# the index lives next to its model's table, so it's read and written where the router sends that model
+def _connection(model, write=False):
+    '''Return the connection model's rows are read from (or, with write, written to)'''
+    return connections[router.db_for_write(model) if write else router.db_for_read(model)]
+
+
+# the FTS5 tables are created by migration 0011, but only on SQLite
+def fts_available(connection=None):
+    '''Return True if the FTS5 tables exist on connection (by default, the one posts are read from)'''
+    connection = connection or _connection(Post)
+    if connection.vendor != 'sqlite':
+        return False
+
+    name = connection.settings_dict['NAME']
+    if name not in _available:
+        tables = connection.introspection.table_names()
+        _available[name] = all(table in tables for table, columns in INDEXES.values())
+    return _available[name]
+
+
+# turn what the user typed into an FTS5 query: every word must match, as a prefix
+def to_match_query(text):
+    '''Return an FTS5 MATCH expression for text, or None if it has no words'''
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+# keep one object's row in the index up to date
+def index_object(instance):
+    '''Replace instance's row in its FTS5 table'''
+    table, columns = INDEXES[type(instance)]
+    values = [getattr(instance, column) or '' for column in columns]
+    with _connection(type(instance), write=True).cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [instance.pk])
+        cursor.execute(
+            f'INSERT INTO {table} (rowid, {", ".join(columns)}) VALUES (%s{", %s" * len(columns)})',
+            [instance.pk] + values,
+        )
+
+
+def unindex_object(instance):
+    '''Remove instance's row from its FTS5 table'''
+    table, columns = INDEXES[type(instance)]
+    with _connection(type(instance), write=True).cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [instance.pk])
+
+
+# rebuild every FTS5 table from its model's table
+def rebuild():
+    '''Repopulate every FTS5 table, returning {"Model": rows indexed}'''
+    indexed = {}
+    for model, (table, columns) in INDEXES.items():
+        with _connection(model, write=True).cursor() as cursor:
+            column_list = ', '.join(columns)
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(
+                f'INSERT INTO {table} (rowid, {column_list}) '
+                f'SELECT id, {column_list} FROM {model._meta.db_table}'
+            )
+            indexed[model.__name__] = cursor.rowcount
+    return indexed
+
+
+# signal handlers, so saves and deletes from anywhere (views, admin) keep the index in step
+def _saved(sender, instance, **kwargs):
+    if fts_available(_connection(sender, write=True)):
+        index_object(instance)
+
+
+def _deleted(sender, instance, **kwargs):
+    if fts_available(_connection(sender, write=True)):
+        unindex_object(instance)
+
+
+def connect_signals():
+    '''Connect the index-maintenance handlers, called from MiniInstaConfig.ready()'''
+    for model in INDEXES:
+        post_save.connect(_saved, sender=model, dispatch_uid=f'mini_insta_search_save_{model.__name__}')
+        post_delete.connect(_deleted, sender=model, dispatch_uid=f'mini_insta_search_delete_{model.__name__}')
+
+
+# ranked ids for one page of matches
+def search_ids(model, text, page=1, per_page=20):
+    '''Return (ids, has_next) for one page of model rows matching text, best match first'''
+    match = to_match_query(text)
+    if match is None:
+        return [], False
+
+    offset = (page - 1) * per_page
+    connection = _connection(model)
+
+    if fts_available(connection):
+        # BM25 ranking straight from the index, lower is better. soft-deleted rows stay
+        # indexed until they're reaped, so they're left out before paging, not after
+        table, columns = INDEXES[model]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {table}.rowid FROM {table} '
+                f'JOIN {model._meta.db_table} AS live ON live.id = {table}.rowid '
+                f'WHERE {table} MATCH %s AND live.deleted_at IS NULL '
+                f'ORDER BY bm25({table}) LIMIT %s OFFSET %s',
+                [match, per_page + 1, offset],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+    else:
+        # other databases: unranked substring search, newest first
+        table, columns = INDEXES[model]
+        condition = Q()
+        for column in columns:
+            condition |= Q(**{f'{column}__icontains': text})
+        ids = list(
+            model.objects.filter(condition).order_by('-pk')
+            .values_list('pk', flat=True)[offset:offset + per_page + 1]
+        )
+
+    return ids[:per_page], len(ids) > per_page
+
+
+# load the rows for a list of ids, keeping the ranked order
+def _in_order(queryset, ids):
+    '''Return the objects of queryset with these ids, in the order of ids'''
+    by_id = queryset.in_bulk(ids)
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+
+def search_posts(text, viewer=None, page=1, per_page=20):
+    '''Return (posts, has_next) for one page of posts whose caption matches text'''
+    ids, has_next = search_ids(Post, text, page, per_page)
+    return _in_order(Post.objects.for_feed(viewer), ids), has_next
+
+
+def search_profiles(text, page=1, per_page=20):
+    '''Return (profiles, has_next) for one page of profiles matching text'''
+    ids, has_next = search_ids(Profile, text, page, per_page)
+    return _in_order(Profile.objects.all(), ids), has_next
@@ -0,0 +1,173 @@
+# File: seed.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/20/2025
+# Description: generates a large synthetic social graph for load and scale testing
+
+import math
+import random
+from bisect import bisect_left
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import transfer
+from .models import Comment, Follower, Like, Photo, Post, Profile
+
+
+# everything is drawn from one random.Random(seed), in a fixed order, so the same
+# arguments always produce the same graph. popularity follows a power law: profile
+# number i (counting from 1) is 1/i**alpha as popular as the first one, which gives
+# a few celebrities with most of the followers and likes and a long tail with almost none.
+
+WORDS = [
+    'sad', 'emo', 'vibes', 'rain', 'guitar', 'eyeliner', 'midnight', 'black', 'lyrics',
+    'concert', 'coffee', 'moon', 'tears', 'skate', 'poetry', 'fog', 'bridge', 'alone',
+]
+
+
+# writes objects in batches without holding them all in memory
+def _write(model, objects, batch_size):
+    '''bulk_create an iterable of objects in batches, returning the list of new pks'''
+    pks = []
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            pks.extend(created.pk for created in model.objects.bulk_create(batch))
+            batch = []
+    if batch:
+        pks.extend(created.pk for created in model.objects.bulk_create(batch))
+    return pks
+
+
+# the cumulative popularity of the first n ranks, for random.choices
+def power_law_weights(n, alpha):
+    '''Return the cumulative weights of ranks 1..n, where rank i has weight 1/i**alpha'''
+    return list(accumulate(1 / (rank ** alpha) for rank in range(1, n + 1)))
+
+
+# how many of something one profile or post gets, skewed so a few get a lot
+def skewed_count(rng, mean, limit):
+    '''Return a lognormally distributed count with roughly the given mean, at most limit'''
+    if mean <= 0:
+        return 0
+    # a lognormal with sigma 1 has mean exp(mu + 0.5)
+    count = rng.lognormvariate(math.log(mean) - 0.5, 1.0)
+    return min(int(count + rng.random()), limit)
+
+
+# pick k distinct indexes, preferring the popular ones
+def weighted_sample(rng, cum_weights, k):
+    '''Return a set of k distinct indexes into cum_weights, drawn by weight'''
+    n = len(cum_weights)
+    k = min(k, n)
+
+    # near-complete samples would take forever by rejection, and hardly differ from uniform
+    if k > n // 4:
+        return set(rng.sample(range(n), k))
+
+    total = cum_weights[-1]
+    chosen = set()
+    while len(chosen) < k:
+        chosen.add(bisect_left(cum_weights, rng.random() * total))
+    return chosen
+
+
+def generate(profiles=1000, posts_per_profile=5, follows_per_profile=20, likes_per_post=20,
+             comments_per_post=2, seed=0, alpha=1.0, prefix='seed', batch_size=5000, log=None):
+    '''Generate profiles (with Users), a power-law follower graph, posts with photos,
+    likes and comments, and bring the counters, trending scores, search index and timelines up to date.
+    Returns {"Model": rows created}.
+
+    log, if given, is called with a line of progress after each step.'''
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    created = {}
+
+    # hashing is slow on purpose, so every generated user shares one hash of "password"
+    password = make_password('password')
+
+    with transaction.atomic():
+        user_pks = _write(User, (
+            User(username=f'{prefix}{i}', password=password) for i in range(profiles)
+        ), batch_size)
+        profile_pks = _write(Profile, (
+            Profile(user_id=user_pk, username=f'{prefix}{i}', display_name=f'{prefix.title()} {i}',
+                    bio_text=' '.join(rng.choices(WORDS, k=6)))
+            for i, user_pk in enumerate(user_pks)
+        ), batch_size)
+    created['Profile'] = len(profile_pks)
+    log(f"created {len(profile_pks)} profiles")
+
+    popularity = power_law_weights(len(profile_pks), alpha)
+
+    # who follows whom: everyone follows a skewed number of profiles, mostly popular ones
+    def follows():
+        for follower_index, follower_pk in enumerate(profile_pks):
+            count = skewed_count(rng, follows_per_profile, len(profile_pks) - 1)
+            for index in sorted(weighted_sample(rng, popularity, count)):
+                if index != follower_index:
+                    yield Follower(profile_id=profile_pks[index], follower_profile_id=follower_pk)
+
+    with transaction.atomic():
+        created['Follower'] = len(_write(Follower, follows(), batch_size))
+    log(f"created {created['Follower']} follows")
+
+    # posts, with how likeable each one is: popular authors get more likes
+    author_indexes = []
+    for index in range(len(profile_pks)):
+        author_indexes.extend([index] * skewed_count(rng, posts_per_profile, 10 * posts_per_profile + 10))
+    post_weights = [
+        rng.lognormvariate(0, 1) / ((index + 1) ** alpha) for index in author_indexes
+    ]
+
+    with transaction.atomic():
+        post_pks = _write(Post, (
+            Post(profile_id=profile_pks[index], caption=' '.join(rng.choices(WORDS, k=rng.randint(2, 8))))
+            for index in author_indexes
+        ), batch_size)
+        _write(Photo, (
+            Photo(post_id=post_pk, image_url=f'https://picsum.photos/seed/{prefix}{post_pk}/1080/1080')
+            for post_pk in post_pks
+        ), batch_size)
+    created['Post'] = len(post_pks)
+    created['Photo'] = len(post_pks)
+    log(f"created {len(post_pks)} posts")
+
+    # spread total likes/comments over posts by weight, rounding randomly so the totals come out right
+    weight_sum = sum(post_weights) or 1
+
+    def share(total, index):
+        exact = total * post_weights[index] / weight_sum
+        return int(exact) + (rng.random() < exact - int(exact))
+
+    def likes():
+        total = likes_per_post * len(post_pks)
+        for index, post_pk in enumerate(post_pks):
+            count = share(total, index)
+            author = author_indexes[index]
+            for liker in sorted(weighted_sample(rng, popularity, count)):
+                # nobody likes their own post
+                if liker != author:
+                    yield Like(post_id=post_pk, profile_id=profile_pks[liker])
+
+    with transaction.atomic():
+        created['Like'] = len(_write(Like, likes(), batch_size))
+    log(f"created {created['Like']} likes")
+
+    def comments():
+        total = comments_per_post * len(post_pks)
+        for index, post_pk in enumerate(post_pks):
+            for _ in range(share(total, index)):
+                commenter = bisect_left(popularity, rng.random() * popularity[-1])
+                yield Comment(post_id=post_pk, profile_id=profile_pks[commenter],
+                              text=' '.join(rng.choices(WORDS, k=rng.randint(1, 6))))
+
+    with transaction.atomic():
+        created['Comment'] = len(_write(Comment, comments(), batch_size))
+    log(f"created {created['Comment']} comments")
+
+    transfer.rebuild_derived(log)
+
+    return created
@@ -0,0 +1,112 @@
+# File: storage.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/11/2025
+# Description: content-addressed, deduplicated file storage for uploaded photos
+
+import hashlib
+import os
+import threading
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+
+# raised to stop FileSystemStorage._save retrying a blob someone else just wrote
+class _BlobExists(Exception):
+    pass
+
+
+# files are stored once under the sha256 of their contents, with a MediaBlob row
+# counting how many saved files point at each one. saving a file we already have
+# costs a read of the upload (to hash it) and one UPDATE, but no disk writes.
+class ContentAddressedStorage(FileSystemStorage):
+    '''FileSystemStorage that stores each distinct file once, named by its hash'''
+
+    # MediaBlob is looked up lazily because models.py imports this module
+    def _blobs(self):
+        return apps.get_model('mini_insta', 'MediaBlob').objects
+
+    # the blob path for a digest, fanned out so no directory gets huge
+    def blob_name(self, digest, extension):
+        '''Return the storage path for a blob with this digest'''
+        return f'blobs/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    # read the upload chunk by chunk, so memory stays constant however big it is
+    def hash_content(self, content):
+        '''Return (sha256 hex digest, size in bytes) of a File'''
+        sha = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            sha.update(chunk)
+            size += len(chunk)
+        return sha.hexdigest(), size
+
+    # the blob this thread is writing, if any
+    _writing = threading.local()
+
+    # we pick unique names ourselves, so never rename to "name_abc123.png"
+    def get_available_name(self, name, max_length=None):
+        # FileSystemStorage._save asks again if the file appeared while it was writing;
+        # a blob's name is its contents, so stop there instead of retrying forever
+        if getattr(self._writing, 'name', None) == name:
+            raise _BlobExists(name)
+        return name
+
+    def _write_blob(self, name, content):
+        '''Write a new blob's file, treating one another writer got in first with as written'''
+        self._writing.name = name
+        try:
+            super()._save(name, content)
+        except _BlobExists:
+            pass  # the same bytes are already there
+        finally:
+            self._writing.name = None
+
+    def _save(self, name, content):
+        '''Store content under its digest unless we already have it, and count the reference'''
+        digest, size = self.hash_content(content)
+        extension = os.path.splitext(name)[1].lower()
+
+        with transaction.atomic():
+            blob, created = self._blobs().select_for_update().get_or_create(
+                digest=digest,
+                defaults={'name': self.blob_name(digest, extension), 'size': size},
+            )
+
+            # only the first upload of these bytes (or one whose file went missing) is written
+            if not super().exists(blob.name):
+                self._write_blob(blob.name, content)
+
+            self._blobs().filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+        return blob.name
+
+    def delete(self, name):
+        '''Drop one reference to a blob, removing the file when nothing points at it anymore'''
+        with transaction.atomic():
+            blob = self._blobs().select_for_update().filter(name=name).first()
+
+            # files saved before this storage existed aren't reference counted
+            if blob is None:
+                super().delete(name)
+                return
+
+            if blob.ref_count > 1:
+                self._blobs().filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+                return
+
+            blob.delete()
+            super().delete(name)
+
+
+# one shared instance, used as a callable storage so the migration doesn't hardcode it
+_photo_storage = None
+
+
+def photo_storage():
+    '''Return the storage used for Photo.image_file'''
+    global _photo_storage
+    if _photo_storage is None:
+        _photo_storage = ContentAddressedStorage()
+    return _photo_storage
@@ -0,0 +1,50 @@
+# File: mini_insta_extras.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/09/2025
+# Description: template tags and filters for the mini_insta app
+
+from django import template
+
+from mini_insta import fragments
+
+register = template.Library()
+
+
+# {{ photo|image_url:'small' }}, since templates can't pass arguments to methods
+@register.filter
+def image_url(photo, size=None):
+    '''Return the URL of photo's size variant, or the original if it isn't ready yet'''
+    return photo.get_image_url(size)
+
+
+# {% postfragment post 'name' %} ... {% endpostfragment %} caches the enclosed html
+# under the post's version. only put things in it that look the same to every viewer.
+@register.tag
+def postfragment(parser, token):
+    '''Compile a cached, versioned post fragment block'''
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a post and a fragment name")
+
+    nodelist = parser.parse(('endpostfragment',))
+    parser.delete_first_token()
+    return PostFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]))
+
+
+class PostFragmentNode(template.Node):
+    '''Renders its contents once per post version and serves them from the fragment cache after that'''
+
+    def __init__(self, nodelist, post, name):
+        self.nodelist = nodelist
+        self.post = post
+        self.name = name
+
+    def render(self, context):
+        post = self.post.resolve(context)
+        backend = fragments.get_backend()
+        key = fragments.fragment_key(post, self.name.resolve(context))
+
+        html = backend.get(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            backend.set(key, html)
+        return html
@@ -0,0 +1,31 @@
+# File: testing.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/18/2025
+# Description: test helpers for the mini_insta app
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from .instrumentation import get_query_budget
+
+
+class QueryBudgetMixin:
+    '''TestCase mixin for checking views against their declared query_budget'''
+
+    # make a request and fail the test if its view ran more queries than it says it needs
+    def assertWithinQueryBudget(self, url, data=None, method='get', **extra):
+        '''Request url with self.client and return the response, failing if the
+        view ran more queries than its query_budget'''
+        match = resolve(url.split('?')[0])
+        budget = get_query_budget(match)
+        if budget is None:
+            self.fail(f"{match.view_name} doesn't declare a query_budget")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, **extra)
+
+        if len(queries) > budget:
+            listing = '\n'.join(f"{i}. {query['sql']}" for i, query in enumerate(queries, start=1))
+            self.fail(f"{match.view_name} ran {len(queries)} queries, over its budget of {budget}:\n{listing}")
+
+        return response
@@ -1,3 +1,1390 @@
-from django.test import TestCase
+# File: tests.py
+# Author: Anna LaPrade (alaprade@bu.edu), 09/23/2025
+# Description: tests for the mini_insta app
 
-# Create your tests here.
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import *
+from . import benchmark, counters, directory, fragments, graph, images, instrumentation, likebuffer, reaper, routers, search, seed, timeline, transfer, trending
+from .testing import QueryBudgetMixin
+from .views import PostDetailView, PostFeedListView
+from .viewer import ViewerContext
+
+
+# helper to make a User + Profile pair
+def make_profile(username):
+    '''Create and return a Profile (and its User) with the given username'''
+    user = User.objects.create_user(username=username, password='password')
+    return Profile.objects.create(user=user, username=username, display_name=username)
+
+
+# helper to make a Post with a photo, a like and a comment
+def make_post(profile, liker, caption='a post'):
+    '''Create and return a Post on profile that liker has liked and commented on'''
+    post = Post.objects.create(profile=profile, caption=caption)
+    Photo.objects.create(post=post, image_url='https://example.com/photo.png')
+    Like.objects.create(post=post, profile=liker)
+    Comment.objects.create(post=post, profile=liker, text='so emo')
+    counters.liked(post)
+    counters.commented(post)
+    return post
+
+
+class FeedQueryTests(TestCase):
+    '''The feed should load in the same number of queries no matter how many posts it has'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.author = make_profile('author')
+        Follower.objects.create(profile=self.author, follower_profile=self.viewer)
+        self.client.login(username='viewer', password='password')
+
+    # count the queries for one request to a url
+    def count_queries(self, url):
+        '''Return the number of queries run while getting url'''
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_query_count_is_constant(self):
+        make_post(self.author, self.viewer)
+        small = self.count_queries(reverse('show_feed'))
+
+        for i in range(10):
+            make_post(self.author, self.viewer)
+        large = self.count_queries(reverse('show_feed'))
+
+        self.assertEqual(small, large)
+
+    def test_profile_query_count_is_constant(self):
+        make_post(self.author, self.viewer)
+        url = reverse('show_profile', kwargs={'pk': self.author.pk})
+        small = self.count_queries(url)
+
+        for i in range(10):
+            make_post(self.author, self.viewer)
+        large = self.count_queries(url)
+
+        self.assertEqual(small, large)
+
+    def test_feed_annotations(self):
+        post = make_post(self.author, self.viewer)
+        feed_post = self.viewer.get_post_feed().for_feed(self.viewer).get(pk=post.pk)
+
+        self.assertEqual(feed_post.like_count, 1)
+        self.assertEqual(feed_post.latest_liker, 'viewer')
+        self.assertTrue(feed_post.liked_by_viewer)
+        self.assertEqual(len(feed_post.feed_comments), 1)
+        self.assertEqual(feed_post.get_first_photo().image_url, 'https://example.com/photo.png')
+
+
+class FeedPaginationTests(TestCase):
+    '''The feed should be served one keyset page at a time'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        for i in range(25):
+            Post.objects.create(profile=self.viewer, caption=f'post {i}')
+
+    def test_pages_cover_feed_without_overlap(self):
+        first, cursor = self.viewer.get_post_feed_page(per_page=20)
+        second, last_cursor = self.viewer.get_post_feed_page(cursor=cursor, per_page=20)
+
+        self.assertEqual(len(first), 20)
+        self.assertEqual(len(second), 5)
+        self.assertIsNone(last_cursor)
+        self.assertEqual(
+            [post.pk for post in first + second],
+            list(self.viewer.get_post_feed().order_by('-timestamp', '-pk').values_list('pk', flat=True)),
+        )
+
+    def test_fragment_endpoint(self):
+        self.client.login(username='viewer', password='password')
+        first = self.client.get(reverse('show_feed'))
+        cursor = first.context['next_cursor']
+
+        response = self.client.get(reverse('show_feed_page'), {'cursor': cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['posts']), 5)
+        self.assertNotContains(response, '<html>')
+
+    def test_bad_cursor(self):
+        self.client.login(username='viewer', password='password')
+        response = self.client.get(reverse('show_feed_page'), {'cursor': 'nonsense!'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MINI_INSTA_MATERIALIZED_FEED=True)
+class TimelineTests(TestCase):
+    '''The materialized timeline should match the fan-out-on-read feed'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.author = make_profile('author')
+        self.old_post = Post.objects.create(profile=self.author, caption='before following')
+        self.client.login(username='viewer', password='password')
+
+    # post ids in a feed page, in order
+    def feed_ids(self, profile):
+        '''Return the post ids on the first page of profile's feed'''
+        posts, cursor = timeline.get_feed_page(profile, per_page=50)
+        return [post.pk for post in posts]
+
+    def test_follow_post_and_unfollow(self):
+        self.client.post(reverse('follow', kwargs={'pk': self.author.pk}))
+        self.assertEqual(self.feed_ids(self.viewer), [self.old_post.pk])
+
+        new_post = Post.objects.create(profile=self.author, caption='after following')
+        timeline.fan_out_post(new_post)
+        self.assertEqual(self.feed_ids(self.viewer), [new_post.pk, self.old_post.pk])
+        self.assertEqual(self.feed_ids(self.author), [new_post.pk])
+
+        self.client.post(reverse('delete_follow', kwargs={'pk': self.author.pk}))
+        self.assertEqual(self.feed_ids(self.viewer), [])
+
+    @override_settings(MINI_INSTA_FANOUT_FOLLOWER_THRESHOLD=0)
+    def test_popular_profiles_are_pulled_at_read_time(self):
+        self.client.post(reverse('follow', kwargs={'pk': self.author.pk}))
+        self.assertFalse(FeedEntry.objects.filter(owner=self.viewer).exists())
+        self.assertEqual(self.feed_ids(self.viewer), [self.old_post.pk])
+
+    @override_settings(MINI_INSTA_FANOUT_FOLLOWER_THRESHOLD=1, MINI_INSTA_REAP_IN_BACKGROUND=False)
+    def test_profiles_dropping_under_the_threshold_are_fanned_out(self):
+        others = [make_profile('other0'), make_profile('other1')]
+        for follower in [self.viewer, *others]:
+            Follower.objects.create(profile=self.author, follower_profile=follower)
+        counters.reconcile()
+        self.assertFalse(FeedEntry.objects.filter(owner=self.viewer).exists())
+
+        # one unfollow leaves two followers, still pulled at read time
+        self.client.force_login(others[0].user)
+        self.client.post(reverse('delete_follow', kwargs={'pk': self.author.pk}))
+        self.assertFalse(FeedEntry.objects.filter(owner=self.viewer).exists())
+
+        # the reaper removing the other follower takes the author down to the threshold
+        reaper.delete_profile(others[1])
+        reaper.reap()
+        self.assertEqual(list(FeedEntry.objects.filter(owner=self.viewer).values_list('post_id', flat=True)),
+                         [self.old_post.pk])
+        self.assertEqual(self.feed_ids(self.viewer), [self.old_post.pk])
+
+    @override_settings(MINI_INSTA_FANOUT_FOLLOWER_THRESHOLD=1)
+    def test_unfollow_down_to_the_threshold_fans_out(self):
+        other = make_profile('other')
+        for follower in [self.viewer, other]:
+            Follower.objects.create(profile=self.author, follower_profile=follower)
+        counters.reconcile()
+
+        self.client.force_login(other.user)
+        self.client.post(reverse('delete_follow', kwargs={'pk': self.author.pk}))
+        self.assertTrue(FeedEntry.objects.filter(owner=self.viewer, post=self.old_post).exists())
+
+    def test_rebuild_matches_fan_out_on_read(self):
+        Follower.objects.create(profile=self.author, follower_profile=self.viewer)
+        for i in range(5):
+            Post.objects.create(profile=self.viewer, caption=f'mine {i}')
+        timeline.rebuild()
+
+        expected, cursor = self.viewer.get_post_feed_page(per_page=50)
+        self.assertEqual(self.feed_ids(self.viewer), [post.pk for post in expected])
+
+
+class CounterTests(TestCase):
+    '''The denormalized counts should follow the follow/like views and be repairable'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.author = make_profile('author')
+        self.post = Post.objects.create(profile=self.author, caption='a post')
+        self.client.login(username='viewer', password='password')
+
+    def test_views_keep_counts(self):
+        self.client.post(reverse('follow', kwargs={'pk': self.author.pk}))
+        self.client.post(reverse('follow', kwargs={'pk': self.author.pk}))
+        self.client.post(reverse('like', kwargs={'pk': self.post.pk}))
+        self.client.post(reverse('create_comment', kwargs={'pk': self.post.pk}), {'text': 'hi'})
+
+        self.author.refresh_from_db()
+        self.viewer.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual((self.author.follower_count, self.viewer.following_count), (1, 1))
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+
+        self.client.post(reverse('delete_follow', kwargs={'pk': self.author.pk}))
+        self.client.post(reverse('delete_like', kwargs={'pk': self.post.pk}))
+
+        self.author.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(self.author.follower_count, 0)
+        self.assertEqual(self.post.like_count, 0)
+
+    def test_reconcile_repairs_drift(self):
+        Follower.objects.create(profile=self.author, follower_profile=self.viewer)
+        Like.objects.create(post=self.post, profile=self.viewer)
+        Profile.objects.filter(pk=self.viewer.pk).update(follower_count=7)
+
+        repaired = counters.reconcile()
+
+        self.assertEqual(repaired['Profile.follower_count'], 2)
+        self.assertEqual(repaired['Post.like_count'], 1)
+        self.author.refresh_from_db()
+        self.viewer.refresh_from_db()
+        self.assertEqual((self.author.follower_count, self.viewer.follower_count), (1, 0))
+        self.assertEqual(counters.reconcile(), dict.fromkeys(repaired, 0))
+
+
+class IndexTests(TestCase):
+    '''The hot relationship tables should be unique and indexed'''
+
+    def test_duplicate_follow_is_rejected(self):
+        viewer = make_profile('viewer')
+        author = make_profile('author')
+        Follower.objects.create(profile=author, follower_profile=viewer)
+        with self.assertRaises(IntegrityError):
+            Follower.objects.create(profile=author, follower_profile=viewer)
+
+    def test_hot_queries_use_indexes(self):
+        make_post(make_profile('author'), make_profile('viewer'))
+        call_command('explain_hot_queries', strict=True, repeat=1, stdout=StringIO())
+
+
+class SearchTests(TestCase):
+    '''Search should use the full-text index and keep it in step with saves and deletes'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.sad = Post.objects.create(profile=self.viewer, caption='sad sad sad poetry night')
+        self.poem = Post.objects.create(profile=self.viewer, caption='a poem about rain')
+
+    # post ids matching text
+    def post_ids(self, text):
+        '''Return the ids of the posts on the first page of results for text'''
+        posts, has_next = search.search_posts(text, self.viewer)
+        return [post.pk for post in posts]
+
+    def test_prefix_match_and_ranking(self):
+        news = Post.objects.create(profile=self.viewer, caption='sad news for poetry night')
+
+        self.assertTrue(search.fts_available())
+        self.assertEqual(set(self.post_ids('poe')), {self.sad.pk, self.poem.pk, news.pk})
+        self.assertEqual(self.post_ids('sad'), [self.sad.pk, news.pk])
+        self.assertEqual(self.post_ids('"); DROP'), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.poem.caption = 'a song about rain'
+        self.poem.save()
+        self.assertEqual(self.post_ids('song'), [self.poem.pk])
+
+        self.poem.delete()
+        self.assertEqual(self.post_ids('rain'), [])
+
+    def test_search_view_pages(self):
+        for i in range(25):
+            Post.objects.create(profile=self.viewer, caption=f'midnight {i}')
+        self.client.login(username='viewer', password='password')
+
+        response = self.client.get(reverse('search'), {'query': 'midnight'})
+        self.assertEqual(len(response.context['posts']), 20)
+        self.assertEqual(response.context['next_page'], 2)
+
+        response = self.client.get(reverse('search'), {'query': 'midnight', 'page': 2})
+        self.assertEqual(len(response.context['posts']), 5)
+        self.assertIsNone(response.context['next_page'])
+        self.assertEqual([p.pk for p in response.context['matching_profiles']], [])
+
+    def test_soft_deleted_posts_are_left_out_before_paging(self):
+        posts = [Post.objects.create(profile=self.viewer, caption=f'midnight {i}') for i in range(3)]
+        reaper.delete_post(posts[0])
+
+        page, has_next = search.search_posts('midnight', self.viewer, per_page=2)
+        self.assertEqual(len(page), 2)
+        self.assertFalse(has_next)
+        self.assertNotIn(posts[0].pk, [post.pk for post in page])
+
+
+class PhotoVariantTests(TestCase):
+    '''Uploaded photos should get downscaled variants recorded on the model'''
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        make_profile('viewer')
+        self.client.login(username='viewer', password='password')
+
+    # a png upload of the given size
+    def upload(self, width, height):
+        '''Return an uploaded png file of width x height pixels'''
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'black').save(buffer, 'PNG')
+        return SimpleUploadedFile('emo.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_generates_variants(self):
+        with self.settings(MEDIA_ROOT=self.media_root, MINI_INSTA_IMAGE_SYNC=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('create_post'), {
+                    'caption': 'so dark',
+                    'image_files': [self.upload(800, 400)],
+                })
+
+            photo = Photo.objects.get()
+            self.assertEqual((photo.width, photo.height), (800, 400))
+            self.assertEqual(set(photo.variants), {'small', 'medium'})
+
+            with Image.open(photo.image_file.storage.path(photo.variants['small'])) as small:
+                self.assertEqual(small.size, (320, 160))
+            self.assertNotEqual(photo.get_image_url('small'), photo.image_file.url)
+            self.assertEqual(photo.get_image_url('large'), photo.image_file.url)
+
+    def test_duplicate_uploads_share_one_blob(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            for caption in ['first', 'again']:
+                self.client.post(reverse('create_post'), {
+                    'caption': caption,
+                    'image_files': [self.upload(100, 100)],
+                })
+
+            first, second = Photo.objects.order_by('pk')
+            self.assertEqual(first.image_file.name, second.image_file.name)
+            self.assertTrue(first.image_file.name.startswith('blobs/'))
+            self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+            storage = first.image_file.storage
+            storage.delete(first.image_file.name)
+            self.assertTrue(storage.exists(second.image_file.name))
+            self.assertEqual(MediaBlob.objects.get().ref_count, 1)
+
+            storage.delete(second.image_file.name)
+            self.assertFalse(storage.exists(second.image_file.name))
+            self.assertFalse(MediaBlob.objects.exists())
+
+    def test_blob_written_by_someone_else_first_counts_as_saved(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            storage = photo_storage()
+            name = storage.save('emo.png', self.upload(50, 50))
+
+            # the other writer created the file between our exists() check and our write
+            with patch('django.core.files.storage.FileSystemStorage.exists', return_value=False):
+                self.assertEqual(storage.save('again.png', self.upload(50, 50)), name)
+            self.assertEqual(MediaBlob.objects.get().ref_count, 2)
+
+    def test_failed_background_jobs_are_logged(self):
+        future = Future()
+        future.set_exception(OSError("truncated image"))
+        with self.assertLogs('mini_insta.images', 'ERROR') as logs:
+            images._log_failure(7)(future)
+        self.assertIn('photo 7', logs.output[0])
+        self.assertIn('truncated image', logs.output[0])
+
+
+class FragmentCacheTests(TestCase):
+    '''Post cards should be cached per version and shared between viewers'''
+
+    def setUp(self):
+        fragments.get_backend().clear()
+        self.viewer = make_profile('viewer')
+        self.author = make_profile('author')
+        Follower.objects.create(profile=self.author, follower_profile=self.viewer)
+        self.post = Post.objects.create(profile=self.author, caption='cached caption')
+
+    def test_lru_backend_evicts_oldest(self):
+        backend = fragments.LRUBackend(max_entries=2)
+        backend.set('a', 'A')
+        backend.set('b', 'B')
+        backend.get('a')
+        backend.set('c', 'C')
+        self.assertEqual((backend.get('a'), backend.get('b'), backend.get('c')), ('A', None, 'C'))
+
+    def test_like_bumps_version_and_button_stays_per_viewer(self):
+        self.client.login(username='viewer', password='password')
+        response = self.client.get(reverse('show_feed'))
+        self.assertContains(response, 'No likes yet')
+        self.assertContains(response, '>Like</button>')
+
+        # a cached card is served even if the database changes behind its back...
+        Post.objects.filter(pk=self.post.pk).update(caption='changed quietly')
+        self.assertContains(self.client.get(reverse('show_feed')), 'cached caption')
+
+        # ...but liking bumps the version, so the card is rendered again
+        self.client.post(reverse('like', kwargs={'pk': self.post.pk}))
+        response = self.client.get(reverse('show_feed'))
+        self.assertContains(response, 'changed quietly')
+        self.assertContains(response, 'Liked by')
+        self.assertContains(response, '>Unlike</button>')
+
+        # the author sees the same cached card, without a like button
+        self.client.login(username='author', password='password')
+        response = self.client.get(reverse('show_feed'))
+        self.assertContains(response, 'Liked by')
+        self.assertNotContains(response, 'Unlike</button>')
+
+
+class ViewerContextTests(TestCase):
+    '''The viewer's profile and relationships should be resolved once per request, in batches'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.others = [make_profile(f'other{i}') for i in range(3)]
+        self.posts = [Post.objects.create(profile=other, caption='hi') for other in self.others]
+        Follower.objects.create(profile=self.others[0], follower_profile=self.viewer)
+        Like.objects.create(post=self.posts[1], profile=self.viewer)
+
+    def test_batch_lookups_use_one_query_each(self):
+        viewer = ViewerContext(self.viewer.user)
+        with self.assertNumQueries(3):
+            liked = viewer.liked_post_ids([post.pk for post in self.posts])
+            following = viewer.following_profile_ids([other.pk for other in self.others])
+
+        self.assertEqual(liked, {self.posts[1].pk})
+        self.assertEqual(following, {self.others[0].pk})
+
+        # already answered, so no more queries
+        with self.assertNumQueries(0):
+            self.assertTrue(viewer.has_liked(self.posts[1]))
+            self.assertFalse(viewer.is_following(self.others[1]))
+
+    def test_middleware_sets_request_profile(self):
+        self.client.login(username='viewer', password='password')
+        response = self.client.get(reverse('show_profile', kwargs={'pk': self.others[0].pk}))
+
+        self.assertEqual(response.wsgi_request.profile, self.viewer)
+        self.assertTrue(response.context['is_following'])
+        self.assertContains(response, 'Unfollow')
+
+
+@override_settings(MIDDLEWARE=[
+    'mini_insta.instrumentation.InstrumentationMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mini_insta.middleware.ViewerMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+])
+class InstrumentationTests(QueryBudgetMixin, TestCase):
+    '''Views should stay within their query budgets, and the middleware should record them'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.author = make_profile('author')
+        Follower.objects.create(profile=self.author, follower_profile=self.viewer)
+        counters.followed(self.viewer, self.author)
+        self.posts = [make_post(self.author, self.viewer, caption=f'emo post {i}') for i in range(5)]
+        self.client.login(username='viewer', password='password')
+        instrumentation.reset()
+
+    def test_views_stay_within_budget(self):
+        self.assertWithinQueryBudget(reverse('show_all_profiles'))
+        self.assertWithinQueryBudget(reverse('show_profile', kwargs={'pk': self.author.pk}))
+        self.assertWithinQueryBudget(reverse('show_post', kwargs={'pk': self.posts[0].pk}))
+        self.assertWithinQueryBudget(reverse('show_feed'))
+        self.assertWithinQueryBudget(reverse('search') + '?query=emo')
+
+    def test_middleware_records_requests(self):
+        self.client.get(reverse('show_feed'))
+        self.client.get(reverse('show_feed'))
+
+        stats = instrumentation.snapshot()['show_feed']
+        self.assertEqual(stats['queries']['count'], 2)
+        self.assertGreater(stats['queries']['max'], 0)
+        self.assertEqual(stats['over_budget'], 0)
+
+        # only staff can read them
+        self.assertEqual(self.client.get(reverse('instrumentation_stats')).status_code, 403)
+        User.objects.filter(pk=self.viewer.user_id).update(is_staff=True)
+        response = self.client.get(reverse('instrumentation_stats'))
+        self.assertIn('show_feed', response.json())
+
+    def test_over_budget_is_logged(self):
+        with patch.object(PostFeedListView, 'query_budget', 0):
+            with self.assertLogs('mini_insta.instrumentation', 'WARNING'):
+                self.client.get(reverse('show_feed'))
+        self.assertEqual(instrumentation.snapshot()['show_feed']['over_budget'], 1)
+
+
+class SeedTests(TestCase):
+    '''The synthetic graph should be deterministic, skewed, and have its counters filled in'''
+
+    # the follow graph as (follower number, followed number) pairs, independent of pks and prefix
+    def follow_pairs(self, prefix):
+        return {
+            (follower[len(prefix):], followed[len(prefix):])
+            for follower, followed in Follower.objects.filter(profile__username__startswith=prefix)
+            .values_list('follower_profile__username', 'profile__username')
+        }
+
+    def test_same_seed_same_graph(self):
+        options = dict(profiles=60, posts_per_profile=3, follows_per_profile=8, likes_per_post=5, seed=7)
+        created = seed.generate(prefix='a', **options)
+        seed.generate(prefix='b', **options)
+
+        self.assertEqual(created['Profile'], 60)
+        self.assertEqual(self.follow_pairs('a'), self.follow_pairs('b'))
+        self.assertNotEqual(self.follow_pairs('a'), set())
+
+        # the most popular profile has the most followers, and the counters agree with the rows
+        top = Profile.objects.get(username='a0')
+        self.assertEqual(top.follower_count, Follower.objects.filter(profile=top).count())
+        self.assertEqual(top.follower_count, Profile.objects.filter(username__startswith='a')
+                         .order_by('-follower_count').first().follower_count)
+        self.assertFalse(any(counters.reconcile().values()))
+
+
+class BenchmarkTests(TestCase):
+    '''The benchmark report should have nearest-rank percentiles and flag slower runs'''
+
+    def test_report_and_compare(self):
+        results = benchmark.Results()
+        for milliseconds in range(1, 101):
+            results.record('show_feed', milliseconds, 200)
+        results.record('show_post', 5, 500)
+
+        report = results.as_dict(seconds=2)
+        feed = report['endpoints']['show_feed']
+        self.assertEqual((feed['p50_ms'], feed['p95_ms'], feed['p99_ms']), (50, 95, 99))
+        self.assertEqual(report['requests'], 101)
+        self.assertEqual(report['errors'], 1)
+
+        slower = benchmark.Results()
+        for milliseconds in range(1, 101):
+            slower.record('show_feed', milliseconds * 2, 200)
+        regressions = benchmark.compare(report, slower.as_dict(seconds=2))
+        self.assertEqual([statistic for url_name, statistic, *rest in regressions], ['p50_ms', 'p95_ms', 'p99_ms'])
+        self.assertEqual(benchmark.compare(report, report), [])
+
+
+class ApiTests(QueryBudgetMixin, TestCase):
+    '''The JSON API should honour fields= and load batches in a constant number of queries'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.author = make_profile('author')
+        Follower.objects.create(profile=self.author, follower_profile=self.viewer)
+        counters.followed(self.viewer, self.author)
+        self.posts = [make_post(self.author, self.viewer, caption=f'post {i}') for i in range(5)]
+        self.client.login(username='viewer', password='password')
+        fragments.get_backend().clear()
+
+    def test_post_and_sparse_fields(self):
+        post = self.posts[0]
+        data = self.assertWithinQueryBudget(reverse('api_post', kwargs={'pk': post.pk})).json()
+        self.assertEqual(data['caption'], 'post 0')
+        self.assertEqual(data['profile']['username'], 'author')
+        self.assertEqual(data['comments'][0]['text'], 'so emo')
+        self.assertTrue(data['liked_by_viewer'])
+
+        response = self.client.get(reverse('api_post', kwargs={'pk': post.pk}), {'fields': 'id,like_count'})
+        self.assertEqual(response.json(), {'id': post.pk, 'like_count': 1})
+
+        response = self.client.get(reverse('api_post', kwargs={'pk': post.pk}), {'fields': 'id,secrets'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_post', kwargs={'pk': 0})).status_code, 404)
+
+    def test_batch_is_constant_queries(self):
+        url = reverse('api_posts')
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(url, {'ids': str(self.posts[0].pk)})
+        ids = [post.pk for post in reversed(self.posts)] + [0]
+        with CaptureQueriesContext(connection) as many:
+            data = self.client.get(url, {'ids': ','.join(map(str, ids))}).json()
+
+        self.assertEqual(len(one), len(many))
+        self.assertEqual([post['id'] for post in data['posts']], ids[:-1])
+        self.assertEqual(data['missing'], [0])
+
+        # no comments asked for, so they aren't loaded
+        with CaptureQueriesContext(connection) as sparse:
+            self.client.get(url, {'ids': ','.join(map(str, ids)), 'fields': 'id,caption'})
+        self.assertLess(len(sparse), len(many))
+
+    def test_feed_and_follow_lists(self):
+        data = self.assertWithinQueryBudget(reverse('api_feed') + '?fields=id').json()
+        self.assertEqual([post['id'] for post in data['posts']], [post.pk for post in reversed(self.posts)])
+
+        data = self.assertWithinQueryBudget(reverse('api_followers', kwargs={'pk': self.author.pk})).json()
+        self.assertEqual([profile['username'] for profile in data['profiles']], ['viewer'])
+        data = self.client.get(reverse('api_following', kwargs={'pk': self.viewer.pk})).json()
+        self.assertEqual(data['profiles'][0]['username'], 'author')
+        self.assertTrue(data['profiles'][0]['is_following'])
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_feed')).status_code, 401)
+
+
+class ConditionalGetTests(TestCase):
+    '''Unchanged pages should come back as a 304 after one cheap query'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.author = make_profile('author')
+        self.post = make_post(self.author, self.author)
+        self.client.login(username='viewer', password='password')
+
+    # get url, then get it again with the validators from the first response
+    def revalidate(self, url):
+        '''Return (first response, conditional response, queries run by the conditional one)'''
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        return first, second, len(queries)
+
+    def test_unchanged_pages_are_not_modified(self):
+        urls = [
+            reverse('show_all_profiles'),
+            reverse('show_profile', kwargs={'pk': self.author.pk}),
+            reverse('show_post', kwargs={'pk': self.post.pk}),
+            reverse('show_followers', kwargs={'pk': self.author.pk}),
+        ]
+        for url in urls:
+            first, second, queries = self.revalidate(url)
+            self.assertEqual(second.status_code, 304, url)
+            self.assertEqual(second['ETag'], first['ETag'])
+            # the session, the user, and the validators
+            self.assertLessEqual(queries, 3, url)
+
+    def test_changes_and_other_viewers_get_a_new_page(self):
+        post_url = reverse('show_post', kwargs={'pk': self.post.pk})
+        first = self.client.get(post_url)
+        self.assertIn('Last-Modified', first)
+
+        self.client.post(reverse('like', kwargs={'pk': self.post.pk}))
+        self.assertEqual(self.client.get(post_url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+        profile_url = reverse('show_profile', kwargs={'pk': self.author.pk})
+        before = self.client.get(profile_url)
+        self.client.post(reverse('follow', kwargs={'pk': self.author.pk}))
+        self.assertEqual(self.client.get(profile_url, HTTP_IF_NONE_MATCH=before['ETag']).status_code, 200)
+
+        # someone else's copy never matches
+        after = self.client.get(profile_url)
+        self.client.logout()
+        self.assertEqual(self.client.get(profile_url, HTTP_IF_NONE_MATCH=after['ETag']).status_code, 200)
+
+
+class ToggleViewTests(TestCase):
+    '''Likes and follows should answer JavaScript with JSON and plain forms with a redirect'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.author = make_profile('author')
+        self.post = Post.objects.create(profile=self.author, caption='hi')
+        self.client.login(username='viewer', password='password')
+
+    def test_json_like_and_follow(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('like', kwargs={'pk': self.post.pk}), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {
+            'post': self.post.pk, 'liked': True, 'like_count': 1, 'latest_liker': 'viewer',
+        })
+        # no page was rendered
+        self.assertFalse(any('mini_insta_comment' in query['sql'] for query in queries))
+
+        response = self.client.post(reverse('delete_like', kwargs={'pk': self.post.pk}), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json()['like_count'], 0)
+
+        response = self.client.post(reverse('follow', kwargs={'pk': self.author.pk}), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), {'profile': self.author.pk, 'following': True, 'follower_count': 1})
+
+    def test_plain_forms_still_redirect(self):
+        response = self.client.post(reverse('like', kwargs={'pk': self.post.pk}), {'next': reverse('show_feed')})
+        self.assertRedirects(response, reverse('show_feed'))
+        self.assertTrue(Like.objects.filter(post=self.post, profile=self.viewer).exists())
+
+        response = self.client.post(reverse('follow', kwargs={'pk': self.author.pk}))
+        self.assertRedirects(response, reverse('show_profile', kwargs={'pk': self.author.pk}))
+
+        # only POST changes anything
+        self.assertEqual(self.client.get(reverse('delete_follow', kwargs={'pk': self.author.pk})).status_code, 405)
+
+        self.client.logout()
+        response = self.client.post(reverse('like', kwargs={'pk': self.post.pk}), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post(reverse('like', kwargs={'pk': self.post.pk}))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
+
+
+class FollowListTests(QueryBudgetMixin, TestCase):
+    '''Followers/following pages should be paginated, flagged, and cost the same however long they are'''
+
+    def setUp(self):
+        self.viewer = make_profile('viewer')
+        self.star = make_profile('star')
+        self.fans = [make_profile(f'fan{i}') for i in range(5)]
+        for fan in self.fans:
+            Follower.objects.create(profile=self.star, follower_profile=fan)
+        Follower.objects.create(profile=self.fans[0], follower_profile=self.star)    # star follows fan0 back
+        Follower.objects.create(profile=self.fans[1], follower_profile=self.viewer)  # viewer follows fan1
+        self.client.login(username='viewer', password='password')
+
+    def test_flags_and_pages(self):
+        profiles, cursor = self.star.get_followers_page(self.viewer, per_page=3)
+        rest, last_cursor = self.star.get_followers_page(self.viewer, cursor=cursor, per_page=3)
+        everyone = profiles + rest
+
+        self.assertEqual([profile.username for profile in everyone], [f'fan{i}' for i in reversed(range(5))])
+        self.assertIsNone(last_cursor)
+        self.assertEqual({profile.username for profile in everyone if profile.mutual}, {'fan0'})
+        self.assertEqual({profile.username for profile in everyone if profile.viewer_follows}, {'fan1'})
+
+        following = list(self.fans[0].get_following(self.viewer))
+        self.assertEqual([(profile.username, profile.mutual) for profile in following], [('star', True)])
+
+    def test_query_count_is_constant(self):
+        url = reverse('show_followers', kwargs={'pk': self.star.pk})
+        with CaptureQueriesContext(connection) as few:
+            self.assertWithinQueryBudget(url)
+        for i in range(10):
+            Follower.objects.create(profile=self.star, follower_profile=make_profile(f'more{i}'))
+        with CaptureQueriesContext(connection) as many:
+            response = self.assertWithinQueryBudget(url)
+
+        self.assertEqual(len(few), len(many))
+        self.assertContains(response, 'Mutual')
+        self.assertContains(response, 'You follow them')
+
+
+@override_settings(MINI_INSTA_FOLLOW_GRAPH=True, MINI_INSTA_FOLLOW_GRAPH_REFRESH=0)
+class FollowGraphTests(TestCase):
+    '''The in-memory follow graph should agree with the Follower table and keep up with follows'''
+
+    def setUp(self):
+        cache.clear()
+        graph.reset()
+        self.addCleanup(graph.reset)
+        self.a, self.b, self.c, self.d = [make_profile(name) for name in 'abcd']
+        for follower, profile in [(self.a, self.b), (self.b, self.a), (self.b, self.c), (self.b, self.d), (self.c, self.d)]:
+            Follower.objects.create(profile=profile, follower_profile=follower)
+
+    def test_matches_database(self):
+        follows = graph.FollowGraph.from_database()
+        self.assertTrue(follows.is_following(self.a.pk, self.b.pk))
+        self.assertFalse(follows.is_following(self.d.pk, self.a.pk))
+        self.assertTrue(follows.is_mutual(self.a.pk, self.b.pk))
+        self.assertFalse(follows.is_mutual(self.b.pk, self.c.pk))
+        self.assertEqual(follows.following(self.b.pk), {self.a.pk, self.c.pk, self.d.pk})
+
+    def test_soft_deleted_profiles_follows_are_left_out(self):
+        # b sorts between a and c, so its follows mustn't land on either of them
+        Profile.objects.filter(pk=self.b.pk).update(deleted_at=timezone.now())
+        follows = graph.FollowGraph.from_database()
+        self.assertFalse(follows.is_following(self.a.pk, self.b.pk))
+        self.assertFalse(follows.is_following(self.c.pk, self.a.pk))
+        self.assertEqual(follows.following(self.a.pk), set())
+        self.assertEqual(follows.following(self.c.pk), {self.d.pk})
+
+    def test_suggestions_rank_friends_of_friends(self):
+        Follower.objects.create(profile=self.c, follower_profile=self.a)
+        follows = graph.FollowGraph.from_database()
+        # a follows b and c, who both follow d; b also follows a itself, which doesn't count
+        self.assertEqual(follows.suggestions(self.a.pk), [(self.d.pk, 2)])
+
+    def test_snapshot_round_trip(self):
+        follows = graph.FollowGraph.from_database()
+        follows.add(self.d.pk, self.a.pk)
+        follows.remove(self.b.pk, self.c.pk)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = f'{directory}/graph.bin'
+        follows.save(path)
+        loaded = graph.FollowGraph.from_snapshot(path)
+
+        for profile in (self.a, self.b, self.c, self.d):
+            self.assertEqual(loaded.following(profile.pk), follows.following(profile.pk))
+        self.assertFalse(loaded.is_following(self.b.pk, self.c.pk))
+
+    def test_follow_views_update_graph_without_queries(self):
+        self.client.login(username='d', password='password')
+        viewer = ViewerContext(self.d.user)
+        graph.get_graph()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('follow', kwargs={'pk': self.a.pk}))
+        self.assertTrue(graph.get_graph().is_following(self.d.pk, self.a.pk))
+
+        viewer.profile
+        with self.assertNumQueries(0):
+            self.assertEqual(viewer.following_profile_ids([self.a.pk, self.b.pk]), {self.a.pk})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_follow', kwargs={'pk': self.a.pk}))
+        self.assertFalse(graph.get_graph().is_following(self.d.pk, self.a.pk))
+
+    def test_own_follow_shows_after_another_process_logged_one(self):
+        with self.settings(MINI_INSTA_FOLLOW_GRAPH=True, MINI_INSTA_FOLLOW_GRAPH_REFRESH=3600):
+            graph.get_graph()
+
+            # another process logs c following a, which this one hasn't caught up with
+            shared = graph._cache()
+            number = shared.incr(graph.SEQUENCE_KEY)
+            shared.set(graph.EVENT_KEY.format(number), ('follow', self.c.pk, self.a.pk), graph.EVENT_TIMEOUT)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                graph.followed(self.d, self.a)
+            self.assertTrue(graph.get_graph().is_following(self.d.pk, self.a.pk))
+            self.assertTrue(graph.get_graph().is_following(self.c.pk, self.a.pk))
+
+    def test_other_processes_catch_up_from_the_log(self):
+        stale = graph.FollowGraph.from_database()
+        with self.captureOnCommitCallbacks(execute=True):
+            graph.followed(self.d, self.c)
+        self.assertFalse(stale.is_following(self.d.pk, self.c.pk))
+        self.assertTrue(stale.catch_up())
+        self.assertTrue(stale.is_following(self.d.pk, self.c.pk))
+
+    def test_lost_log_means_reload(self):
+        with self.settings(MINI_INSTA_FOLLOW_GRAPH=True, MINI_INSTA_FOLLOW_GRAPH_REFRESH=0):
+            follows = graph.get_graph()
+            for profile in (self.a, self.c):
+                with self.captureOnCommitCallbacks(execute=True):
+                    graph.followed(self.d, profile)
+            self.assertTrue(follows.catch_up())
+
+            # the cache forgets the log, which starts again at 1, behind this graph
+            cache.clear()
+            Follower.objects.create(profile=self.b, follower_profile=self.d)
+            with self.captureOnCommitCallbacks(execute=True):
+                graph.followed(self.d, self.b)
+            self.assertFalse(follows.catch_up())
+            self.assertTrue(graph.get_graph().is_following(self.d.pk, self.b.pk))
+
+    def test_rebuild_keeps_serving_the_old_graph(self):
+        with self.settings(MINI_INSTA_FOLLOW_GRAPH=True, MINI_INSTA_FOLLOW_GRAPH_REFRESH=0):
+            old = graph.get_graph()
+            build = graph.FollowGraph.from_database
+            served = []
+
+            # while the replacement is built, another thread still gets the old graph straight away
+            def from_database():
+                thread = threading.Thread(target=lambda: served.append(graph.get_graph()))
+                thread.start()
+                thread.join(5)
+                return build()
+
+            cache.clear()  # the log is lost, so the graph has to be rebuilt
+            with patch.object(graph.FollowGraph, 'from_database', from_database):
+                fresh = graph.get_graph()
+        self.assertEqual(served, [old])
+        self.assertIsNot(fresh, old)
+
+    def test_suggestions_endpoint(self):
+        self.client.login(username='a', password='password')
+        response = self.client.get(reverse('api_suggestions'))
+        self.assertEqual([profile['username'] for profile in response.json()['profiles']], ['c', 'd'])
+
+        response = self.client.get(reverse('api_suggestions'), {'limit': 1})
+        self.assertEqual([profile['username'] for profile in response.json()['profiles']], ['c'])
+        for limit in ('0', '-1', 'x'):
+            self.assertEqual(self.client.get(reverse('api_suggestions'), {'limit': limit}).status_code, 400)
+
+
+@override_settings(MINI_INSTA_LIKE_BUFFER=True, MINI_INSTA_LIKE_BUFFER_INTERVAL=0, MINI_INSTA_LIKE_BUFFER_SIZE=100)
+class LikeBufferTests(TestCase):
+    '''Buffered likes should show to the liker at once, coalesce, and land in a few bulk writes'''
+
+    def setUp(self):
+        likebuffer.reset()
+        self.addCleanup(likebuffer.reset)
+        self.author = make_profile('author')
+        self.post = Post.objects.create(profile=self.author, caption='viral')
+        self.fans = [make_profile(f'fan{i}') for i in range(5)]
+
+    def like(self, profile, url_name='like'):
+        self.client.force_login(profile.user)
+        return self.client.post(reverse(url_name, kwargs={'pk': self.post.pk}), HTTP_ACCEPT='application/json')
+
+    def test_pending_like_shows_to_the_liker_only(self):
+        response = self.like(self.fans[0])
+        self.assertEqual(response.json(), {'post': self.post.pk, 'liked': True, 'like_count': 1, 'latest_liker': 'fan0'})
+        self.assertFalse(Like.objects.exists())
+
+        self.assertTrue(ViewerContext(self.fans[0].user).has_liked(self.post))
+        self.assertFalse(ViewerContext(self.fans[1].user).has_liked(self.post))
+        page = self.client.get(reverse('show_post', kwargs={'pk': self.post.pk}))
+        self.assertTrue(page.context['has_liked'])
+
+    def test_flush_coalesces_and_batches(self):
+        for fan in self.fans:
+            self.like(fan)
+        Like.objects.create(post=self.post, profile=self.author)  # written before the buffer existed
+        self.like(self.fans[0], 'delete_like')  # cancels out fan0's pending like
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(likebuffer.flush(), (4, 0))
+        # a fixed number per post touched (counter, trending score, version), not per like
+        self.assertLessEqual(len(queries), 15)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 4)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 5)
+        self.assertEqual(likebuffer.pending_state(self.post.pk, self.fans[0].pk), None)
+
+        stats = likebuffer.metrics()
+        self.assertEqual((stats['intents'], stats['coalesced'], stats['pending']), (6, 1, 0))
+        self.assertEqual(stats['batch_size']['count'], 1)
+
+    def test_full_buffer_flushes_itself(self):
+        with override_settings(MINI_INSTA_LIKE_BUFFER_SIZE=3):
+            for fan in self.fans[:3]:
+                self.like(fan)
+        self.assertEqual(Like.objects.count(), 3)
+        self.like(self.fans[1], 'delete_like')
+        likebuffer.flush()
+        self.assertEqual(Like.objects.count(), 2)
+
+    def test_likes_of_deleted_profiles_are_dropped(self):
+        self.like(self.fans[0])
+        self.like(self.fans[1])
+        reaper.delete_profile(self.fans[0])
+
+        self.assertEqual(likebuffer.flush(), (1, 0))
+        self.assertEqual(list(Like.objects.values_list('profile_id', flat=True)), [self.fans[1].pk])
+        self.assertEqual(likebuffer.metrics()['pending'], 0)
+
+
+@override_settings(MINI_INSTA_LIKE_BUFFER=True, MINI_INSTA_LIKE_BUFFER_INTERVAL=0)
+class LikeBufferFailureTests(TransactionTestCase):
+    '''A like that can never be written shouldn't hold up the rest of the buffer forever'''
+
+    def setUp(self):
+        likebuffer.reset()
+        self.addCleanup(likebuffer.reset)
+
+    def test_profile_deleted_after_the_check_only_drops_its_like(self):
+        author, fan = make_profile('author'), make_profile('fan')
+        post = Post.objects.create(profile=author, caption='quiet night')
+        gone = fan.pk + 1000
+        likebuffer.add(post.pk, fan.pk, True)
+        likebuffer.add(post.pk, gone, True)
+
+        # the liveness check still sees the profile the reaper has since removed for good
+        with patch.object(likebuffer, 'Profile') as stale, self.assertLogs('mini_insta.likebuffer', 'ERROR'):
+            stale.objects.filter.return_value.values_list.return_value = [fan.pk, gone]
+            self.assertEqual(likebuffer.flush(), (1, 0))
+
+        self.assertEqual(list(Like.objects.values_list('profile_id', flat=True)), [fan.pk])
+        self.assertEqual(Post.objects.get(pk=post.pk).like_count, 1)
+        self.assertEqual((likebuffer.metrics()['pending'], likebuffer.metrics()['dropped']), (0, 1))
+
+
+@override_settings(MINI_INSTA_LIKE_BUFFER=True, MINI_INSTA_LIKE_BUFFER_INTERVAL=0.1)
+class LikeBufferIntervalTests(TransactionTestCase):
+    '''The background flusher should write a lone like within an interval, without filling the buffer'''
+
+    def setUp(self):
+        likebuffer.reset()
+        self.addCleanup(likebuffer.reset)
+
+    def test_single_like_is_written_on_the_interval(self):
+        author, fan = make_profile('author'), make_profile('fan')
+        post = Post.objects.create(profile=author, caption='quiet night')
+        likebuffer.add(post.pk, fan.pk, True)
+
+        # the intent is forgotten once the flusher's write commits; polling the table
+        # itself would contend with that write for SQLite's table lock
+        deadline = time.monotonic() + 5
+        while likebuffer.pending_state(post.pk, fan.pk) is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertTrue(Like.objects.filter(post=post, profile=fan).exists())
+        self.assertIsNone(likebuffer.pending_state(post.pk, fan.pk))
+
+
+class TrendingTests(QueryBudgetMixin, TestCase):
+    '''Trending scores should follow likes and comments, decay, and be read straight off their table'''
+
+    def setUp(self):
+        self.author = make_profile('author')
+        self.fans = [make_profile(f'fan{i}') for i in range(3)]
+        self.old = Post.objects.create(profile=self.author, caption='old news')
+        self.new = Post.objects.create(profile=self.author, caption='new hotness')
+
+    def test_views_update_scores_and_page_ranks_them(self):
+        self.client.force_login(self.fans[0].user)
+        self.client.post(reverse('like', kwargs={'pk': self.old.pk}))
+        self.client.post(reverse('create_comment', kwargs={'pk': self.new.pk}), {'text': 'first'})
+        self.assertAlmostEqual(self.old.trending.score, trending.LIKE_WEIGHT, places=3)
+
+        response = self.assertWithinQueryBudget(reverse('trending'))
+        self.assertEqual(list(response.context['posts']), [self.new, self.old])
+
+        self.client.post(reverse('delete_like', kwargs={'pk': self.old.pk}))
+        self.old.trending.refresh_from_db()
+        self.assertEqual(self.old.trending.score, 0)
+        response = self.client.get(reverse('trending'))
+        self.assertEqual(list(response.context['posts']), [self.new])
+
+    def test_newer_engagement_outranks_older(self):
+        epoch = timezone.now() - 2 * trending.half_life()
+        TrendingEpoch.objects.create(start=epoch)
+        with patch('mini_insta.trending.timezone.now', return_value=epoch):
+            for fan in self.fans:
+                trending.liked(self.old)
+        trending.liked(self.new)
+
+        # three likes two half-lives ago are worth 3/4 of a like now
+        posts, cursor = trending.get_trending_page(per_page=1)
+        self.assertEqual(posts, [self.new])
+        rest, _ = trending.get_trending_page(cursor=cursor, per_page=1)
+        self.assertEqual(rest, [self.old])
+
+        # renormalizing rescales without changing the order
+        trending.renormalize()
+        self.assertAlmostEqual(TrendingScore.objects.get(post=self.old).score, 0.75, places=3)
+        self.assertAlmostEqual(TrendingScore.objects.get(post=self.new).score, 1.0, places=3)
+
+    def test_taking_back_engagement_subtracts_what_it_was_worth(self):
+        epoch = timezone.now() - 2 * trending.half_life()
+        TrendingEpoch.objects.create(start=epoch)
+        with patch('mini_insta.trending.timezone.now', return_value=epoch):
+            trending.liked(self.old)
+            like = Like.objects.create(post=self.old, profile=self.fans[0])
+        Like.objects.filter(pk=like.pk).update(timestamp=epoch)
+        Post.objects.filter(pk=self.old.pk).update(like_count=1)
+        trending.liked(self.old)
+
+        # the old like is worth 1 and the new one 4, so unliking the old one leaves 4
+        self.client.force_login(self.fans[0].user)
+        self.client.post(reverse('delete_like', kwargs={'pk': self.old.pk}))
+        self.assertAlmostEqual(TrendingScore.objects.get(post=self.old).score, 4.0, places=3)
+
+    def test_ancient_epoch_is_renormalized_before_it_overflows(self):
+        start = timezone.now() - 2000 * trending.half_life()
+        TrendingEpoch.objects.create(start=start)
+        with self.assertLogs('mini_insta.trending', 'WARNING'):
+            trending.liked(self.new)
+
+        self.assertGreater(TrendingEpoch.objects.get().start, start)
+        self.assertAlmostEqual(TrendingScore.objects.get(post=self.new).score, trending.LIKE_WEIGHT, places=3)
+
+    def test_rebuild_matches_incremental_scores(self):
+        for fan in self.fans:
+            Like.objects.create(post=self.old, profile=fan)
+        Comment.objects.create(post=self.new, profile=self.fans[0], text='hi')
+
+        self.assertEqual(trending.rebuild(), 2)
+        self.assertAlmostEqual(TrendingScore.objects.get(post=self.old).score, 3 * trending.LIKE_WEIGHT, places=3)
+        self.assertAlmostEqual(TrendingScore.objects.get(post=self.new).score, trending.COMMENT_WEIGHT, places=3)
+
+
+@override_settings(MINI_INSTA_REAP_IN_BACKGROUND=False, MINI_INSTA_REAPER_BATCH_SIZE=2)
+class SoftDeleteTests(TestCase):
+    '''Deletes should hide content at once, and the reaper should remove it and its media in batches'''
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.author = make_profile('author')
+        self.fans = [make_profile(f'fan{i}') for i in range(3)]
+        self.post = Post.objects.create(profile=self.author, caption='doomed')
+        for fan in self.fans:
+            Like.objects.create(post=self.post, profile=fan)
+            Comment.objects.create(post=self.post, profile=fan, text='rip')
+
+    def test_deleted_post_is_hidden_then_reaped(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            photo = Photo.objects.create(post=self.post, image_file=SimpleUploadedFile('x.png', b'not really a png'))
+            path = photo.image_file.path
+
+            self.client.login(username='author', password='password')
+            response = self.client.post(reverse('delete_post', kwargs={'pk': self.post.pk}))
+            self.assertRedirects(response, reverse('show_profile', kwargs={'pk': self.author.pk}),
+                                 fetch_redirect_response=False)
+
+            # gone from every page straight away, but nothing was cascaded yet
+            self.assertEqual(self.client.get(reverse('show_post', kwargs={'pk': self.post.pk})).status_code, 404)
+            self.assertFalse(self.author.get_all_posts().exists())
+            self.assertEqual(Like.objects.count(), 3)
+            self.assertEqual(reaper.pending(), {'posts': 1, 'profiles': 0})
+
+            with self.captureOnCommitCallbacks(execute=True):
+                removed = reaper.reap()
+
+        self.assertEqual(removed, {'Like': 3, 'Comment': 3, 'Photo': 1, 'media files': 1, 'Post': 1})
+        self.assertFalse(Post.all_objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_deleted_profile_is_hidden_then_reaped(self):
+        other = Post.objects.create(profile=self.fans[1], caption='survivor')
+        Like.objects.create(post=other, profile=self.fans[0])
+        Comment.objects.create(post=other, profile=self.fans[0], text='hidden soon')
+        Follower.objects.create(profile=self.fans[1], follower_profile=self.fans[0])
+        counters.reconcile()
+
+        reaper.delete_profile(self.fans[0])
+        self.assertFalse(Profile.objects.filter(pk=self.fans[0].pk).exists())
+        self.assertFalse(User.objects.get(username='fan0').is_active)
+        loaded = Post.objects.for_feed().get(pk=other.pk)
+        self.assertEqual((loaded.feed_comments, loaded.latest_liker), ([], None))
+        # until the reaper recounts, the summary has a count but nobody to name
+        page = self.client.get(reverse('show_post', kwargs={'pk': other.pk}))
+        self.assertNotContains(page, '@None')
+        self.assertContains(page, '1 like<')
+
+        reaper.reap()
+        other.refresh_from_db()
+        self.fans[1].refresh_from_db()
+        self.assertEqual((other.like_count, other.comment_count), (0, 0))
+        self.assertEqual(self.fans[1].follower_count, 0)
+        self.assertFalse(Profile.all_objects.filter(pk=self.fans[0].pk).exists())
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 2)
+
+
+class CommentPageTests(QueryBudgetMixin, TestCase):
+    '''Cards should show only the newest comments, and the post page should page through the rest'''
+
+    def setUp(self):
+        self.author = make_profile('author')
+        self.posts = [Post.objects.create(profile=self.author, caption=f'post {i}') for i in range(2)]
+        for post in self.posts:
+            for i in range(5):
+                Comment.objects.create(post=post, profile=self.author, text=f'{post.caption} comment {i}')
+        counters.reconcile()
+
+    def test_feed_gets_newest_comments_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            posts = list(Post.objects.for_feed(comments=True, photos=False))
+        self.assertEqual(len(queries), 2)
+        for post in posts:
+            self.assertEqual([comment.text for comment in post.feed_comments],
+                             [f'{post.caption} comment {i}' for i in (4, 3, 2)])
+
+        self.client.login(username='author', password='password')
+        self.assertContains(self.client.get(reverse('show_feed')), 'View all 5 comments', count=2)
+
+    def test_post_page_and_fragment_page_through_comments(self):
+        post = self.posts[0]
+        url = reverse('show_post', kwargs={'pk': post.pk})
+        with patch.object(PostDetailView, 'comments_per_page', 2):
+            first = self.assertWithinQueryBudget(url)
+            self.assertEqual([comment.text for comment in first.context['comments']],
+                             ['post 0 comment 4', 'post 0 comment 3'])
+
+            cursor = first.context['next_comment_cursor']
+            second = self.client.get(url, {'comments': cursor})
+            self.assertEqual([comment.text for comment in second.context['comments']],
+                             ['post 0 comment 2', 'post 0 comment 1'])
+
+        fragment = self.assertWithinQueryBudget(
+            reverse('show_post_comments', kwargs={'pk': post.pk}) + f'?comments={cursor}'
+        )
+        self.assertContains(fragment, 'post 0 comment 0')
+        self.assertNotContains(fragment, 'post 0 comment 3')
+        self.assertNotContains(fragment, 'Older comments')
+
+
+class DirectoryTests(QueryBudgetMixin, TestCase):
+    '''The home page should list profiles a page at a time, from the cache when nothing changed'''
+
+    def setUp(self):
+        cache.clear()
+        for username in ['Zed', 'amy', 'Bob', 'mo', 'Max', 'carl']:
+            make_profile(username)
+
+    def test_pages_in_name_order_and_jumps_to_letters(self):
+        first, cursor = directory.get_page('name', per_page=4)
+        self.assertEqual([profile.username for profile in first], ['amy', 'Bob', 'carl', 'Max'])
+        rest, cursor = directory.get_page('name', cursor=cursor, per_page=4)
+        self.assertEqual([profile.username for profile in rest], ['mo', 'Zed'])
+        self.assertIsNone(cursor)
+
+        jumped, _ = directory.get_page('name', letter='m', per_page=4)
+        self.assertEqual([profile.username for profile in jumped], ['Max', 'mo', 'Zed'])
+
+        newest, _ = directory.get_page('newest', per_page=2)
+        self.assertEqual([profile.username for profile in newest], ['carl', 'Max'])
+
+    def test_cached_page_is_served_until_a_profile_changes(self):
+        url = reverse('show_all_profiles')
+        self.assertContains(self.assertWithinQueryBudget(url + '?letter=m'), 'Username: mo')
+
+        # a guest's second visit doesn't touch the database
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url + '?letter=m'), 'Username: mo')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Profile.objects.filter(username='mo').get().delete()
+        self.assertNotContains(self.client.get(url + '?letter=m'), 'Username: mo')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_profile('morticia')
+        self.assertContains(self.client.get(url + '?letter=m'), 'Username: morticia')
+
+
+class TransferTests(TestCase):
+    '''An export should load back into an empty database exactly, even if the import is interrupted'''
+
+    # every exported row, as it's stored
+    def snapshot(self):
+        return {
+            transfer._label(model): list(model._base_manager.order_by('pk').values_list(*transfer._columns(model)))
+            for model, _ in transfer.TABLES
+        }
+
+    def test_round_trip_with_interrupted_import(self):
+        seed.generate(profiles=12, posts_per_profile=2, follows_per_profile=4, likes_per_post=3, seed=3)
+        reaper.delete_post(Post.objects.first())
+        before = self.snapshot()
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        exported = transfer.export_data(path, batch_size=3, chunk_rows=7)
+        self.assertEqual(exported['mini_insta.post'], len(before['mini_insta.post']))
+        self.assertGreater(len(os.listdir(path)), len(transfer.TABLES) + 1)
+
+        for model, _ in reversed(transfer.TABLES):
+            model._base_manager.all().delete()
+
+        # stop partway through the likes, then pick up from the checkpoint
+        write_batch = transfer._write_batch
+        calls = []
+
+        def failing_write_batch(model, batch, skip_existing=False):
+            calls.append(model)
+            if model is Like and calls.count(Like) == 2:
+                raise RuntimeError("interrupted")
+            write_batch(model, batch, skip_existing)
+
+        with patch.object(transfer, '_write_batch', failing_write_batch), self.assertRaises(RuntimeError):
+            transfer.import_data(path, batch_size=4)
+        with self.assertRaises(ValueError):
+            transfer.import_data(path, batch_size=4)
+
+        transfer.import_data(path, batch_size=4, resume=True)
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(any(counters.reconcile().values()))
+
+    def test_resume_after_interruption_before_first_checkpoint(self):
+        seed.generate(profiles=6, posts_per_profile=1, follows_per_profile=2, likes_per_post=2, seed=5)
+        before = self.snapshot()
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        transfer.export_data(path, batch_size=3, chunk_rows=7)
+        for model, _ in reversed(transfer.TABLES):
+            model._base_manager.all().delete()
+
+        # the first batch of likes commits, then the run dies before checkpointing it
+        write_batch = transfer._write_batch
+
+        def dying_write_batch(model, batch, skip_existing=False):
+            write_batch(model, batch, skip_existing)
+            if model is Like:
+                raise RuntimeError("interrupted")
+
+        with patch.object(transfer, '_write_batch', dying_write_batch), self.assertRaises(RuntimeError):
+            transfer.import_data(path, batch_size=100)
+        self.assertTrue(Like.objects.exists())
+
+        transfer.import_data(path, batch_size=100, resume=True)
+        self.assertEqual(self.snapshot(), before)
+
+
+class ExportWhileWritingTests(TransactionTestCase):
+    '''An export shouldn't lock the site's writes out of the database while it runs'''
+
+    def test_write_from_another_connection_succeeds_mid_export(self):
+        seed.generate(profiles=6, posts_per_profile=1, follows_per_profile=2, likes_per_post=2, seed=7)
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        errors, writers = [], []
+
+        # someone signs up from another thread (so another connection), into a table already being read
+        def write():
+            try:
+                make_profile('latecomer')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        def log(message):
+            if message.startswith('exported') and not writers:
+                writers.append(threading.Thread(target=write))
+                writers[0].start()
+                writers[0].join()
+
+        transfer.export_data(path, batch_size=3, chunk_rows=4, log=log)
+        self.assertEqual(errors, [])
+
+
+@override_settings(MINI_INSTA_REPLICA_DATABASES=['replica'], MINI_INSTA_REPLICA_STICKY_SECONDS=30)
+class ReplicaRouterTests(SimpleTestCase):
+    '''Reads should go to a replica, except where they'd miss the visitor's own writes'''
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    # run a request through the middleware, returning where its reads went and the response
+    def route(self, request, write=False):
+        '''Return ((read before writing, read after), response) for request'''
+        reads = []
+
+        def view(request):
+            reads.append(self.router.db_for_read(Post))
+            if write:
+                self.router.db_for_write(Like)
+            reads.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = routers.StickyPrimaryMiddleware(view)(request)
+        return tuple(reads), response
+
+    def test_writes_stick_to_the_primary(self):
+        reads, response = self.route(self.factory.get('/'))
+        self.assertEqual(reads, ('replica', 'replica'))
+        self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+        # the request that writes reads its own write, and so do the visitor's next requests
+        reads, response = self.route(self.factory.get('/'), write=True)
+        self.assertEqual(reads, ('replica', 'default'))
+        cookie = response.cookies[routers.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 30)
+
+        request = self.factory.get('/')
+        request.COOKIES[routers.STICKY_COOKIE] = cookie.value
+        self.assertEqual(self.route(request)[0], ('default', 'default'))
+
+        # until the window is over
+        request.COOKIES[routers.STICKY_COOKIE] = '1'
+        self.assertEqual(self.route(request)[0], ('replica', 'replica'))
+
+        # and posts read what they're about to change from the primary
+        self.assertEqual(self.route(self.factory.post('/'))[0], ('default', 'default'))
+
+    def test_reads_outside_a_request_go_to_the_primary(self):
+        # management commands, workers and threads never went through the middleware
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        reads = []
+        thread = threading.Thread(target=lambda: reads.append(self.router.db_for_read(Post)))
+        thread.start()
+        thread.join()
+        self.assertEqual(reads, ['default'])
+
+    def test_other_apps_and_migrations_stay_on_the_primary(self):
+        self.assertIsNone(self.router.db_for_read(User))
+        self.assertIsNone(self.router.db_for_write(User))
+        self.assertFalse(self.router.allow_migrate('replica', 'mini_insta'))
+        self.assertIsNone(self.router.allow_migrate('default', 'mini_insta'))
+        with override_settings(MINI_INSTA_REPLICA_DATABASES=[]):
+            self.assertEqual(self.route(self.factory.get('/'))[0], ('default', 'default'))
@@ -0,0 +1,188 @@
+# File: timeline.py
+# Author: Anna LaPrade (alaprade@bu.edu), 10/30/2025
+# Description: the optional materialized (fan-out-on-write) home timeline for the mini_insta app
+
+from django.conf import settings
+
+from .models import FeedEntry, Follower, Post, Profile
+from .pagination import encode_cursor, keyset_page
+
+
+# how many FeedEntry rows to write per bulk_create
+BATCH_SIZE = 1000
+
+
+# settings are read on every call so they can be changed in tests
+def timeline_enabled():
+    '''Return True if feeds are read from and written to the FeedEntry table'''
+    return getattr(settings, 'MINI_INSTA_MATERIALIZED_FEED', False)
+
+
+def fanout_threshold():
+    '''Return the follower count above which a profile's posts are pulled at read time'''
+    return getattr(settings, 'MINI_INSTA_FANOUT_FOLLOWER_THRESHOLD', 1000)
+
+
+def backfill_size():
+    '''Return how many recent posts are copied into a feed when someone follows a profile'''
+    return getattr(settings, 'MINI_INSTA_FEED_BACKFILL', 100)
+
+
+# profiles with too many followers to copy every post to every follower
+def is_fanout_on_read(profile):
+    '''Return True if profile's posts are pulled into feeds at read time'''
+    return profile.follower_count > fanout_threshold()
+
+
+def followed_fanout_on_read_ids(profile):
+    '''Return the ids of the profiles that profile follows whose posts are pulled at read time'''
+    return list(
+        Profile.objects.filter(profile__follower_profile=profile, follower_count__gt=fanout_threshold())
+        .values_list('pk', flat=True)
+    )
+
+
+# write FeedEntry rows in batches, skipping ones that already exist
+def _write_entries(entries):
+    '''bulk_create an iterable of FeedEntry objects in batches'''
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+# called when a post is created
+def fan_out_post(post):
+    '''Add a new Post to its author's feed and, unless the author is too popular, every follower's feed'''
+    if not timeline_enabled():
+        return
+
+    owner_ids = [post.profile_id]
+    if not is_fanout_on_read(post.profile):
+        owner_ids += Follower.objects.filter(profile=post.profile).values_list('follower_profile', flat=True)
+
+    _write_entries(
+        FeedEntry(owner_id=owner_id, post=post, timestamp=post.timestamp) for owner_id in owner_ids
+    )
+
+
+# called when a post is edited, since Post.timestamp changes on every save
+def refresh_post(post):
+    '''Copy a Post's current timestamp onto its FeedEntry rows'''
+    if not timeline_enabled():
+        return
+    FeedEntry.objects.filter(post=post).update(timestamp=post.timestamp)
+
+
+# called when follower starts following profile
+def backfill(follower, profile):
+    '''Copy profile's most recent posts into follower's feed'''
+    if not timeline_enabled() or is_fanout_on_read(profile):
+        return
+
+    recent = Post.objects.filter(profile=profile).order_by('-timestamp').values_list('pk', 'timestamp')
+    _write_entries(
+        FeedEntry(owner=follower, post_id=pk, timestamp=timestamp) for pk, timestamp in recent[:backfill_size()]
+    )
+
+
+# a profile's posts are pulled at read time while it's over the threshold, and
+# never written to FeedEntry, so when it drops back under, its followers' feeds
+# need its recent posts copied in, as if they'd just followed it
+def fan_out_recent(profile_pks):
+    '''Copy the most recent posts of each of these profiles into all their followers' feeds'''
+    if not timeline_enabled():
+        return
+    for profile_pk in profile_pks:
+        recent = list(
+            Post.objects.filter(profile_id=profile_pk).order_by('-timestamp')
+            .values_list('pk', 'timestamp')[:backfill_size()]
+        )
+        follower_ids = Follower.objects.filter(profile_id=profile_pk).values_list('follower_profile', flat=True)
+        _write_entries(
+            FeedEntry(owner_id=owner_id, post_id=pk, timestamp=timestamp)
+            for owner_id in follower_ids.iterator()
+            for pk, timestamp in recent
+        )
+
+
+def fanout_on_read_ids(profile_pks):
+    '''Return the set of these profiles' pks whose posts are pulled at read time (empty without the timeline)'''
+    if not timeline_enabled():
+        return set()
+    return set(Profile.objects.filter(pk__in=profile_pks, follower_count__gt=fanout_threshold())
+               .values_list('pk', flat=True))
+
+
+# called when follower stops following profile, once profile's follower_count is updated
+def lost_follower(profile):
+    '''Fan out profile's recent posts if losing that follower just took it down to the threshold'''
+    if timeline_enabled() and profile.follower_count == fanout_threshold():
+        fan_out_recent([profile.pk])
+
+
+# called when follower stops following profile
+def remove(follower, profile):
+    '''Remove all of profile's posts from follower's feed'''
+    if not timeline_enabled():
+        return
+    FeedEntry.objects.filter(owner=follower, post__profile=profile).delete()
+
+
+# rebuild every timeline from the Post and Follower tables
+def rebuild():
+    '''Delete every FeedEntry and write them all again, returning how many were written'''
+    FeedEntry.objects.all().delete()
+    written = 0
+
+    for author in Profile.objects.only('pk', 'follower_count').iterator():
+        owner_ids = [author.pk]
+        if not is_fanout_on_read(author):
+            owner_ids += Follower.objects.filter(profile=author).values_list('follower_profile', flat=True)
+
+        posts = list(Post.objects.filter(profile=author).values_list('pk', 'timestamp'))
+        _write_entries(
+            FeedEntry(owner_id=owner_id, post_id=pk, timestamp=timestamp)
+            for owner_id in owner_ids
+            for pk, timestamp in posts
+        )
+        written += len(owner_ids) * len(posts)
+
+    return written
+
+
+# one page of a profile's feed, from the materialized timeline when it is enabled
+def get_feed_page(profile, cursor=None, per_page=20):
+    '''Return (posts, next_cursor) for the page of profile's feed after cursor'''
+    if not timeline_enabled():
+        return profile.get_post_feed_page(cursor=cursor, per_page=per_page)
+
+    # one range scan over this profile's timeline, keyed on the same (timestamp, post id) cursor
+    entries, entries_cursor = keyset_page(
+        FeedEntry.objects.filter(owner=profile), cursor, per_page, tiebreak='post_id',
+    )
+    keys = {(entry.timestamp, entry.post_id) for entry in entries}
+    has_more = entries_cursor is not None
+
+    # posts by popular profiles were never fanned out, so pull them in now
+    pulled_ids = followed_fanout_on_read_ids(profile)
+    if pulled_ids:
+        pulled, pulled_cursor = keyset_page(Post.objects.filter(profile__in=pulled_ids), cursor, per_page)
+        keys |= {(post.timestamp, post.pk) for post in pulled}
+        has_more = has_more or pulled_cursor is not None
+
+    # merge both sources newest first and keep one page of them
+    keys = sorted(keys, reverse=True)
+    has_more = has_more or len(keys) > per_page
+    keys = keys[:per_page]
+
+    # load the posts themselves in bulk, keeping the timeline order
+    posts_by_id = Post.objects.for_feed(profile).in_bulk([pk for timestamp, pk in keys])
+    posts = [posts_by_id[pk] for timestamp, pk in keys if pk in posts_by_id]
+
+    next_cursor = encode_cursor(*keys[-1]) if has_more and keys else None
+    return posts, next_cursor
@@ -0,0 +1,355 @@
+# File: transfer.py
+# Author: Anna LaPrade (alaprade@bu.edu), 12/01/2025
+# Description: streaming, resumable export and import of all mini_insta data as chunked NDJSON
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+
+from . import counters, directory, search, timeline, trending
+from .models import Comment, Follower, Like, MediaBlob, Photo, Post, Profile
+
+
+# an export is a directory with one series of NDJSON files per table, each line
+# one row as {column: value}, each file at most chunk_rows rows in pk order, and a
+# manifest.json saying which files make up each table. rows are read a batch at a
+# time with a server-side iterator and written straight out, and read back in a
+# line at a time and written with bulk_create a batch at a time, so memory stays
+# flat however big the tables are.
+#
+# both directions save a checkpoint after every chunk (export) or batch (import),
+# so an interrupted run started again with resume=True carries on where it
+# stopped. tables are done a level at a time in foreign key order; with workers > 1
+# the tables of one level run side by side, each on its own connection.
+#
+# an export reads every table in one transaction, so they agree with each other
+# even while the site is being used: repeatable read on Postgres (where worker
+# threads join the same snapshot), and a single read transaction on SQLite in WAL
+# mode. SQLite's default rollback journal would lock every writer out for the
+# whole export, so there each chunk is read in its own transaction instead. then,
+# and with workers > 1 on other databases, and across a resume, each part is only
+# as of when it was read, so export from a quiet database.
+#
+# only the source data is transferred. counters, trending scores, the search index
+# and timelines are rebuilt after an import, and media files are copied separately.
+
+# (model, level): a table only points at tables of lower levels.
+# soft-deleted rows are included, so everything pointing at them still has its target.
+TABLES = [
+    (User, 0),
+    (MediaBlob, 0),
+    (Profile, 1),
+    (Post, 2),
+    (Follower, 2),
+    (Photo, 3),
+    (Comment, 3),
+    (Like, 3),
+]
+
+MANIFEST = 'manifest.json'
+IMPORT_CHECKPOINT = 'import-checkpoint.json'
+FORMAT_VERSION = 1
+
+
+# DjangoJSONEncoder cuts datetimes down to milliseconds, and a backup shouldn't lose anything
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def _columns(model):
+    '''Return the names of model's columns, in the order they're exported'''
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def _levels():
+    '''Return the models of TABLES grouped by level, lowest first'''
+    levels = {}
+    for model, level in TABLES:
+        levels.setdefault(level, []).append(model)
+    return [levels[level] for level in sorted(levels)]
+
+
+# checkpoints are rewritten whole and swapped in, so a crash never leaves half a file
+def _write_json(path, data):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(temporary, path)
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _run_levels(work, workers):
+    '''Call work(model) for every table, a level at a time, on up to workers threads'''
+    for models in _levels():
+        if workers <= 1 or len(models) == 1:
+            for model in models:
+                work(model)
+            continue
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mini_insta_transfer') as executor:
+            # list() so the first failure is raised here
+            list(executor.map(lambda model: _in_thread(work, model), models))
+
+
+def _in_thread(work, model):
+    try:
+        work(model)
+    finally:
+        # worker threads open their own connections, don't leak them
+        connections.close_all()
+
+
+@contextmanager
+def _snapshot(join=None):
+    '''Run the block in a transaction that reads every table as of one moment. Yields an
+    id other connections can pass as join to read as of that same moment, on Postgres.'''
+    with transaction.atomic():
+        exported = None
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                if join:
+                    cursor.execute('SET TRANSACTION SNAPSHOT %s', [join])
+                else:
+                    cursor.execute('SELECT pg_export_snapshot()')
+                    exported = cursor.fetchone()[0]
+        yield exported
+
+
+def _snapshot_blocks_writers():
+    '''Return True if a read transaction held open here would lock writers out (SQLite, unless in WAL mode)'''
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        return cursor.fetchone()[0].lower() != 'wal'
+
+
+def export_data(path, batch_size=2000, chunk_rows=100000, workers=1, resume=False, log=None):
+    '''Write every table to NDJSON files under the directory path.
+    Returns {"app.model": rows exported}.
+
+    log, if given, is called with a line of progress after each chunk.'''
+    log = log or (lambda message: None)
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, MANIFEST)
+
+    if resume and os.path.exists(manifest_path):
+        manifest = _read_json(manifest_path)
+    elif os.path.exists(manifest_path):
+        raise FileExistsError(f"{path} already holds an export; resume it or pick another directory")
+    else:
+        manifest = {'format': FORMAT_VERSION, 'tables': {}}
+        for model, level in TABLES:
+            manifest['tables'][_label(model)] = {
+                'level': level, 'columns': _columns(model), 'files': [], 'rows': 0, 'last_pk': None, 'done': False,
+            }
+        _write_json(manifest_path, manifest)
+
+    lock = threading.Lock()
+
+    def export_table(model):
+        label = _label(model)
+        with lock:
+            table = dict(manifest['tables'][label])
+        columns = table['columns']
+
+        while not table['done']:
+            # the next chunk's rows, straight off the primary key index
+            rows = model._base_manager.order_by('pk')
+            if table['last_pk'] is not None:
+                rows = rows.filter(pk__gt=table['last_pk'])
+            rows = rows.values_list(*columns)[:chunk_rows]
+
+            name = f"{label}.{len(table['files']):05d}.ndjson"
+            count, last_pk = 0, None
+            with open(os.path.join(path, name + '.tmp'), 'w') as f:
+                for row in rows.iterator(chunk_size=batch_size):
+                    values = dict(zip(columns, row))
+                    f.write(json.dumps(values, cls=_Encoder, separators=(',', ':')) + '\n')
+                    count, last_pk = count + 1, values[model._meta.pk.attname]
+
+            if count:
+                os.replace(os.path.join(path, name + '.tmp'), os.path.join(path, name))
+                table['files'] = table['files'] + [name]
+                table['rows'] += count
+                table['last_pk'] = last_pk
+            else:
+                os.remove(os.path.join(path, name + '.tmp'))
+            table['done'] = count < chunk_rows
+
+            with lock:
+                manifest['tables'][label] = table
+                _write_json(manifest_path, manifest)
+            log(f"exported {table['rows']} rows of {label}")
+
+    if _snapshot_blocks_writers():
+        log("SQLite isn't in WAL mode, so each chunk is exported as of when it's read; "
+            "export from a quiet database, or switch it to journal_mode=wal")
+        _run_levels(export_table, workers)
+        return {label: table['rows'] for label, table in manifest['tables'].items()}
+
+    with _snapshot() as snapshot:
+        def export_in_snapshot(model):
+            # worker threads have their own connections, outside the caller's transaction
+            if connection.in_atomic_block:
+                export_table(model)
+            else:
+                with _snapshot(join=snapshot):
+                    export_table(model)
+
+        _run_levels(export_in_snapshot, workers)
+    return {label: table['rows'] for label, table in manifest['tables'].items()}
+
+
+# auto_now fields would stamp every imported row with the time of the import
+@contextmanager
+def _keeping_timestamps():
+    '''Turn off auto_now/auto_now_add on the exported models while imported rows are saved'''
+    fields = [
+        field for model, _ in TABLES for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _row_object(model, fields, values):
+    '''Return an unsaved model instance for one exported row, fields being {column: model field}'''
+    return model(**{
+        column: fields[column].to_python(value) if value is not None else None
+        for column, value in values.items()
+    })
+
+
+def _write_batch(model, batch, skip_existing=False):
+    '''bulk_create a batch of rows in one transaction. After a resume, rows the last
+    run wrote just before it stopped (but hadn't checkpointed) are skipped.'''
+    with transaction.atomic():
+        if skip_existing:
+            existing = set(model._base_manager.filter(pk__in=[obj.pk for obj in batch]).values_list('pk', flat=True))
+            batch = [obj for obj in batch if obj.pk not in existing]
+        model._base_manager.bulk_create(batch)
+
+
+def import_data(path, batch_size=2000, workers=1, resume=False, checkpoint=None, log=None):
+    '''Load an export written by export_data() from the directory path into this
+    (empty) database, then rebuild what's derived from it. Returns {"app.model": rows imported}.
+
+    checkpoint is the file progress is saved to (by default, one in path).
+    log, if given, is called with a line of progress after each chunk.'''
+    log = log or (lambda message: None)
+    manifest = _read_json(os.path.join(path, MANIFEST))
+    if manifest.get('format') != FORMAT_VERSION:
+        raise ValueError(f"{path} isn't an export this version can read")
+    unfinished = [label for label, table in manifest['tables'].items() if not table['done']]
+    if unfinished:
+        raise ValueError(f"the export in {path} didn't finish ({', '.join(unfinished)}); resume it first")
+
+    checkpoint = checkpoint or os.path.join(path, IMPORT_CHECKPOINT)
+    if resume and os.path.exists(checkpoint):
+        progress = _read_json(checkpoint)
+    else:
+        occupied = [_label(model) for model, _ in TABLES if model._base_manager.exists()]
+        if occupied:
+            raise ValueError(f"the database already has {', '.join(occupied)} rows; import into an empty one")
+        progress = {}
+        # so a run interrupted before its first checkpoint can still be resumed
+        _write_json(checkpoint, progress)
+
+    lock = threading.Lock()
+
+    def save_progress(label, state):
+        with lock:
+            progress[label] = state
+            _write_json(checkpoint, progress)
+
+    def import_table(model):
+        label = _label(model)
+        table = manifest['tables'][label]
+        fields = {column: model._meta.get_field(column) for column in table['columns']}
+        with lock:
+            state = dict(progress.get(label, {'file': 0, 'line': 0, 'rows': 0}))
+        # on a resume, the batch after the table's last checkpoint (or its first batch,
+        # if it never got one) may have been written already
+        skip_existing = resume
+
+        for index in range(state['file'], len(table['files'])):
+            batch = []
+            with open(os.path.join(path, table['files'][index])) as f:
+                for number, line in enumerate(f, 1):
+                    if number <= state['line']:
+                        continue
+                    batch.append(_row_object(model, fields, json.loads(line)))
+                    if len(batch) >= batch_size:
+                        _write_batch(model, batch, skip_existing)
+                        skip_existing = False
+                        state = {'file': index, 'line': number, 'rows': state['rows'] + len(batch)}
+                        save_progress(label, state)
+                        batch = []
+            if batch:
+                _write_batch(model, batch, skip_existing)
+                skip_existing = False
+                state['rows'] += len(batch)
+            state = {'file': index + 1, 'line': 0, 'rows': state['rows']}
+            save_progress(label, state)
+            log(f"imported {state['rows']} of {table['rows']} rows of {label}")
+
+        # empty tables have nothing to checkpoint above
+        save_progress(label, state)
+
+    with _keeping_timestamps():
+        _run_levels(import_table, workers)
+
+    # the rows kept their pks, so move each table's sequence past them (a no-op on SQLite)
+    statements = connection.ops.sequence_reset_sql(no_style(), [model for model, _ in TABLES])
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+    rebuild_derived(log)
+    return {_label(model): progress[_label(model)]['rows'] for model, _ in TABLES}
+
+
+# bulk_create skips save() and signals, so after loading rows in bulk catch everything derived up
+def rebuild_derived(log=None):
+    '''Bring the counters, trending scores, search index, timelines and directory up to date'''
+    log = log or (lambda message: None)
+    counters.reconcile()
+    log("updated counters")
+    trending.rebuild()
+    log("rebuilt trending scores")
+    directory.invalidate()
+    if search.fts_available():
+        search.rebuild()
+        log("rebuilt search index")
+    if timeline.timeline_enabled():
+        with transaction.atomic():
+            timeline.rebuild()
+        log("rebuilt timelines")
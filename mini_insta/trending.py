@@ -0,0 +1,193 @@
+# File: trending.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/27/2025
+# Description: time-decayed trending scores, updated as posts are liked and commented on
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Comment, Like, Post, TrendingEpoch, TrendingScore
+from .pagination import keyset_page
+
+logger = logging.getLogger('mini_insta.trending')
+
+# a like or comment is worth its weight now, half that one half-life later, and so
+# on. decaying every score all the time would mean rewriting every row, so instead
+# newer engagement is worth *more*: it's weighted by 2**(age of the epoch in
+# half-lives), which ranks posts exactly the same as decaying the old engagement
+# would. a like is one UPDATE of one row, and the trending page reads the scores
+# straight off an index.
+#
+# those weights double every half-life, so renormalize() (run the
+# renormalize_trending command from cron, e.g. daily) moves the epoch up to now,
+# scales every score down to match, and drops the posts that have gone quiet.
+#
+# likes share-lock the epoch while they score, so they never queue behind each
+# other, but renormalize() (which locks it for update) waits for the ones in
+# flight and they wait for it: no amount is ever scaled to an epoch that's moving
+# under it. taking a like back subtracts what it was worth when it was made, not
+# what a like is worth now.
+
+# how much each kind of engagement counts
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+
+# posts whose score has decayed below this drop off the trending table
+MIN_SCORE = 0.01
+
+# rebuild() only looks this many half-lives back; anything older is below MIN_SCORE anyway
+REBUILD_HALF_LIVES = 10
+
+# an epoch this many half-lives old is renormalized on the next like, rather than
+# letting the weights grow until 2**x overflows (at about 1024 half-lives)
+MAX_HALF_LIVES = 64
+
+
+def half_life():
+    '''Return how long engagement takes to lose half its weight'''
+    return timedelta(hours=getattr(settings, 'MINI_INSTA_TRENDING_HALF_LIFE', 6))
+
+
+def _growth(start, now):
+    '''Return what engagement at now is worth relative to engagement at start.
+
+    Only stays finite while the epoch is renormalized regularly; the
+    renormalize_trending command has to run from cron.'''
+    return 2 ** ((now - start) / half_life())
+
+
+# renormalize() and rebuild() lock the row for update, to move it
+def _epoch(lock=False):
+    '''Return the TrendingEpoch (locked for this transaction if lock), creating it the first time'''
+    epochs = TrendingEpoch.objects.order_by('pk')
+    epoch = (epochs.select_for_update() if lock else epochs).first()
+    if epoch is None:
+        epoch = TrendingEpoch.objects.create(start=timezone.now())
+    return epoch
+
+
+# Django has no FOR SHARE, and select_for_update() would make likes wait for each other.
+# SQLite needs neither: a transaction that writes holds the whole database's write lock,
+# and one that read a stale epoch can't start writing (it gets "database is locked")
+def _share_lock(epoch):
+    '''Return epoch (a TrendingEpoch) read again, share-locked for this transaction, where the database has that'''
+    if connections[router.db_for_write(TrendingEpoch)].vendor not in ('postgresql', 'mysql'):
+        return epoch
+    table = TrendingEpoch._meta.db_table
+    return TrendingEpoch.objects.raw(f'SELECT * FROM {table} WHERE id = %s FOR SHARE', [epoch.pk])[0]
+
+
+def _current_epoch(now):
+    '''Return the TrendingEpoch, share-locked, renormalizing first if it's so old the weights are about to overflow'''
+    # looked at unlocked first, so renormalize() never waits on a lock this transaction holds
+    epoch = _epoch()
+    if now - epoch.start > MAX_HALF_LIVES * half_life():
+        logger.warning("trending epoch is from %s; run renormalize_trending from cron", epoch.start)
+        renormalize()
+        epoch = _epoch()
+    return _share_lock(epoch)
+
+
+# add engagement on a post
+def record(post, weight, at=None):
+    '''Add weight worth of engagement made at the time at (by default, now) to post (a Post or its pk)'''
+    post_id = post.pk if isinstance(post, Post) else post
+    with transaction.atomic(savepoint=False):
+        at = at or timezone.now()
+        amount = weight * _growth(_current_epoch(timezone.now()).start, at)
+        scores = TrendingScore.objects.filter(post_id=post_id)
+
+        if not scores.update(score=F('score') + amount):
+            score, created = TrendingScore.objects.get_or_create(post_id=post_id, defaults={'score': amount})
+            if not created:
+                scores.update(score=F('score') + amount)
+
+
+# take engagement back, at what it was worth when it happened
+def take_back(post, weight, *times):
+    '''Subtract weight worth of engagement made at each of times from post (a Post or its pk)'''
+    post_id = post.pk if isinstance(post, Post) else post
+    with transaction.atomic(savepoint=False):
+        start = _current_epoch(timezone.now()).start
+        amount = weight * sum(_growth(start, time) for time in times)
+
+        # rounding can't take a post below nothing
+        TrendingScore.objects.filter(post_id=post_id).update(score=Greatest(F('score') - amount, Value(0.0)))
+
+
+# the like/comment views call these next to the counters, inside the same transaction
+def liked(post, amount=1, at=None):
+    '''Update post's score after it gets amount likes (made at the time at, by default now)'''
+    record(post, LIKE_WEIGHT * amount, at=at)
+
+
+def unliked(post, *liked_at):
+    '''Update post's score after the likes made at the times liked_at are taken back'''
+    take_back(post, LIKE_WEIGHT, *liked_at)
+
+
+def commented(post, at=None):
+    '''Update post's score after it's commented on (at the time at, by default now)'''
+    record(post, COMMENT_WEIGHT, at=at)
+
+
+def uncommented(post, commented_at):
+    '''Update post's score after the comment made at commented_at is deleted'''
+    take_back(post, COMMENT_WEIGHT, commented_at)
+
+
+def renormalize():
+    '''Move the epoch to now, scaling every score down to match, and drop scores below
+    MIN_SCORE. Returns (scores kept, scores dropped).'''
+    with transaction.atomic():
+        epoch = _epoch(lock=True)
+        now = timezone.now()
+        # 2**-x, which only underflows to 0 however long it's been
+        shrink = _growth(now, epoch.start)
+
+        TrendingScore.objects.update(score=F('score') * shrink)
+        dropped, _ = TrendingScore.objects.filter(score__lt=MIN_SCORE).delete()
+
+        epoch.start = now
+        epoch.save(update_fields=['start'])
+
+    return TrendingScore.objects.count(), dropped
+
+
+# start over from the raw likes and comments, for a new install or after seeding
+def rebuild():
+    '''Recompute every score from recent likes and comments, returning how many posts have one'''
+    with transaction.atomic():
+        epoch = _epoch(lock=True)
+        now = timezone.now()
+        since = now - REBUILD_HALF_LIVES * half_life()
+
+        # scores relative to now, which is the new epoch
+        scores = {}
+        for model, weight in ((Like, LIKE_WEIGHT), (Comment, COMMENT_WEIGHT)):
+            recent = model.objects.filter(timestamp__gte=since).values_list('post_id', 'timestamp')
+            for post_id, timestamp in recent.iterator(chunk_size=10000):
+                scores[post_id] = scores.get(post_id, 0) + weight / _growth(timestamp, now)
+
+        TrendingScore.objects.all().delete()
+        TrendingScore.objects.bulk_create(
+            [TrendingScore(post_id=post_id, score=score) for post_id, score in scores.items() if score >= MIN_SCORE],
+            batch_size=5000,
+        )
+
+        epoch.start = now
+        epoch.save(update_fields=['start'])
+
+    return TrendingScore.objects.count()
+
+
+def get_trending_page(viewer=None, cursor=None, per_page=20):
+    '''Return (posts, next_cursor) for a page of the trending posts, highest score first,
+    loaded like the feed (see Post.objects.for_feed())'''
+    posts = Post.objects.for_feed(viewer).filter(trending__score__gt=0).select_related('trending')
+    return keyset_page(posts, cursor=cursor, per_page=per_page, order='-trending__score', tiebreak='trending__post_id')
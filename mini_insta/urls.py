@@ -4,6 +4,7 @@
 
 from django.urls import path
 from .views import *
+from . import api
 
 # generic view for authentication/authorization
 from django.contrib.auth import views as auth_views
@@ -12,6 +13,7 @@ urlpatterns = [
     path('',  ShowAllView.as_view(), name="show_all_profiles"),
     path('profile/<int:pk>', ProfileDetailView.as_view(), name='show_profile'),
     path('post/<int:pk>/', PostDetailView.as_view(), name='show_post'),
+    path('post/<int:pk>/comments', PostCommentsView.as_view(), name='show_post_comments'),
     path('profile/create_post', CreatePostView.as_view(), name='create_post'),
     path('profile/update', UpdateProfileView.as_view(), name='update_profile'),
     path('post/<int:pk>/delete', DeletePostView.as_view(), name='delete_post'),
@@ -19,7 +21,19 @@ urlpatterns = [
     path('profile/<int:pk>/followers', ShowFollowersDetailView.as_view(), name='show_followers'),
     path('profile/<int:pk>/following', ShowFollowingDetailView.as_view(), name='show_following'),
     path('profile/feed', PostFeedListView.as_view(), name="show_feed"),
+    path('profile/feed/page', PostFeedPageView.as_view(), name="show_feed_page"),
     path('profile/search', SearchView.as_view(), name='search'),
+    path('trending', TrendingView.as_view(), name='trending'),
+    path('stats/', InstrumentationStatsView.as_view(), name='instrumentation_stats'),
+
+    # read-only JSON API
+    path('api/feed', api.ApiFeedView.as_view(), name='api_feed'),
+    path('api/posts', api.ApiPostBatchView.as_view(), name='api_posts'),
+    path('api/posts/<int:pk>', api.ApiPostView.as_view(), name='api_post'),
+    path('api/profiles/<int:pk>', api.ApiProfileView.as_view(), name='api_profile'),
+    path('api/profiles/<int:pk>/followers', api.ApiFollowersView.as_view(), name='api_followers'),
+    path('api/profiles/<int:pk>/following', api.ApiFollowingView.as_view(), name='api_following'),
+    path('api/suggestions', api.ApiSuggestionsView.as_view(), name='api_suggestions'),
 
     # authorization-realted URLS:
     path('login/', auth_views.LoginView.as_view(template_name='mini_insta/login.html'), name='login'),
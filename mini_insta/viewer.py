@@ -0,0 +1,93 @@
+# File: viewer.py
+# Author: Anna LaPrade (alaprade@bu.edu), 11/16/2025
+# Description: the logged-in viewer's profile and relationship state, resolved once per request
+
+from django.http import Http404
+from django.utils.functional import cached_property
+
+from . import graph, likebuffer
+from .models import Follower, Like, Profile
+
+
+class ViewerContext:
+    '''Who is looking at the page, and which posts/profiles they've liked/followed.
+
+    The relationship questions are answered for a whole list of ids in one query
+    and remembered for the rest of the request.'''
+
+    def __init__(self, user):
+        self.user = user
+        self._liked = {}      # post id -> liked by the viewer?
+        self._following = {}  # profile id -> followed by the viewer?
+
+    # the viewer's Profile, looked up the first time something asks for it
+    @cached_property
+    def profile(self):
+        '''Return the logged-in user's Profile, or None for guests and profile-less users (admins)'''
+        if not self.user.is_authenticated:
+            return None
+        return Profile.objects.filter(user=self.user).first()
+
+    # for views that can't do anything without a profile
+    def require_profile(self):
+        '''Return the viewer's Profile, raising Http404 if they don't have one'''
+        if self.profile is None:
+            raise Http404("Profile not found.")
+        return self.profile
+
+    # fill in the answers we don't know yet with one query
+    def _lookup(self, known, ids, queryset, column):
+        '''Return the subset of ids for which queryset has a row, querying only unknown ids'''
+        ids = [pk for pk in ids if pk is not None]
+        if self.profile is None:
+            return set()
+
+        missing = [pk for pk in ids if pk not in known]
+        if missing:
+            found = set(queryset.filter(**{f'{column}__in': missing}).values_list(column, flat=True))
+            for pk in missing:
+                known[pk] = pk in found
+
+        return {pk for pk in ids if known[pk]}
+
+    def liked_post_ids(self, post_ids):
+        '''Return the set of these post ids that the viewer has liked'''
+        liked = self._lookup(self._liked, post_ids, Like.objects.filter(profile=self.profile), 'post_id')
+
+        # likes and unlikes still waiting in the write-behind buffer win
+        if likebuffer.buffer_enabled() and self.profile is not None:
+            for pk, pending in likebuffer.pending_likes(self.profile.pk, post_ids).items():
+                if pending:
+                    liked.add(pk)
+                else:
+                    liked.discard(pk)
+        return liked
+
+    def following_profile_ids(self, profile_ids):
+        '''Return the set of these profile ids that the viewer follows'''
+        # with the in-memory follow graph on, this doesn't query at all
+        if graph.graph_enabled() and self.profile is not None:
+            follows = graph.get_graph()
+            return {pk for pk in profile_ids if pk is not None and follows.is_following(self.profile.pk, pk)}
+
+        return self._lookup(
+            self._following, profile_ids, Follower.objects.filter(follower_profile=self.profile), 'profile_id',
+        )
+
+    # single-object shortcuts, sharing the same per-request answers
+    def has_liked(self, post):
+        '''Return True if the viewer has liked post'''
+        return post.pk in self.liked_post_ids([post.pk])
+
+    def is_following(self, profile):
+        '''Return True if the viewer follows profile'''
+        return profile.pk in self.following_profile_ids([profile.pk])
+
+
+# views call this rather than reading request.viewer, so they still work without the middleware
+def get_viewer(request):
+    '''Return the ViewerContext for request, creating it if ViewerMiddleware didn't'''
+    viewer = getattr(request, 'viewer', None)
+    if viewer is None:
+        viewer = request.viewer = ViewerContext(request.user)
+    return viewer
@@ -2,16 +2,24 @@
 # Author: Anna LaPrade (alaprade@bu.edu), 09/23/2025
 # Description: the view functions for the pages of the mini_insta app
 
-from django.http import HttpRequest
+from asgiref.sync import sync_to_async
+from django.core.exceptions import PermissionDenied
+from django.http import HttpRequest, JsonResponse
 from django.http.response import HttpResponse as HttpResponse
 from django.shortcuts import render, redirect
+from django.views import View
 from django.views.generic import ListView, DetailView, CreateView, DeleteView, UpdateView, TemplateView
 from.models import *
 from .forms import *
+from . import conditional, counters, directory, fragments, graph, images, instrumentation, likebuffer, reaper, search, timeline, trending
+from .conditional import ConditionalGetMixin
+from .viewer import ViewerContext, get_viewer
+from django.db import transaction
 import random
 from django.db.models import Q
 from django.urls import reverse
 from django.contrib.auth.mixins import LoginRequiredMixin ## for authentication
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.forms import UserCreationForm # for new Users
 from django.contrib.auth.models import User # the Django user model 
 from django.contrib.auth import login
@@ -22,21 +30,43 @@ from django.shortcuts import get_object_or_404
 # Create your views here.
 
 # ShowAllView - a view to display all of the mini_insta profile
-class ShowAllView(ListView):
-    '''Deine a view class to show all mini_insta profiles'''
-
-    # model type
-    model = Profile
+class ShowAllView(ConditionalGetMixin, TemplateView):
+    '''Deine a view class to show all mini_insta profiles, a page at a time'''
 
     # html template
     template_name = "mini_insta/show_all_profiles.html"
 
-    # context
-    context_object_name = "profiles"
+    # most queries a request should need, checked by InstrumentationMiddleware
+    query_budget = 5
+
+    # which page: ?sort=name|newest, ?letter= to jump to a letter, ?cursor= for the next page
+    def get_directory_params(self):
+        '''Return the (sort, cursor, letter) asked for, ignoring anything invalid'''
+        sort = self.request.GET.get('sort', directory.DEFAULT_SORT)
+        if sort not in directory.SORTS:
+            sort = directory.DEFAULT_SORT
+        letter = self.request.GET.get('letter', '').lower()
+        if sort != 'name' or len(letter) != 1 or letter not in directory.LETTERS:
+            letter = None
+        return sort, self.request.GET.get('cursor') or None, letter
+
+    # validators for conditional GET, so reloads of an unchanged page get a 304
+    def get_validators(self):
+        return conditional.directory_validators(self.get_directory_params())
+
+    # the page comes from the directory cache, so usually no queries at all
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        sort, cursor, letter = self.get_directory_params()
+        context['directory'] = directory.render_page(sort, cursor, letter)
+        context['sort'] = sort
+        context['letter'] = letter
+        context['letters'] = directory.LETTERS
+        return context
 
 
 # ProfileDetailView - a view to display one profile with all details 
-class ProfileDetailView(DetailView):
+class ProfileDetailView(ConditionalGetMixin, DetailView):
     '''display a single article'''
 
     # model type
@@ -48,32 +78,30 @@ class ProfileDetailView(DetailView):
     # context
     context_object_name = "profile" 
 
+    # most queries a request should need, checked by InstrumentationMiddleware
+    query_budget = 11
+
+    # validators for conditional GET, so reloads of an unchanged page get a 304
+    def get_validators(self):
+        return conditional.profile_validators(self.kwargs['pk'], self.request.user)
+
     # changed this up to faciliate the logged in profile/whether or not they're following the profile they're viewing 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        if self.request.user.is_authenticated:
-            try:
-                # logged in suer as a varible + are they follwoing the profile they're viewing
-                logged_in_profile = Profile.objects.filter(user=self.request.user).first()
-                context['logged_in_profile'] = logged_in_profile
-                context['is_following'] = Follower.objects.filter(
-                    profile=self.object,
-                    follower_profile=logged_in_profile
-                ).exists()
-            except Profile.DoesNotExist:
-                # Admin user doesn't have a Profile
-                context['logged_in_profile'] = None
-                context['is_following'] = False
-        else:
-            # guest user stuff 
-            context['logged_in_profile'] = None
-            context['is_following'] = False
+
+        # logged in user (None for guests and admins without a Profile) + are they following this profile
+        viewer = get_viewer(self.request)
+        context['logged_in_profile'] = viewer.profile
+        context['is_following'] = viewer.is_following(self.object)
+
+        # posts for the grid, with their photos loaded in bulk
+        context['posts'] = self.object.get_all_posts().for_feed(viewer.profile)
 
         return context
 
 
 # PostDetailView - a view to display one post with all details 
-class PostDetailView(DetailView):
+class PostDetailView(ConditionalGetMixin, DetailView):
     '''A view to show the details of a single Post'''
 
     # model type
@@ -85,6 +113,27 @@ class PostDetailView(DetailView):
     # context
     context_object_name = "post" 
 
+    # most queries a request should need, checked by InstrumentationMiddleware
+    query_budget = 11
+
+    # comments shown per page
+    comments_per_page = 20
+
+    # validators for conditional GET, so reloads of an unchanged page get a 304
+    def get_validators(self):
+        validators = conditional.post_validators(self.kwargs['pk'])
+        if validators is None:
+            return None
+
+        # each page of comments is its own page
+        parts, last_modified = validators
+        return (parts, self.request.GET.get('comments')), last_modified
+
+    # load the photos and like state with the post instead of one query each
+    def get_queryset(self):
+        '''Return Posts with everything the detail page shows loaded in bulk'''
+        return Post.objects.for_feed(get_viewer(self.request).profile, comments=False)
+
     # get context data for template use
     def get_context_data(self, **kwargs):
         '''return the dicitionary of context varaibles for use in the template'''
@@ -94,29 +143,52 @@ class PostDetailView(DetailView):
 
         context['comment_form'] = CreateCommentForm()
     
-        # add the profile into the context dictionary 
-        if self.request.user.is_authenticated:
-            profile = Profile.objects.filter(user=self.request.user).first()
-            context['profile'] = profile
-        else:
-            context['profile'] = None
-
-        # logged in suer as a varible + did they like the post they're viewing 
-        if self.request.user.is_authenticated:
-            logged_in_profile = Profile.objects.filter(user=self.request.user).first()
-            context['logged_in_profile'] = logged_in_profile
-
-            # true if this user already liked the post
-            context['has_liked'] = Like.objects.filter(
-                post=self.object,
-                profile=logged_in_profile
-            ).exists()
-        else:
-            # guest info
-            context['logged_in_profile'] = None
-            context['has_liked'] = False
+        # add the logged in profile (None for guests) into the context dictionary 
+        viewer = get_viewer(self.request)
+        context['profile'] = viewer.profile
+        context['logged_in_profile'] = viewer.profile
+
+        # true if this user already liked the post (or has a like waiting to be written)
+        likebuffer.overlay([self.object], viewer.profile)
+        context['has_liked'] = self.object.liked_by_viewer
+
+        # one page of comments, newest first, starting after ?comments= if it's there
+        context['comment_cursor'] = self.request.GET.get('comments')
+        context['comments'], context['next_comment_cursor'] = self.object.get_comments_page(
+            context['comment_cursor'], self.comments_per_page,
+        )
 
         return context
+
+
+# PostCommentsView - the next page of a post's comments, for the "older comments" link
+class PostCommentsView(ListView):
+    '''Render one page of a post's comments without the surrounding page'''
+
+    template_name = "mini_insta/comment_page.html"
+    context_object_name = "comments"
+
+    # comments rendered per page, the same as the post page
+    page_size = PostDetailView.comments_per_page
+
+    # most queries a request should need, checked by InstrumentationMiddleware
+    query_budget = 5
+
+    def get_queryset(self):
+        '''get the page of comments after the cursor'''
+        self.post = get_object_or_404(Post.objects.only('pk'), pk=self.kwargs['pk'])
+        comments, self.next_comment_cursor = self.post.get_comments_page(
+            self.request.GET.get('comments'), self.page_size,
+        )
+        return comments
+
+    # the post, for the next page's link
+    def get_context_data(self, **kwargs):
+        '''return the dicitionary of context varaibles for use in the template'''
+        context = super().get_context_data(**kwargs)
+        context['post'] = self.post
+        context['next_comment_cursor'] = self.next_comment_cursor
+        return context
     
 # update view for Profiles
 class UpdateProfileView(LoginRequiredMixin, UpdateView):
@@ -203,7 +275,7 @@ class CreatePostView(LoginRequiredMixin, CreateView):
 
         # create and return a URL:
         #return reverse('show_all')
-        profile_pk = Profile.objects.get(user=self.request.user).pk
+        profile_pk = get_viewer(self.request).require_profile().pk
         return reverse('show_profile', kwargs={'pk': profile_pk})
     
     # get context data for template use
@@ -214,11 +286,7 @@ class CreatePostView(LoginRequiredMixin, CreateView):
         context = super().get_context_data(**kwargs)
 
         # add the profile into the context dictionary 
-        if self.request.user.is_authenticated:
-            profile = Profile.objects.filter(user=self.request.user).first()
-            context['profile'] = profile
-        else:
-            context['profile'] = None
+        context['profile'] = get_viewer(self.request).profile
 
         return context
     
@@ -231,7 +299,7 @@ class CreatePostView(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         '''This method handles the form submission and saves the new objects to the Django datatabse'''
 
-        profile = Profile.objects.get(user=self.request.user)
+        profile = get_viewer(self.request).require_profile()
 
         # attach FK relations
         form.instance.profile = profile
@@ -243,7 +311,13 @@ class CreatePostView(LoginRequiredMixin, CreateView):
         # handle uploaded image files
         files = self.request.FILES.getlist('image_files')  # 'image_files' = input name
         for f in files:
-            Photo.objects.create(post=self.object, image_file=f)
+            photo = Photo.objects.create(post=self.object, image_file=f)
+
+            # downscaled copies are made in the background, the original is shown until then
+            images.schedule(photo)
+
+        # copy the new post into followers' feeds
+        timeline.fan_out_post(self.object)
 
         return response
 
@@ -263,8 +337,8 @@ class DeletePostView(LoginRequiredMixin, DeleteView):
         # calling the superclass method
         context = super().get_context_data(**kwargs)
         
-        # find and add profile to the context data
-        post = self.get_object()
+        # find and add profile to the context data (get() already loaded the post)
+        post = self.object
         profile = post.profile
 
         # add the profile into the context dictionary 
@@ -283,17 +357,16 @@ class DeletePostView(LoginRequiredMixin, DeleteView):
     def get_success_url(self):
         '''Return the URL to redirect to after a sucessful delete'''
 
-        # find the PK for this Comment
-        pk = self.kwargs['pk']
+        # back to the profile the post was on, which we already loaded
+        return reverse('show_profile', kwargs={'pk': self.object.profile_id})
 
-        # find the Comment Object
-        post = Post.objects.get(pk=pk)
+    # hide the post now, the reaper removes it and its likes, comments and photos later
+    def form_valid(self, form):
+        '''soft delete the post and redirect'''
+        success_url = self.get_success_url()
+        reaper.delete_post(self.object)
+        return redirect(success_url)
 
-        # find pk of the article to which this comment is associated
-        profile = post.profile
-
-        return reverse('show_profile', kwargs={'pk':profile.pk})
-    
 
 
 # UpdateView for Posts
@@ -318,44 +391,80 @@ class UpdatePostView(LoginRequiredMixin, UpdateView):
         pk = self.kwargs['pk']
 
         return reverse('show_post', kwargs={'pk':pk})
+
+    # saving changes the post's timestamp, so keep the feeds in step
+    def form_valid(self, form):
+        '''Save the Post and update its feed entries'''
+        response = super().form_valid(form)
+        timeline.refresh_post(self.object)
+        fragments.bump_version(self.object)
+        return response
     
 
 # ShowFollowersDetailView - a view to display all the details of the follower list 
-class ShowFollowersDetailView(DetailView):
+class ShowFollowersDetailView(ConditionalGetMixin, DetailView):
     '''A view to show the followers of a single Profile.'''
 
     model = Profile
     template_name = "mini_insta/show_followers.html"
     context_object_name = "profile"
 
+    # number of profiles shown per page
+    page_size = 50
+
+    # most queries a request should need, checked by InstrumentationMiddleware
+    query_budget = 8
+
+    # validators for conditional GET, so reloads of an unchanged page get a 304
+    def get_validators(self):
+        return conditional.follow_list_validators(
+            self.kwargs['pk'], 'profile', self.request.user, self.request.GET.get('cursor'),
+        )
+
     def get_context_data(self, **kwargs):
         '''Return the dictionary of context variables for use in the template.'''
         # get the profiles
         context = super().get_context_data(**kwargs)
         profile = self.object
 
-        # list of follower Profiles
-        context["followers"] = profile.get_followers()
+        # one page of follower Profiles, with the viewer's follow state and mutual follows
+        context["followers"], context["next_cursor"] = profile.get_followers_page(
+            get_viewer(self.request).profile, self.request.GET.get('cursor'), self.page_size,
+        )
 
         return context
     
 
 # ShowFollowingDetailView - a view to display all the details of the following list 
-class ShowFollowingDetailView(DetailView):
+class ShowFollowingDetailView(ConditionalGetMixin, DetailView):
     '''A view to show the users followed by a single Profile.'''
 
     model = Profile
     template_name = "mini_insta/show_following.html"
     context_object_name = "profile"
 
+    # number of profiles shown per page
+    page_size = 50
+
+    # most queries a request should need, checked by InstrumentationMiddleware
+    query_budget = 8
+
+    # validators for conditional GET, so reloads of an unchanged page get a 304
+    def get_validators(self):
+        return conditional.follow_list_validators(
+            self.kwargs['pk'], 'follower_profile', self.request.user, self.request.GET.get('cursor'),
+        )
+
     def get_context_data(self, **kwargs):
         '''Return the dictionary of context variables for use in the template.'''
         # get the profiles
         context = super().get_context_data(**kwargs)
         profile = self.object
 
-        # list of Profiles being followed
-        context["following"] = profile.get_following()
+        # one page of followed Profiles, with the viewer's follow state and mutual follows
+        context["following"], context["next_cursor"] = profile.get_following_page(
+            get_viewer(self.request).profile, self.request.GET.get('cursor'), self.page_size,
+        )
 
         return context
     
@@ -379,18 +488,71 @@ class PostFeedListView(LoginRequiredMixin, ListView):
 
         return reverse('login')
 
+    # number of posts rendered per page of the feed
+    page_size = 20
+
+    # most queries a request should need, checked by InstrumentationMiddleware
+    query_budget = 8
+
     def get_queryset(self):
-        ''' get the feed for the user'''
-        profile = Profile.objects.get(user=self.request.user)
-        posts = list(profile.get_post_feed())  # force evaluation to a list
+        ''' get one page of the feed for the user'''
+        profile = get_viewer(self.request).require_profile()
+
+        # only one page at a time, starting after the cursor if there is one
+        posts, self.next_cursor = timeline.get_feed_page(
+            profile,
+            cursor=self.request.GET.get('cursor'),
+            per_page=self.page_size,
+        )
+        return likebuffer.overlay(posts, profile)
 
-        # go over posts, see if liked by user
-        for post in posts:
-            post.liked_by_user = post.get_all_likes().filter(profile__user=self.request.user).exists()
-        
-        return posts
+    # add the cursor for the next page
+    def get_context_data(self, **kwargs):
+        '''return the dicitionary of context varaibles for use in the template'''
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        return context
+
+
+# PostFeedPageView - just the post cards for the next page of the feed, for infinite scroll
+class PostFeedPageView(PostFeedListView):
+    '''Render one page of feed post cards without the surrounding page'''
+
+    # html fragment template
+    template_name = "mini_insta/feed_page.html"
     
 
+# TrendingView - the posts with the most likes and comments lately
+class TrendingView(ListView):
+    '''Show a page of trending posts, read straight from the trending scores'''
+
+    template_name = "mini_insta/show_trending.html"
+    context_object_name = "posts"
+
+    # number of posts rendered per page
+    page_size = 20
+
+    # most queries a request should need, checked by InstrumentationMiddleware
+    query_budget = 6
+
+    def get_queryset(self):
+        '''get one page of trending posts'''
+        profile = get_viewer(self.request).profile
+        posts, self.next_cursor = trending.get_trending_page(
+            profile,
+            cursor=self.request.GET.get('cursor'),
+            per_page=self.page_size,
+        )
+        return likebuffer.overlay(posts, profile)
+
+    # add the cursor for the next page
+    def get_context_data(self, **kwargs):
+        '''return the dicitionary of context varaibles for use in the template'''
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        return context
+
+
 # SearchView - a view to get the search form or search results
 class SearchView(LoginRequiredMixin, ListView):
     ''' Facilitates searching '''
@@ -405,10 +567,14 @@ class SearchView(LoginRequiredMixin, ListView):
     # which template do we dispatch?
     def dispatch(self, request, *args, **kwargs):
         ''' dispatch proper template '''
-        try:
-            self.profile = Profile.objects.get(user=request.user)
+        # guests go to the login page
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+
+        self.profile = get_viewer(request).profile
+
         # just in case there's no profile for some reason
-        except Profile.DoesNotExist:
+        if self.profile is None:
             return render(request, "mini_insta/search.html", {"error": "Profile not found."})
         
         # get the query
@@ -421,106 +587,219 @@ class SearchView(LoginRequiredMixin, ListView):
         return super().dispatch(request, *args, **kwargs)
     
 
+    # number of posts and profiles shown per page of results
+    page_size = 20
+
+    # most queries a request should need, checked by InstrumentationMiddleware
+    query_budget = 10
+
+    # which page of results we're on, page 1 if it's missing or garbage
+    def get_page_number(self):
+        '''Return the requested page number'''
+        try:
+            return max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            return 1
+
     # get the posts with matching captions
     def get_queryset(self):
-        '''Return posts whose caption contains the search query'''
-        return Post.objects.filter(caption__icontains=self.query)
+        '''Return one page of posts whose caption matches the search query, best match first'''
+        posts, self.has_more_posts = search.search_posts(
+            self.query, self.profile, page=self.get_page_number(), per_page=self.page_size,
+        )
+        return posts
     
 
     # query stuff 
     def get_context_data(self, **kwargs):
         ''' get the proper query'''
         context = super().get_context_data(**kwargs)
-        if self.request.user.is_authenticated:
-            profile = Profile.objects.filter(user=self.request.user).first()
-            context['profile'] = profile
-        else:
-            context['profile'] = None
+        context['profile'] = self.profile
         context['query'] = self.query
 
-        context['matching_profiles'] = Profile.objects.filter(
-            # complex query (in the django documentation)
-            Q(username__icontains=self.query) |
-            Q(display_name__icontains=self.query) |
-            Q(bio_text__icontains=self.query)
+        page = self.get_page_number()
+        context['matching_profiles'], has_more_profiles = search.search_profiles(
+            self.query, page=page, per_page=self.page_size,
         )
 
+        # links to the neighbouring pages of results
+        context['previous_page'] = page - 1 if page > 1 else None
+        context['next_page'] = page + 1 if self.has_more_posts or has_more_profiles else None
+
         return context
     
    
+# the like/follow toggles answer fetch() calls with JSON and plain form posts with a redirect
+def wants_json(request):
+    '''Return True if the request came from the in-page JavaScript rather than a plain form'''
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+# ToggleView - base for the async views that change one like or follow
+class ToggleView(View):
+    '''Do one write and report the new state: JSON for JavaScript, a redirect for everyone else.
+
+    Subclasses define toggle(viewer, pk), which runs in a worker thread (the ORM is
+    synchronous) and returns the new state as a dict, and get_redirect_url(state).'''
+
+    # writes only happen on POST
+    http_method_names = ['post']
+
+    async def post(self, request, pk):
+        user = await request.auser()
+        if not user.is_authenticated:
+            if wants_json(request):
+                return JsonResponse({'error': "Authentication required."}, status=401)
+            return redirect_to_login(request.get_full_path(), reverse('login'))
+
+        state = await sync_to_async(self.toggle)(ViewerContext(user), pk)
+
+        if wants_json(request):
+            return JsonResponse(state)
+        return redirect(self.get_redirect_url(state))
+
+
 # allow following
-class FollowView(LoginRequiredMixin, TemplateView):
+class FollowView(ToggleView):
     '''Facillitates following of a mini-insta profile'''
 
-    def dispatch(self, request, *args, **kwargs):
-        '''chooses how things get posted '''
-        logged_in_profile = Profile.objects.filter(user=self.request.user).first()
-        target_profile = get_object_or_404(Profile, pk=kwargs['pk'])
+    def toggle(self, viewer, pk):
+        '''follow the profile, returning the new follow state'''
+        logged_in_profile = viewer.require_profile()
+        target_profile = get_object_or_404(Profile, pk=pk)
 
         # if has already followed before, dont creat a new relation
         if logged_in_profile != target_profile:
-            Follower.objects.get_or_create(
-                profile=target_profile,             # the one being followed
-                follower_profile=logged_in_profile  # the one following
-            )
+            with transaction.atomic():
+                follower, created = Follower.objects.get_or_create(
+                    profile=target_profile,             # the one being followed
+                    follower_profile=logged_in_profile  # the one following
+                )
 
-        # using redirect because we're not really using a real form
-        return redirect('show_profile', pk=target_profile.pk)
+                # update the counts and bring their recent posts into our feed
+                if created:
+                    counters.followed(logged_in_profile, target_profile)
+                    timeline.backfill(logged_in_profile, target_profile)
+                    graph.followed(logged_in_profile, target_profile)
+
+        return {
+            'profile': target_profile.pk,
+            'following': logged_in_profile != target_profile,
+            'follower_count': target_profile.follower_count,
+        }
+
+    def get_redirect_url(self, state):
+        return reverse('show_profile', kwargs={'pk': state['profile']})
 
 
 # allow unfollowing   
-class DeleteFollowView(LoginRequiredMixin, TemplateView):
+class DeleteFollowView(ToggleView):
     '''Facillitates un following of a mini-insta profile'''
 
-    def dispatch(self, request, *args, **kwargs):
-        '''chooses how things get posted '''
-        logged_in_profile = Profile.objects.filter(user=self.request.user).first()
-        target_profile = get_object_or_404(Profile, pk=kwargs['pk'])
+    def toggle(self, viewer, pk):
+        '''unfollow the profile, returning the new follow state'''
+        logged_in_profile = viewer.require_profile()
+        target_profile = get_object_or_404(Profile, pk=pk)
 
         # delete it 
-        Follower.objects.filter(
-            profile=target_profile,
-            follower_profile=logged_in_profile
-        ).delete()
-
-        # using redirect because we're not really using a real form
-        next_url = request.POST.get('next', reverse('show_profile', kwargs={'pk': target_profile.pk}))
-        return redirect(next_url)
+        with transaction.atomic():
+            deleted, _ = Follower.objects.filter(
+                profile=target_profile,
+                follower_profile=logged_in_profile
+            ).delete()
+
+            # update the counts and take their posts back out of our feed
+            if deleted:
+                counters.followed(logged_in_profile, target_profile, -1)
+                timeline.remove(logged_in_profile, target_profile)
+                timeline.lost_follower(target_profile)
+                graph.unfollowed(logged_in_profile, target_profile)
+
+        return {
+            'profile': target_profile.pk,
+            'following': False,
+            'follower_count': target_profile.follower_count,
+        }
+
+    def get_redirect_url(self, state):
+        return self.request.POST.get('next', reverse('show_profile', kwargs={'pk': state['profile']}))
     
 
 
-class LikeView(LoginRequiredMixin, TemplateView):
+# the like views report who liked the post last, for the "Liked by" summary
+def like_state(post, liked):
+    '''Return the JSON state of post after a like or unlike'''
+    latest_liker = Like.objects.filter(post=post, profile__deleted_at__isnull=True).order_by('-timestamp').values_list(
+        'profile__username', flat=True,
+    ).first()
+    return {'post': post.pk, 'liked': liked, 'like_count': post.like_count, 'latest_liker': latest_liker}
+
+
+# with the write-behind buffer on, the like views only record what the viewer wants
+def buffer_like(post, profile, liked):
+    '''Buffer profile's like (or unlike) of post, returning the state as the viewer will see it once it's written'''
+    likebuffer.add(post.pk, profile.pk, liked)
+
+    # their own like shows up in the count straight away, everyone else's after the flush
+    already_liked = Like.objects.filter(post=post, profile=profile).exists()
+    state = like_state(post, liked)
+    state['like_count'] += liked - already_liked
+    if liked and not already_liked:
+        state['latest_liker'] = profile.username
+    return state
+
+
+class LikeView(ToggleView):
     '''Facillitates liking of a mini-insta post'''
 
-    def dispatch(self, request, *args, **kwargs):
-        '''chooses how things get posted '''
-        logged_in_profile = Profile.objects.filter(user=self.request.user).first()
-        post = get_object_or_404(Post, pk=kwargs['pk'])
+    def toggle(self, viewer, pk):
+        '''like the post, returning its new like state'''
+        logged_in_profile = viewer.require_profile()
+        post = get_object_or_404(Post, pk=pk)
+
+        if post.profile != logged_in_profile and likebuffer.buffer_enabled():
+            return buffer_like(post, logged_in_profile, True)
 
         # if has already liked before, dont creat a new relation
         if post.profile != logged_in_profile:
-            Like.objects.get_or_create(post=post, profile=logged_in_profile)
+            with transaction.atomic():
+                like, created = Like.objects.get_or_create(post=post, profile=logged_in_profile)
+                if created:
+                    counters.liked(post)
+                    trending.liked(post, at=like.timestamp)
+                    fragments.bump_version(post)
+
+        return like_state(post, post.profile != logged_in_profile)
 
-        # using redirect because we're not really using a real form
-        next_url = request.POST.get('next', reverse('show_post', kwargs={'pk': post.pk}))
-        return redirect(next_url)
+    def get_redirect_url(self, state):
+        return self.request.POST.get('next', reverse('show_post', kwargs={'pk': state['post']}))
     
 
 
-class DeleteLikeView(LoginRequiredMixin, TemplateView):
+class DeleteLikeView(ToggleView):
     '''Facillitates unliking of a mini-insta post'''
 
-    def dispatch(self, request, *args, **kwargs):
-        '''chooses how things get posted '''
-        logged_in_profile = Profile.objects.filter(user=self.request.user).first()
-        post = get_object_or_404(Post, pk=kwargs['pk'])
+    def toggle(self, viewer, pk):
+        '''unlike the post, returning its new like state'''
+        logged_in_profile = viewer.require_profile()
+        post = get_object_or_404(Post, pk=pk)
+
+        if likebuffer.buffer_enabled():
+            return buffer_like(post, logged_in_profile, False)
 
-        # delete it
-        Like.objects.filter(post=post, profile=logged_in_profile).delete()
+        # delete it, taking back what the like added to the post's trending score
+        with transaction.atomic():
+            like = Like.objects.filter(post=post, profile=logged_in_profile).first()
+            deleted, _ = Like.objects.filter(pk=like.pk).delete() if like else (0, None)
+            if deleted:
+                counters.liked(post, -1)
+                trending.unliked(post, like.timestamp)
+                fragments.bump_version(post)
 
-        # using redirect because we're not really using a real form
-        next_url = request.POST.get('next', reverse('show_post', kwargs={'pk': post.pk}))
-        return redirect(next_url)
+        return like_state(post, False)
+
+    def get_redirect_url(self, state):
+        return self.request.POST.get('next', reverse('show_post', kwargs={'pk': state['post']}))
 
 
 class CreateCommentView(LoginRequiredMixin, CreateView):
@@ -530,10 +809,14 @@ class CreateCommentView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         post = get_object_or_404(Post, pk=self.kwargs['pk'])
-        profile = Profile.objects.get(user=self.request.user)
+        profile = get_viewer(self.request).require_profile()
         form.instance.post = post
         form.instance.profile = profile
-        form.save()
+        with transaction.atomic():
+            form.save()
+            counters.commented(post)
+            trending.commented(post, at=form.instance.timestamp)
+            fragments.bump_version(post)
         return redirect('show_post', pk=post.pk)
 
     def get_login_url(self):
@@ -554,4 +837,28 @@ class DeleteCommentView(LoginRequiredMixin, DeleteView):
         post = comment.post
         return reverse('show_post', kwargs={'pk': post.pk})
 
+    # delete the comment and update the post's comment count together
+    def form_valid(self, form):
+        post = self.object.post
+        with transaction.atomic():
+            response = super().form_valid(form)
+            counters.commented(post, -1)
+            trending.uncommented(post, self.object.timestamp)
+            fragments.bump_version(post)
+        return response
+
 
+# InstrumentationStatsView - the per-view query and latency numbers, for staff
+class InstrumentationStatsView(LoginRequiredMixin, View):
+    '''Return what InstrumentationMiddleware has recorded in this process as JSON'''
+
+    def get_login_url(self):
+        return reverse('login')
+
+    def get(self, request):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        stats = instrumentation.snapshot()
+        if likebuffer.buffer_enabled():
+            stats['like_buffer'] = likebuffer.metrics()
+        return JsonResponse(stats)